@@ -0,0 +1,28 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+from core.drain import graceful_drain
+from core.graph_registry import graph_registry
+from core.warmup import warmup
+
+
+router = APIRouter()
+
+@router.get('/live', status_code=status.HTTP_200_OK)
+async def get_live():
+    """O processo está de pé e o event loop responde."""
+    return {"status": "alive"}
+
+
+@router.get('/ready')
+async def get_ready():
+    """
+    200 só depois do warmup (banco e grafos prontos); antes disso 503 para o balanceador esperar.
+    Volta a 503 no desligamento, enquanto os turnos em andamento terminam.
+    """
+    ready = warmup.ready and not graceful_drain.draining
+    body = {"status": "draining" if graceful_drain.draining else "ready" if warmup.ready else "warming_up",
+            "checks": warmup.checks,
+            "graphs_loaded": graph_registry.loaded(),
+            "warmup_seconds": warmup.duration}
+    return JSONResponse(body, status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
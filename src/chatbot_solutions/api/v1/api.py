@@ -1,9 +1,13 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 
-from api.v1.endpoints import chat, submit_tools
+from api.v1.endpoints import chat, submit_tools, jobs, metrics, admin
+from core.deps import require_admin
 
 
 api_router = APIRouter()
 
 api_router.include_router(chat.router, prefix = '/chat', tags=['chat'])
-api_router.include_router(submit_tools.router, prefix = '/submit_tools', tags=['submit_tools'])
\ No newline at end of file
+api_router.include_router(submit_tools.router, prefix = '/submit_tools', tags=['submit_tools'])
+api_router.include_router(jobs.router, prefix = '/jobs', tags=['jobs'])
+api_router.include_router(metrics.router, prefix = '/metrics', tags=['metrics'])
+api_router.include_router(admin.router, prefix = '/admin', tags=['admin'], dependencies=[Depends(require_admin)])
\ No newline at end of file
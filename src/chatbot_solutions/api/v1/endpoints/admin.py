@@ -0,0 +1,52 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+
+from core.admin import ConversationState, list_conversations, release_leases
+from core.configs import settings
+from core.export import stream_ndjson
+from schemas.usuario_schema import (ConversationPageSchema, ConversationSummarySchema, LeaseReleaseRequestSchema,
+                                    LeaseReleaseResponseSchema)
+
+
+router = APIRouter()
+
+@router.get('/conversations', response_model=ConversationPageSchema, response_model_exclude_none=True,
+            status_code=status.HTTP_200_OK)
+async def get_conversations(project: Optional[str] = None,
+                            state: Optional[ConversationState] = None,
+                            after: Optional[int] = Query(None, description='Cursor: next_cursor da página anterior'),
+                            limit: int = Query(settings.ADMIN_PAGE_SIZE, ge=1, le=settings.ADMIN_MAX_PAGE_SIZE),
+                            include_messages: bool = False):
+    """
+    Lista as conversas por projeto e estado (running, stuck, idle) em ordem de id, paginando
+    por keyset: cada página começa depois do último id da anterior, com custo constante mesmo
+    com milhões de protocolos. O histórico (messages) só é lido com include_messages=true.
+    """
+    rows, next_cursor = await list_conversations(project, state, after, limit, include_messages)
+    return ConversationPageSchema(items=[ConversationSummarySchema(**row) for row in rows], next_cursor=next_cursor)
+
+
+@router.get('/conversations/export', response_class=StreamingResponse)
+async def export_conversations(project: Optional[str] = None,
+                               since: Optional[datetime] = Query(None, description='Última atividade (updated_at) a partir de (inclusive)'),
+                               until: Optional[datetime] = Query(None, description='Última atividade (updated_at) antes de (exclusive)')):
+    """
+    Exporta as mensagens das conversas em NDJSON (uma linha por mensagem, na ordem do histórico),
+    em streaming a partir de um cursor no servidor. Mesmo formato de export_conversas.py.
+    """
+    return StreamingResponse(stream_ndjson(project, since, until), media_type='application/x-ndjson')
+
+
+@router.post('/conversations/release-leases', response_model=LeaseReleaseResponseSchema, status_code=status.HTTP_200_OK)
+async def post_release_leases(request: LeaseReleaseRequestSchema):
+    """
+    Libera em lote os leases de conversas presas (processing=True sem lease vigente), filtrando
+    por ids e/ou projeto. Com force=true também libera os leases de turnos em execução.
+    """
+    if request.force and request.ids is None and request.project is None:
+        raise HTTPException(detail='Com force informe ids ou project.', status_code=status.HTTP_400_BAD_REQUEST)
+    released = await release_leases(ids=request.ids, project=request.project, force=request.force)
+    return LeaseReleaseResponseSchema(released=released)
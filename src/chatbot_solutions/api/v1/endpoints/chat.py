@@ -1,124 +1,259 @@
-from typing import List, Optional, Any
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional
 
 from zoneinfo import ZoneInfo
 from datetime import datetime
 
-from fastapi import APIRouter, status, Depends, HTTPException, Response
-from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import JSONResponse
+import anyio
+from fastapi import APIRouter, status, Depends, HTTPException, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from sqlalchemy.exc import IntegrityError
 
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, messages_from_dict, messages_to_dict
+from langchain_core.messages import HumanMessage
 
-from models.usuario_model import UsuarioModel
-from schemas.usuario_schema import MessageRequestSchema, UsuarioSchema, MessageResponseSchema, Contact, Channel
-from core.deps import get_session
-from graphs.graph_yamaha import langgraph_app
-from graphs.help_desk_graph import APP
-from graphs.agent_graph_leads import agent_graph_leads
-from graphs.leads_ia_project.graph import leads_ia_graph
-from webhook_calls import trigger_webhook_message, trigger_webhook_tool_call
+from schemas.usuario_schema import MessageRequestSchema, MessageResponseSchema, Contact, BatchMessageRequestSchema, BatchMessageResponseSchema, BatchItemResponseSchema
+from core.configs import settings
+from core.deps import get_session, check_backpressure, check_rate_limit
+from core.graph_registry import graph_registry
+from core.idempotency import request_key, claim_key, drop_claim, release_key, replay_response, store_response
+from core.bulkheads import bulkheads
+from core.inbox import conversation_key, submit_turn, turn_priority
+from core.jobs import JobStatus
+from core.locks import ConversationLease
+from core.tool_results import ToolResultsPendingError
+from core.turns import (ConversationBusyError, contact_from_db, prepare_pending_turn, run_pending_turn, stream_turn,
+                        upsert_messages, upsert_messages_bulk)
 
 br_tz = ZoneInfo("America/Sao_Paulo")
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-@router.post('', response_model=MessageResponseSchema, status_code=status.HTTP_202_ACCEPTED)
-async def post_chat(usuario: MessageRequestSchema, db: AsyncSession = Depends(get_session)):
+async def _record_message(session: AsyncSession, usuario: MessageRequestSchema):
+    """Grava a mensagem recebida no histórico (criando a conversa se preciso) e devolve a linha da conversa."""
+    input_message = HumanMessage(content=usuario.message,metadata={"timestamp": datetime.now(br_tz).isoformat()})
+
+    # Mesmo com um turno em execução a mensagem é gravada; a caixa de entrada
+    # responde tudo o que estiver pendente no próximo turno
+    usuario_db = await upsert_messages(session, usuario.contact, [input_message])
+    await session.commit()
+    return usuario_db
 
+
+def _validate(usuario: MessageRequestSchema) -> None:
     if not usuario.message:
         raise HTTPException(detail='A mensagem não pode estar em branco.', status_code=status.HTTP_400_BAD_REQUEST)
 
-    messages = []
-    previous_message = []
+    if not graph_registry.has(usuario.contact.project):
+        raise HTTPException(detail='Projeto não encontrado.', status_code=status.HTTP_404_NOT_FOUND)
+
+
+async def _admit(contact: Contact) -> None:
+    """
+    Controle de admissão (backpressure e limite por contato). Só para entregas novas: a reentrega
+    de uma já registrada recebe a resposta gravada sem gastar token nem levar 429.
+    """
+    await check_backpressure(contact.project)
+    check_rate_limit(contact)
+
+
+@router.post('', response_model=MessageResponseSchema, status_code=status.HTTP_202_ACCEPTED)
+async def post_chat(usuario: MessageRequestSchema, db: AsyncSession = Depends(get_session),
+                    idempotency_key: Optional[str] = Header(None, alias='Idempotency-Key')):
+
+    _validate(usuario)
+
+    key = request_key('chat', usuario.contact, idempotency_key or usuario.idempotency_key, usuario.message, usuario.timestamp)
 
     async with db as session:
-        query = select(UsuarioModel).filter(UsuarioModel.phone == usuario.contact.channel.phone,
-                                            UsuarioModel.project == usuario.contact.project,
-                                            UsuarioModel.protocol == usuario.contact.protocol)
-        result = await session.execute(query)
-        usuario_db: UsuarioSchema = result.scalars().unique().one_or_none()
-
-        input_message = HumanMessage(content=usuario.message,metadata={"timestamp": datetime.now(br_tz).isoformat()})
-
-        if not usuario_db:
-            novo_usuario = UsuarioModel(
-                protocol=usuario.contact.protocol,
-                project=usuario.contact.project,
-                nome=usuario.contact.name,
-                document=usuario.contact.document,
-                phone=usuario.contact.channel.phone,
-                email=usuario.contact.channel.email,
-                messages=messages_to_dict([input_message]),
-                processing= True
-            )
-            session.add(novo_usuario)
-            await session.commit()
-            await session.refresh(novo_usuario)
-            usuario_db = novo_usuario
+        if key and not await claim_key(session, key):
+            stored = await replay_response(session, key)
+            if stored is None:
+                raise HTTPException(detail='Mensagem duplicada: a entrega original ainda está sendo registrada.', status_code=status.HTTP_409_CONFLICT)
+            return MessageResponseSchema(**stored)
+        try:
+            await _admit(usuario.contact)
+            usuario_db = await _record_message(session, usuario)
+
+            contato = contact_from_db(usuario_db)
+            job_id, job_status = await submit_turn(contact=contato, webhook_url=usuario.webhook_url,
+                                                   priority=turn_priority(contato.project, usuario.priority))
+        except Exception:
+            # Sem a reserva a reentrega é aceita (inclusive depois de um 429), em vez de receber 409 até o fim do TTL
+            if key:
+                await release_key(session, key)
+            raise
+
+        response = MessageResponseSchema(job_id=job_id, status=job_status.value, contact=contato)
+        if key:
+            await store_response(session, key, response.dict())
+    return response
+
+
+@router.post('/batch', response_model=BatchMessageResponseSchema, status_code=status.HTTP_202_ACCEPTED)
+async def post_chat_batch(batch: BatchMessageRequestSchema, db: AsyncSession = Depends(get_session)):
+    """
+    Recebe mensagens de várias conversas em uma só requisição.
+    As conversas são criadas ou recebem as mensagens em um único INSERT ... ON CONFLICT; itens da mesma
+    conversa entram no mesmo turno. Com wait=True os turnos rodam aqui, limitados por
+    BATCH_MAX_CONCURRENCY; senão cada conversa recebe um job.
+    """
+    if not batch.items:
+        raise HTTPException(detail='O lote não pode estar vazio.', status_code=status.HTTP_400_BAD_REQUEST)
+    if len(batch.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(detail=f'O lote aceita no máximo {settings.BATCH_MAX_ITEMS} mensagens.', status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    results: Dict[int, BatchItemResponseSchema] = {}
+    conversations: Dict[tuple, List[int]] = {}
+    keys: Dict[int, str] = {}
+
+    for index, item in enumerate(batch.items):
+        try:
+            _validate(item)
+        except HTTPException as e:
+            results[index] = BatchItemResponseSchema(index=index, error=e.detail)
+            continue
+        conversations.setdefault(conversation_key(item.contact), []).append(index)
 
+    async with db as session:
+        for indexes in conversations.values():
+            for index in list(indexes):
+                item = batch.items[index]
+                key = request_key('chat/batch', item.contact, item.idempotency_key, item.message, item.timestamp)
+                if key and not await claim_key(session, key):
+                    stored = await replay_response(session, key)
+                    results[index] = (BatchItemResponseSchema(index=index, **stored) if stored
+                                      else BatchItemResponseSchema(index=index, error='Mensagem duplicada: a entrega original ainda está sendo registrada.'))
+                    indexes.remove(index)
+                    continue
+                try:
+                    await _admit(item.contact)
+                except HTTPException as e:
+                    # Recusado antes de ser registrado: sem a reserva, a reentrega é aceita
+                    if key:
+                        await drop_claim(session, key)
+                    results[index] = BatchItemResponseSchema(index=index, error=e.detail)
+                    indexes.remove(index)
+                    continue
+                if key:
+                    keys[index] = key
+
+        conversations = {conv: indexes for conv, indexes in conversations.items() if indexes}
+        received_at = datetime.now(br_tz).isoformat()
+        # As reservas das chaves são gravadas na mesma transação que as mensagens
+        await upsert_messages_bulk(session, [
+            (batch.items[indexes[0]].contact,
+             [HumanMessage(content=batch.items[index].message, metadata={"timestamp": received_at}) for index in indexes])
+            for indexes in conversations.values()])
+        await session.commit()
+
+    semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+    # Itens cujo turno não chegou a ser agendado: a reserva da chave é desfeita para aceitar a reentrega
+    unscheduled = set()
+
+    async def dispatch(indexes: List[int]) -> None:
+        item = batch.items[indexes[-1]]
+        response = {"contact": item.contact}
+        requested = [batch.items[index].priority for index in indexes if batch.items[index].priority is not None]
+        priority = turn_priority(item.contact.project, max(requested) if requested else None)
+        if batch.wait:
+            async with semaphore, bulkheads.for_project(item.contact.project).slot():
+                try:
+                    response["data"] = await run_pending_turn(item.contact, item.webhook_url)
+                    response["status"] = JobStatus.DONE.value
+                except (ConversationBusyError, ToolResultsPendingError):
+                    job_id, job_status = await submit_turn(contact=item.contact, webhook_url=item.webhook_url, priority=priority)
+                    response.update(job_id=job_id, status=job_status.value)
+                except Exception as e:
+                    logger.exception("Erro no lote para a conversa %s: %s", item.contact.protocol, str(e))
+                    response.update(status=JobStatus.FAILED.value, error=str(e))
         else:
-            if usuario_db.processing == True:
-                raise HTTPException(detail='Uma mensagem está sendo processada, não é possível adicionar mais mensagens', status_code=status.HTTP_406_NOT_ACCEPTABLE)
-            previous_message = messages_from_dict(usuario_db.messages)
-            previous_message.append(input_message)
-            usuario_db.messages = messages_to_dict(previous_message)
-            await session.commit()
-            await session.refresh(usuario_db)
-
-    messages = messages_from_dict(usuario_db.messages)
-
-    contato = Contact(name=usuario_db.nome,
-                      document=usuario_db.document,
-                      project = usuario_db.project,
-                      protocol = usuario_db.protocol,
-                      channel=Channel(phone=usuario_db.phone,
-                                      email=usuario_db.email))
-    webhook_url = usuario.webhook_url
-
-
-    state = {"messages": messages,
-             "last_ai_message": None,
-             "last_human_message":[HumanMessage(content=usuario.message)]
-            }
-
-    if usuario.contact.project == "Yamaha Cobrança IA":
-        async for step in langgraph_app.astream(state, stream_mode="values"):
-            final_state = step
-    if usuario.contact.project == "HelpDesk IA":
-        async for step in APP.astream(state, stream_mode="values"):
-            final_state = step
-    if usuario.contact.project == "Qualificador Leads IA":
-        async for step in agent_graph_leads.astream(state, stream_mode="values"):
-            final_state = step
-    if usuario.contact.project == "Qualificador Leads IA2":
-        async for step in leads_ia_graph.astream(state, stream_mode="values"):
-            final_state = step
-
-    last_ai_message = messages_to_dict(final_state["messages"])[-1]
-
-    tool_calls = last_ai_message.get("data", {}).get("tool_calls", [])
-    content = last_ai_message.get("data", {}).get("content")
-    if tool_calls:
-        await trigger_webhook_tool_call(contact= contato, tools= tool_calls, webhook_url = webhook_url)
-    else:
-        await trigger_webhook_message(contact= contato, message= content, webhook_url = webhook_url)
-
-    response: MessageResponseSchema = MessageResponseSchema(data=final_state["messages"][-1].content, contact= contato)
+            try:
+                job_id, job_status = await submit_turn(contact=item.contact, webhook_url=item.webhook_url, priority=priority)
+                response.update(job_id=job_id, status=job_status.value)
+            except Exception as e:
+                logger.exception("Erro ao agendar o turno da conversa %s: %s", item.contact.protocol, str(e))
+                response.update(status=JobStatus.FAILED.value, error=str(e))
+                unscheduled.update(indexes)
+
+        for index in indexes:
+            results[index] = BatchItemResponseSchema(index=index, **response)
+
+    await asyncio.gather(*(dispatch(indexes) for indexes in conversations.values()))
+
+    if keys:
+        async with db as session:
+            for index, key in keys.items():
+                if index in unscheduled:
+                    await release_key(session, key)
+                else:
+                    await store_response(session, key, results[index].dict(exclude={"index"}))
+
+    return BatchMessageResponseSchema(results=[results[index] for index in sorted(results)])
+
+
+@router.post('/stream', status_code=status.HTTP_200_OK)
+async def post_chat_stream(usuario: MessageRequestSchema, db: AsyncSession = Depends(get_session)):
+    """
+    Variante em Server-Sent Events: emite os tokens do LLM e o progresso dos nós
+    enquanto o grafo executa. A resposta final vem no evento 'done' (não passa pelo webhook).
+    Se o turno não puder rodar aqui (outro turno em execução, resultados de ferramentas
+    pendentes) a mensagem, já gravada, segue como em /chat: 202 com o job e resposta pelo webhook.
+    """
+    _validate(usuario)
+    await _admit(usuario.contact)
+
     async with db as session:
-        query = select(UsuarioModel).filter(UsuarioModel.phone == usuario.contact.channel.phone,
-                                            UsuarioModel.project == usuario.contact.project,
-                                            UsuarioModel.protocol == usuario.contact.protocol)
-        result = await session.execute(query)
-        usuario_db: UsuarioSchema = result.scalars().unique().one_or_none()
-
-        if usuario_db:
-            usuario_db.processing = False
-            usuario_db.messages = messages_to_dict(final_state["messages"])
-            await session.commit()
-            await session.refresh(usuario_db)
+        usuario_db = await _record_message(session, usuario)
 
-    return response
+    contato = contact_from_db(usuario_db)
+    priority = turn_priority(contato.project, usuario.priority)
+
+    async def submit() -> MessageResponseSchema:
+        job_id, job_status = await submit_turn(contact=contato, webhook_url=usuario.webhook_url, priority=priority)
+        return MessageResponseSchema(job_id=job_id, status=job_status.value, contact=contato)
+
+    lease = ConversationLease(contato)
+    if not await lease.acquire():
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder(await submit()))
+
+    try:
+        turn = await prepare_pending_turn(contato)
+    except ToolResultsPendingError:
+        turn = None
+    except Exception:
+        await lease.release()
+        raise
+    if turn is None:
+        # Sem nada a responder aqui (a mensagem pode já ter entrado em outro turno): o job decide
+        await lease.release()
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder(await submit()))
+
+    async def event_stream():
+        finished = False
+        try:
+            async with bulkheads.for_project(contato.project).slot():
+                async for event, data in stream_turn(contato, turn, lease):
+                    # 'done' só sai depois de o histórico ser gravado
+                    finished = finished or event == "done"
+                    yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+        except Exception as e:
+            finished = True
+            logger.exception("Erro no streaming da conversa %s: %s", contato.protocol, str(e))
+            yield f"event: error\ndata: {json.dumps({'detail': 'Erro ao processar a mensagem.'})}\n\n"
+        finally:
+            # Com o cliente desconectado no meio do turno o cancelamento chega aqui: a limpeza roda
+            # protegida e a mensagem, ainda sem resposta, vai para um job (resposta pelo webhook)
+            with anyio.CancelScope(shield=True):
+                await lease.release()
+                if not finished:
+                    logger.warning("Streaming da conversa %s interrompido, turno reagendado", contato.protocol)
+                    await submit()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
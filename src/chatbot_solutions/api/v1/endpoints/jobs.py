@@ -0,0 +1,30 @@
+from fastapi import APIRouter, status, HTTPException
+
+from schemas.usuario_schema import JobStatusSchema
+from core.bulkheads import bulkheads
+from core.turn_queue import JOB_PREFIX, durable_queue
+
+
+router = APIRouter()
+
+@router.get('/{job_id}', response_model=JobStatusSchema, status_code=status.HTTP_200_OK)
+async def get_job(job_id: str):
+    if job_id.startswith(JOB_PREFIX):
+        # Fila durável (TURN_QUEUE=postgres): a resposta vai pelo webhook, aqui só o andamento
+        job_status = await durable_queue.status(job_id)
+        if job_status is None:
+            raise HTTPException(detail='Job não encontrado ou expirado.', status_code=status.HTTP_404_NOT_FOUND)
+        return JobStatusSchema(job_id=job_id, status=job_status.value)
+
+    job = bulkheads.get(job_id)
+    if not job:
+        raise HTTPException(detail='Job não encontrado ou expirado.', status_code=status.HTTP_404_NOT_FOUND)
+
+    # Turno adiado porque a conversa estava ocupada: segue para o job que vai respondê-lo
+    while job.meta.get("requeued_as") and bulkheads.get(job.meta["requeued_as"]):
+        job = bulkheads.get(job.meta["requeued_as"])
+
+    return JobStatusSchema(job_id=job.id,
+                           status=job.status.value,
+                           data=job.result if isinstance(job.result, str) else None,
+                           error=job.error)
@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+import core.memory  # noqa: F401  (registra as métricas de memória do processo)
+from core.metrics import render
+
+
+router = APIRouter()
+
+@router.get('', response_class=PlainTextResponse)
+async def get_metrics():
+    """Métricas no formato texto do Prometheus (filas, bulkheads e contadores)."""
+    return PlainTextResponse(render(), media_type='text/plain; version=0.0.4')
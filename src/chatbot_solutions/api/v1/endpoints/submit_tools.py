@@ -1,104 +1,82 @@
-from typing import List, Optional, Any
+from typing import Optional
 
-from fastapi import APIRouter, status, Depends, HTTPException, Response
-from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import JSONResponse
+from zoneinfo import ZoneInfo
+from datetime import datetime
 
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from sqlalchemy.exc import IntegrityError
-
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage,ToolMessage, messages_from_dict, messages_to_dict 
+from fastapi import APIRouter, status, Depends, HTTPException, Header
 
-from models.usuario_model import UsuarioModel
-from schemas.usuario_schema import ToolCallRequestSchema, UsuarioSchema, MessageResponseSchema, Contact, Channel
-from core.deps import get_session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from graphs.graph_yamaha import langgraph_app
-from graphs.help_desk_graph import APP
-from graphs.agent_graph_leads import agent_graph_leads
-from webhook_calls import trigger_webhook_message, trigger_webhook_tool_call
+from langchain_core.messages import ToolMessage
 
+from schemas.usuario_schema import ToolCallRequestSchema, MessageResponseSchema
+from core.deps import get_session, check_backpressure
+from core.graph_registry import graph_registry
+from core.idempotency import request_key, claim_key, release_key, replay_response, store_response
+from core.configs import settings
+from core.inbox import submit_turn, turn_priority
+from core.turns import append_messages, contact_from_db
 
 
+br_tz = ZoneInfo("America/Sao_Paulo")
 
 router = APIRouter()
 
 @router.post('', response_model=MessageResponseSchema, status_code=status.HTTP_202_ACCEPTED)
-async def post_chat(tool_calls_response: ToolCallRequestSchema, db: AsyncSession = Depends(get_session)):
-    
+async def post_chat(tool_calls_response: ToolCallRequestSchema, db: AsyncSession = Depends(get_session),
+                    idempotency_key: Optional[str] = Header(None, alias='Idempotency-Key')):
+
     webhook_url = tool_calls_response.webhook_url
 
     if not tool_calls_response.tool_calls:
         raise HTTPException(detail="Missing tool calls.", status_code=status.HTTP_400_BAD_REQUEST)
-    
+
+    if not graph_registry.has(tool_calls_response.contact.project):
+        raise HTTPException(detail='Projeto não encontrado.', status_code=status.HTTP_404_NOT_FOUND)
+
+    await check_backpressure(tool_calls_response.contact.project)
+
     tool_response = []
-    
+
+    # O timestamp marca o início da espera pelos demais resultados da mesma tool call (core/tool_results.py)
+    received_at = datetime.now(br_tz).isoformat()
     for tool_call in tool_calls_response.tool_calls:
-        tool_msg = ToolMessage(tool_call_id=tool_call.tool_call_id, 
-                               content= tool_call.content)
+        tool_msg = ToolMessage(tool_call_id=tool_call.tool_call_id,
+                               content= tool_call.content,
+                               metadata={"timestamp": received_at})
         tool_response.append(tool_msg)
 
-    
+    # tool_call_id é único, então os ids entregues já identificam uma reentrega
+    key = request_key('submit_tools', tool_calls_response.contact, idempotency_key or tool_calls_response.idempotency_key,
+                      *sorted(tool_call.tool_call_id for tool_call in tool_calls_response.tool_calls))
 
     async with db as session:
-        query = select(UsuarioModel).filter(UsuarioModel.phone == tool_calls_response.contact.channel.phone,UsuarioModel.project == tool_calls_response.contact.project,UsuarioModel.protocol == tool_calls_response.contact.protocol)
-        result = await session.execute(query)
-        usuario_db: UsuarioSchema = result.scalars().unique().one_or_none()
-
-        # Garante que usuario_db.messages seja uma lista válida
-        previous_message = messages_from_dict(usuario_db.messages or [])
-
-        # Garante que tool_msg está definido corretamente
-        for tool_call in tool_calls_response.tool_calls:
-            tool_msg = ToolMessage(tool_call_id=tool_call.tool_call_id, content=tool_call.content)
-            previous_message.append(tool_msg)
-
-        # Converte de volta para dict
-        usuario_db.messages = messages_to_dict(previous_message)
-        await session.commit()
-        await session.refresh(usuario_db)
-    
-
-
-    contato = Contact(name=usuario_db.nome,document=usuario_db.document,project = usuario_db.project,protocol = usuario_db.protocol,channel=Channel(phone=usuario_db.phone,email=usuario_db.email))
-    
-    print(previous_message)
-
-    state = {"messages": previous_message,
-             "last_ai_message": None,
-             "last_human_message": None
-            }
-        
-    if tool_calls_response.contact.project == "Yamaha Cobrança IA":
-        async for step in langgraph_app.astream(state, stream_mode="values"):
-            final_state = step
-    if tool_calls_response.contact.project == "HelpDesk IA":
-        async for step in APP.astream(state, stream_mode="values"):
-            final_state = step
-    if tool_calls_response.contact.project == "Qualificador Leads IA":
-        async for step in agent_graph_leads.astream(state, stream_mode="values"):
-            final_state = step
-
-    last_ai_message = messages_to_dict(final_state["messages"])[-1]
-
-    tool_calls = last_ai_message.get("data", {}).get("tool_calls", [])
-    content = last_ai_message.get("data", {}).get("content")
-    if tool_calls:
-        await trigger_webhook_tool_call(contact= contato, tools= tool_calls, webhook_url = webhook_url)
-    else:
-        await trigger_webhook_message(contact= contato, message= content, webhook_url = webhook_url)
-
-    response: MessageResponseSchema = MessageResponseSchema(data=final_state["messages"][-1].content, contact= contato)
+        if key and not await claim_key(session, key):
+            stored = await replay_response(session, key)
+            if stored is None:
+                raise HTTPException(detail='Resultado duplicado: a entrega original ainda está sendo registrada.', status_code=status.HTTP_409_CONFLICT)
+            return MessageResponseSchema(**stored)
 
-    async with db as session:
-        query = select(UsuarioModel).filter(UsuarioModel.phone == tool_calls_response.contact.channel.phone,UsuarioModel.project == tool_calls_response.contact.project,UsuarioModel.protocol == tool_calls_response.contact.protocol)
-        result = await session.execute(query)
-        usuario_db: UsuarioSchema = result.scalars().unique().one_or_none()
+        usuario_db = await append_messages(session, tool_calls_response.contact, tool_response)
 
-        if usuario_db:
-            usuario_db.messages = messages_to_dict(final_state["messages"])
+        if not usuario_db:
+            raise HTTPException(detail="Conversa não encontrada.", status_code=status.HTTP_404_NOT_FOUND)
+
+        try:
             await session.commit()
-            await session.refresh(usuario_db)
-    
+
+            contato = contact_from_db(usuario_db)
+            # Retomada de tool call: o usuário já está esperando desde a mensagem anterior.
+            # Com resultados ainda faltando, o turno só confere o histórico e aguarda os demais
+            priority = turn_priority(contato.project, tool_calls_response.priority, boost=settings.PRIORITY_TOOL_BOOST)
+            job_id, job_status = await submit_turn(contact=contato, webhook_url=webhook_url, immediate=True, priority=priority)
+        except Exception:
+            # Sem a reserva a reentrega é aceita, em vez de receber 409 até o fim do TTL
+            if key:
+                await release_key(session, key)
+            raise
+
+        response = MessageResponseSchema(job_id=job_id, status=job_status.value, contact=contato)
+        if key:
+            await store_response(session, key, response.dict())
     return response
@@ -0,0 +1,101 @@
+import logging
+from enum import Enum
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, case, func, literal, or_, update
+from sqlalchemy.future import select
+
+from core.database import Session
+from models.usuario_model import UsuarioModel
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationState(str, Enum):
+    RUNNING = "running"  # turno em execução com lease vigente
+    STUCK = "stuck"      # processing=True sem lease vigente (worker morreu ou lease limpo pela metade)
+    IDLE = "idle"        # sem turno em execução
+
+
+_active_lease = and_(UsuarioModel.lease_owner.is_not(None), UsuarioModel.lease_expires_at >= func.now())
+
+
+def state_filter(state: ConversationState):
+    """
+    Condição SQL de cada estado. running e stuck exigem processing, o que permite ao Postgres
+    usar o índice parcial ix_usuarios_processing em vez de varrer as conversas ociosas.
+    """
+    if state == ConversationState.RUNNING:
+        return and_(UsuarioModel.processing, _active_lease)
+    if state == ConversationState.STUCK:
+        return and_(UsuarioModel.processing, or_(UsuarioModel.lease_owner.is_(None),
+                                                 UsuarioModel.lease_expires_at.is_(None),
+                                                 UsuarioModel.lease_expires_at < func.now()))
+    return UsuarioModel.processing.is_not(True)
+
+
+state_column = case((and_(UsuarioModel.processing, _active_lease), literal(ConversationState.RUNNING.value)),
+                    (UsuarioModel.processing, literal(ConversationState.STUCK.value)),
+                    else_=literal(ConversationState.IDLE.value)).label("state")
+
+# Colunas das listagens: tudo menos o histórico, que só é lido quando pedido
+SUMMARY_COLUMNS = (UsuarioModel.id, UsuarioModel.project, UsuarioModel.protocol, UsuarioModel.phone,
+                   UsuarioModel.nome, UsuarioModel.processing, UsuarioModel.lease_owner,
+                   UsuarioModel.lease_expires_at, UsuarioModel.created_at, UsuarioModel.updated_at, state_column)
+
+
+def conversations_query(project: Optional[str] = None, state: Optional[ConversationState] = None,
+                        after: Optional[int] = None, include_messages: bool = False):
+    """SELECT das conversas em ordem de id a partir do cursor (keyset: id > after), sem OFFSET."""
+    columns: Sequence[Any] = SUMMARY_COLUMNS + ((UsuarioModel.messages,) if include_messages else ())
+    query = select(*columns).order_by(UsuarioModel.id)
+    if project is not None:
+        query = query.where(UsuarioModel.project == project)
+    if state is not None:
+        query = query.where(state_filter(state))
+    if after is not None:
+        query = query.where(UsuarioModel.id > after)
+    return query
+
+
+async def list_conversations(project: Optional[str], state: Optional[ConversationState], after: Optional[int],
+                             limit: int, include_messages: bool = False) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Uma página de conversas e o cursor da próxima (None na última página)."""
+    query = conversations_query(project, state, after, include_messages).limit(limit + 1)
+    async with Session() as session:
+        result = await session.execute(query)
+        rows = [dict(row._mapping) for row in result]
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1]["id"]
+    return rows, None
+
+
+async def release_leases(ids: Optional[List[int]] = None, project: Optional[str] = None,
+                         force: bool = False) -> List[int]:
+    """
+    Libera em um único UPDATE os leases das conversas escolhidas (ids e/ou projeto).
+    Sem force só as presas são liberadas; com force também as em execução, e o turno
+    em andamento deixa de gravar o histórico (save_turn confere o dono do lease).
+    As mensagens pendentes são respondidas no próximo turno da conversa.
+    """
+    query = (update(UsuarioModel)
+             .where(UsuarioModel.processing)
+             .values(processing=False, lease_owner=None, lease_expires_at=None,
+                     updated_at=UsuarioModel.updated_at)
+             .returning(UsuarioModel.id))
+    if ids is not None:
+        query = query.where(UsuarioModel.id.in_(ids))
+    if project is not None:
+        query = query.where(UsuarioModel.project == project)
+    if not force:
+        query = query.where(state_filter(ConversationState.STUCK))
+
+    async with Session() as session:
+        result = await session.execute(query)
+        released = sorted(row.id for row in result)
+        await session.commit()
+    if released:
+        logger.warning("Admin: %s leases liberados (projeto=%s, force=%s)", len(released), project, force)
+    return released
@@ -0,0 +1,114 @@
+import bisect
+import hashlib
+import logging
+from datetime import timedelta
+from typing import Dict, FrozenSet, List, Optional, Sequence
+
+from sqlalchemy import delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.future import select
+
+from core.configs import settings
+from core.database import Session
+from core.locks import WORKER_ID
+from models.turn_worker_model import TurnWorkerModel
+from schemas.usuario_schema import Contact
+
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(value: str) -> int:
+    # Estável entre processos e máquinas (o hash() do Python muda a cada execução)
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def conversation_shard(project: str, phone: str, protocol: str, shards: int = settings.AFFINITY_SHARDS) -> int:
+    """Shard fixo da conversa: as mensagens do mesmo protocolo caem sempre no mesmo shard."""
+    return _hash(f"{project}|{phone}|{protocol}") % shards
+
+
+def contact_shard(contact: Contact) -> int:
+    return conversation_shard(contact.project, contact.channel.phone, contact.protocol)
+
+
+class HashRing:
+    """
+    Hash consistente dos shards entre os workers, com vnodes pontos por worker no anel.
+    Quando um worker entra ou sai só os shards vizinhos aos pontos dele mudam de dono.
+    """
+
+    def __init__(self, members: Sequence[str], vnodes: int):
+        points = sorted((_hash(f"{member}#{index}"), member) for member in members for index in range(vnodes))
+        self._keys = [point for point, _ in points]
+        self._members = [member for _, member in points]
+
+    def owner(self, shard: int) -> Optional[str]:
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(f"shard:{shard}")) % len(self._keys)
+        return self._members[index]
+
+    def assignment(self, shards: int) -> Dict[int, str]:
+        return {shard: self.owner(shard) for shard in range(shards)}
+
+
+class AffinityRouter:
+    """
+    Roteamento por afinidade de conversa entre os processos de worker.py (TURN_QUEUE=postgres).
+    Cada worker registra um heartbeat em turn_workers; todos montam o mesmo anel com os
+    workers vivos e reservam só os turnos dos shards que possuem, então o próximo turno do
+    mesmo protocolo roda no mesmo processo e caches por conversa nesse processo são aproveitados.
+    Workers que somem (heartbeat vencido) saem do anel e os shards deles são redistribuídos.
+    """
+
+    def __init__(self, worker_id: str, shards: int, vnodes: int, member_ttl_seconds: float):
+        self.worker_id = worker_id
+        self.shards = shards
+        self.vnodes = vnodes
+        self.member_ttl = timedelta(seconds=member_ttl_seconds)
+        self.members: List[str] = []
+        self.owned: FrozenSet[int] = frozenset()
+
+    async def heartbeat(self) -> None:
+        """Renova o registro deste worker, remove os vencidos e recalcula os shards próprios."""
+        table = TurnWorkerModel
+        async with Session() as session:
+            await session.execute(insert(table)
+                                  .values(worker_id=self.worker_id, heartbeat_at=func.now())
+                                  .on_conflict_do_update(index_elements=[table.worker_id],
+                                                         set_={"heartbeat_at": func.now()}))
+            await session.execute(delete(table).where(table.heartbeat_at < func.now() - self.member_ttl))
+            result = await session.execute(select(table.worker_id).order_by(table.worker_id))
+            members = [row.worker_id for row in result]
+            await session.commit()
+        self._rebuild(members)
+
+    async def leave(self) -> None:
+        """Sai do anel no desligamento, para os demais assumirem os shards sem esperar o TTL."""
+        async with Session() as session:
+            await session.execute(delete(TurnWorkerModel).where(TurnWorkerModel.worker_id == self.worker_id))
+            await session.commit()
+        self.members = []
+        self.owned = frozenset()
+
+    def owns(self, contact: Contact) -> bool:
+        """True se a conversa é deste worker no anel atual (útil para caches por conversa)."""
+        return contact_shard(contact) in self.owned
+
+    def _rebuild(self, members: List[str]) -> None:
+        if members == self.members:
+            return
+        ring = HashRing(members, self.vnodes)
+        owned = frozenset(shard for shard, owner in ring.assignment(self.shards).items() if owner == self.worker_id)
+        moved = len(owned ^ self.owned)
+        self.members = members
+        self.owned = owned
+        logger.info("Anel de afinidade: %s workers, este possui %s de %s shards (%s mudaram de dono)",
+                    len(members), len(owned), self.shards, moved)
+
+
+affinity: AffinityRouter = AffinityRouter(worker_id=WORKER_ID,
+                                          shards=settings.AFFINITY_SHARDS,
+                                          vnodes=settings.AFFINITY_VNODES,
+                                          member_ttl_seconds=settings.AFFINITY_MEMBER_TTL_SECONDS)
@@ -0,0 +1,79 @@
+import asyncio
+from typing import Dict, Iterable, Optional
+
+from core.configs import settings
+from core.jobs import Job, JobQueue
+from core.metrics import Sample, register_collector
+
+
+class Bulkheads:
+    """
+    Um pool de execução (fila + workers) por projeto, para um projeto lento (ex.: HelpDesk
+    com a crew técnica) não consumir os workers, conexões e chamadas de LLM dos demais.
+    Tamanhos vêm de BULKHEADS[projeto]; projetos sem configuração usam GRAPH_WORKERS/JOB_QUEUE_MAXSIZE.
+    """
+
+    def __init__(self, config: Dict[str, Dict[str, int]], default_workers: int, default_maxsize: int, result_ttl: int,
+                 aging_seconds: float):
+        self.config = config
+        self.default_workers = default_workers
+        self.default_maxsize = default_maxsize
+        self.result_ttl = result_ttl
+        self.aging_seconds = aging_seconds
+        self._queues: Dict[str, JobQueue] = {}
+        self._started = False
+
+    def for_project(self, project: str) -> JobQueue:
+        queue = self._queues.get(project)
+        if queue is None:
+            options = self.config.get(project, {})
+            queue = JobQueue(maxsize=options.get("maxsize", self.default_maxsize),
+                             workers=options.get("workers", self.default_workers),
+                             result_ttl=self.result_ttl,
+                             name=project,
+                             aging_seconds=self.aging_seconds)
+            self._queues[project] = queue
+            if self._started:
+                queue.start_workers()
+        return queue
+
+    def queues(self) -> Iterable[JobQueue]:
+        return list(self._queues.values())
+
+    def get(self, job_id: str) -> Optional[Job]:
+        for queue in self._queues.values():
+            job = queue.get(job_id)
+            if job is not None:
+                return job
+        return None
+
+    async def start(self) -> None:
+        self._started = True
+        for project in self.config:
+            self.for_project(project)
+        for queue in self._queues.values():
+            queue.start_workers()
+
+    async def stop(self) -> None:
+        self._started = False
+        await asyncio.gather(*(queue.stop() for queue in self._queues.values()))
+
+    def collect(self) -> Iterable[Sample]:
+        for queue in self.queues():
+            labels = {"bulkhead": queue.name}
+            yield "chatbot_bulkhead_workers", "gauge", "Vagas de execução do bulkhead", labels, queue.workers
+            yield "chatbot_bulkhead_running", "gauge", "Turnos em execução no bulkhead", labels, queue.running
+            yield "chatbot_bulkhead_saturation", "gauge", "Fração das vagas de execução ocupadas", labels, queue.saturation
+            yield "chatbot_bulkhead_queue_depth", "gauge", "Jobs aguardando na fila do bulkhead", labels, queue.depth
+            yield "chatbot_bulkhead_queue_capacity", "gauge", "Tamanho máximo da fila do bulkhead", labels, queue.maxsize
+            yield "chatbot_bulkhead_completed_total", "counter", "Jobs concluídos", labels, queue.completed
+            yield "chatbot_bulkhead_failed_total", "counter", "Jobs com erro", labels, queue.failed
+            yield "chatbot_bulkhead_rejected_total", "counter", "Jobs recusados por fila cheia", labels, queue.rejected
+
+
+bulkheads: Bulkheads = Bulkheads(config=settings.BULKHEADS,
+                                 default_workers=settings.GRAPH_WORKERS,
+                                 default_maxsize=settings.JOB_QUEUE_MAXSIZE,
+                                 result_ttl=settings.JOB_RESULT_TTL_SECONDS,
+                                 aging_seconds=settings.PRIORITY_AGING_SECONDS)
+register_collector(bulkheads.collect)
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage
+
+from core.configs import settings
+from core.graph_registry import GraphRegistry, graph_registry
+from schemas.usuario_schema import Contact
+
+
+logger = logging.getLogger(__name__)
+
+
+def thread_id(contact: Contact) -> str:
+    """Thread do checkpointer: uma por conversa (projeto + telefone + protocolo)."""
+    return f"{contact.project}:{contact.channel.phone}:{contact.protocol}"
+
+
+@dataclass
+class TurnCheckpoint:
+    """
+    Posição do turno no checkpointer: o checkpoint de partida (o último gravado junto com o
+    histórico em usuarios.checkpoint_id, None para começar a thread do zero), as mensagens que
+    ele já contém e o último checkpoint gravado pela execução.
+    """
+    thread_id: str
+    start_id: Optional[str]
+    messages: List[BaseMessage] = field(default_factory=list)
+    saved_id: Optional[str] = None
+
+    def config(self) -> Dict[str, Any]:
+        configurable = {"thread_id": self.thread_id}
+        if self.start_id:
+            # Parte do checkpoint confirmado, não do último da thread: checkpoints de um turno
+            # que não chegou a gravar o histórico (worker morto, deadline) ficam num ramo abandonado
+            configurable["checkpoint_id"] = self.start_id
+        return {"configurable": configurable}
+
+
+class Checkpoints:
+    """
+    Checkpointer Postgres (AsyncPostgresSaver) dos projetos em CHECKPOINT_PROJECTS.
+    O estado do grafo de cada conversa fica nas tabelas do LangGraph; o turno retoma do
+    checkpoint e recebe só as mensagens ainda não vistas, em vez de reconstruir o estado
+    com todo o histórico de usuarios.messages. O pacote é opcional e só é importado se
+    algum projeto usar o checkpointer.
+    """
+
+    def __init__(self, projects: List[str], conninfo: str, pool_size: int, registry: GraphRegistry):
+        self.projects = projects
+        self.conninfo = conninfo
+        self.pool_size = pool_size
+        self.registry = registry
+        self._pool = None
+        self._saver = None
+        self._graphs: Dict[str, Any] = {}
+        self._lock = asyncio.Lock()
+
+    def enabled(self, project: str) -> bool:
+        return "*" in self.projects or project in self.projects
+
+    async def start(self) -> None:
+        """Abre o pool e cria as tabelas do checkpointer (idempotente); nada a fazer sem projetos."""
+        if self.projects:
+            await self._get_saver()
+
+    async def _get_saver(self):
+        async with self._lock:
+            if self._saver is None:
+                from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+                from psycopg.rows import dict_row
+                from psycopg_pool import AsyncConnectionPool
+
+                pool = AsyncConnectionPool(self.conninfo, max_size=self.pool_size, open=False,
+                                           kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row})
+                await pool.open()
+                saver = AsyncPostgresSaver(pool)
+                await saver.setup()
+                self._pool, self._saver = pool, saver
+                logger.info("Checkpointer Postgres pronto para %s", ", ".join(self.projects))
+        return self._saver
+
+    async def graph(self, project: str) -> Any:
+        """O grafo do projeto compilado com o checkpointer (cópia do grafo do registry)."""
+        compiled = self._graphs.get(project)
+        if compiled is None:
+            saver = await self._get_saver()
+            compiled = (await self.registry.aget(project)).copy(update={"checkpointer": saver})
+            self._graphs[project] = compiled
+        return compiled
+
+    async def position(self, contact: Contact, checkpoint_id: Optional[str]) -> TurnCheckpoint:
+        """Carrega o checkpoint de partida do turno; sem ele, a thread da conversa recomeça vazia."""
+        checkpoint = TurnCheckpoint(thread_id=thread_id(contact), start_id=checkpoint_id)
+        if checkpoint_id is None:
+            await self.reset(contact)
+            return checkpoint
+        snapshot = await (await self.graph(contact.project)).aget_state(checkpoint.config())
+        if not snapshot.values:
+            logger.warning("Checkpoint %s da conversa %s não encontrado, recomeçando a thread", checkpoint_id, contact.protocol)
+            return await self.position(contact, None)
+        checkpoint.messages = list(snapshot.values.get("messages") or [])
+        return checkpoint
+
+    async def reset(self, contact: Contact) -> None:
+        await (await self._get_saver()).adelete_thread(thread_id(contact))
+
+    async def aclose(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+        self._pool = None
+        self._saver = None
+        self._graphs.clear()
+
+
+def _conninfo() -> str:
+    return settings.CHECKPOINT_DB_URL or settings.DB_URL.replace("+asyncpg", "", 1)
+
+
+checkpoints: Checkpoints = Checkpoints(projects=settings.CHECKPOINT_PROJECTS,
+                                       conninfo=_conninfo(),
+                                       pool_size=settings.CHECKPOINT_POOL_SIZE,
+                                       registry=graph_registry)
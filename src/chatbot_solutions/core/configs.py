@@ -1,4 +1,4 @@
-from typing import List
+from typing import Any, Dict, List
 from pydantic_settings import BaseSettings
 from sqlalchemy.orm import declarative_base
 from typing import ClassVar
@@ -20,6 +20,155 @@ class Settings(BaseSettings):
     # 60 minutos * 24 horas * 7 dias => 1 semana
     ACESS_TOKEN_EXPIRE_MINUTES: int = 60*24*7
 
+    # Modo job: os turnos entram em uma fila em memória atendida por um pool de workers de grafo.
+    # Cada projeto tem seu próprio pool (bulkhead); estes são os tamanhos padrão
+    GRAPH_WORKERS: int = 4
+    JOB_QUEUE_MAXSIZE: int = 1000
+    # Tamanhos por projeto, ex.: {"HelpDesk IA": {"workers": 2, "maxsize": 200}}
+    BULKHEADS: Dict[str, Dict[str, int]] = {}
+    # Onde os turnos esperam para rodar: "memory" (fila em memória do próprio nó da API) ou
+    # "postgres" (tabela pending_turns compartilhada; a API só grava e os workers de worker.py executam)
+    TURN_QUEUE: str = "memory"
+    # Turnos simultâneos por processo de worker.py (cada projeto ainda respeita o seu bulkhead)
+    TURN_WORKER_CONCURRENCY: int = 16
+    # Polling da fila durável, além do LISTEN/NOTIFY (conexão caída, turnos com debounce)
+    TURN_QUEUE_POLL_SECONDS: float = 5
+    # Afinidade: cada conversa cai em um de AFFINITY_SHARDS shards, distribuídos por hash consistente
+    # entre os workers vivos; o próximo turno do mesmo protocolo roda no mesmo processo
+    AFFINITY_ENABLED: bool = True
+    AFFINITY_SHARDS: int = 1024
+    AFFINITY_VNODES: int = 128
+    AFFINITY_HEARTBEAT_SECONDS: float = 5
+    # Worker sem heartbeat por este tempo sai do anel
+    AFFINITY_MEMBER_TTL_SECONDS: float = 20
+    # Turno disponível há mais que isto pode ser reservado por qualquer worker (dono lotado ou anel desatualizado)
+    AFFINITY_GRACE_SECONDS: float = 10
+    # Tempo que o status de um job finalizado fica disponível para consulta
+    JOB_RESULT_TTL_SECONDS: int = 60*60
+
+    # Prioridade dos turnos na fila (maior sai antes). O pedido pode informar a sua (0..PRIORITY_MAX);
+    # sem isso vale o padrão do projeto. Resultados de ferramentas recebem PRIORITY_TOOL_BOOST a mais
+    PRIORITY_MAX: int = 10
+    PRIORITY_DEFAULTS: Dict[str, int] = {}
+    PRIORITY_TOOL_BOOST: int = 5
+    # Quanto tempo de espera vale um nível de prioridade (evita que turnos comuns fiquem parados para sempre)
+    PRIORITY_AGING_SECONDS: float = 10.0
+
+    # Orçamento de latência por projeto, em segundos: ao passar de "soft" o usuário recebe "interim"
+    # e o turno continua; ao passar de "hard" o turno é cancelado e a conversa vai para o handoff.
+    # Chaves opcionais: "interim", "handoff" (tool call enviada no lugar da resposta) e "fallback"
+    # (mensagem usada quando "handoff" é vazio). Projetos ausentes não têm limite.
+    TURN_BUDGETS: Dict[str, Dict[str, Any]] = {
+        "HelpDesk IA": {"soft": 8, "hard": 90, "interim": "Só um instante, estou consultando a documentação..."},
+    }
+    TURN_INTERIM_MESSAGE: str = "Só um instante, já estou verificando..."
+    TURN_HANDOFF_TOOL: str = "falar_com_atendente_humano"
+    TURN_FALLBACK_MESSAGE: str = "Desculpe a demora. Vou transferir você para um de nossos atendentes."
+    # Resultado gravado para a tool call de handoff do prazo (encerra a tool call no histórico)
+    TURN_HANDOFF_RESULT_MESSAGE: str = "Conversa transferida para um atendente: o turno excedeu o tempo limite."
+    # Tempo mínimo restante no turno para a pesquisa técnica do HelpDesk rodar as crews
+    CREW_MIN_BUDGET_SECONDS: float = 30
+
+    # Entrega em partes: projeto -> nós cujos tokens do LLM são enviados ao webhook frase a frase,
+    # ex.: {"HelpDesk IA": ["agent"]}. Só os nós listados (nunca classificadores ou guardrails);
+    # projetos ausentes ou com lista vazia recebem a resposta inteira
+    CHUNKED_DELIVERY: Dict[str, List[str]] = {}
+    # Tamanho mínimo de cada parte, para não picotar a resposta em mensagens muito curtas
+    CHUNK_MIN_CHARS: int = 120
+    # Cada parte passa pela moderação da OpenAI antes do envio
+    CHUNK_MODERATION: bool = True
+    # Enviada antes da resposta final quando ela não continua o texto já entregue em partes
+    CHUNK_CORRECTION_MESSAGE: str = "Correção: desconsidere a mensagem anterior. A resposta correta é:"
+
+    # Retomada de tool calls com várias ferramentas: o grafo só roda com todos os resultados da
+    # última AIMessage; os que não chegarem neste prazo entram com TOOL_RESULTS_TIMEOUT_MESSAGE
+    TOOL_RESULTS_TIMEOUT_SECONDS: float = 30
+    TOOL_RESULTS_TIMEOUT_MESSAGE: str = "A ferramenta não retornou resultado dentro do prazo."
+    # Ferramentas por projeto cujos resultados chegam por /submit_tools: só elas seguram o próximo turno.
+    # Tool calls sem resultado de outras ferramentas (handoff, finalizar_conversa) são encerradas na hora
+    EXTERNAL_TOOLS: Dict[str, List[str]] = {"Yamaha Cobrança IA": ["buscar_contrato_1", "buscar_contrato_2"]}
+    TOOL_CALL_CLOSED_MESSAGE: str = "Chamada encerrada: a conversa seguiu com uma nova mensagem do usuário."
+
+    # Ciclos agent -> ferramentas -> agent (core/tool_loop.py): rodadas de ferramentas por turno e
+    # chamadas idênticas repetidas (respondidas com o resultado anterior) antes de encerrar o turno
+    TOOL_MAX_STEPS: int = 6
+    TOOL_MAX_REPEATS: int = 2
+    TOOL_LOOP_FALLBACK_MESSAGE: str = "Desculpe, não consegui concluir sua solicitação agora. Pode reformular ou pedir para falar com um atendente?"
+    TOOL_LOOP_SKIPPED_MESSAGE: str = "Ferramenta não executada: limite de chamadas do turno atingido."
+
+    # Projetos cujos grafos rodam com o checkpointer Postgres do LangGraph ("*" = todos): o turno
+    # retoma do checkpoint da conversa e grava só as mensagens novas (requer o extra "checkpoint": pip install .[checkpoint])
+    CHECKPOINT_PROJECTS: List[str] = []
+    # Conexão do checkpointer (psycopg); vazio usa o DB_URL sem o driver asyncpg
+    CHECKPOINT_DB_URL: str = ""
+    CHECKPOINT_POOL_SIZE: int = 10
+
+    # Ferramentas do grafo Yamaha Cobrança: "webhook" envia a tool call ao cliente e espera /submit_tools;
+    # "server" executa as ferramentas aqui, em paralelo, contra o serviço de contratos, no mesmo turno
+    YAMAHA_TOOLS_MODE: str = "webhook"
+    # Serviço de contratos (modo server): POST {CONTRACT_SERVICE_URL}/{ferramenta} com os argumentos em JSON
+    CONTRACT_SERVICE_URL: str = ""
+    CONTRACT_SERVICE_TOKEN: str = ""
+    CONTRACT_SERVICE_TIMEOUT_SECONDS: float = 10
+    CONTRACT_SERVICE_MAX_CONNECTIONS: int = 20
+
+    # Warmup em segundo plano no startup; /health/ready responde 503 até ele terminar
+    WARMUP_ENABLED: bool = True
+    # Grafos aquecidos com um turno sintético (LLM em stub) ou com o hook do projeto ("*" = todos)
+    WARMUP_PROJECTS: List[str] = ["*"]
+    # Conexões abertas no pool do banco durante o warmup
+    WARMUP_DB_CONNECTIONS: int = 4
+    WARMUP_STEP_TIMEOUT_SECONDS: float = 120
+
+    # Projetos cujos grafos são carregados no startup ("*" = todos); os demais carregam no primeiro uso
+    GRAPH_PRELOAD: List[str] = []
+    # Com gunicorn (gunicorn_conf.py): grafos carregados no master antes do fork, compartilhados
+    # entre os workers por copy-on-write (modelo de sentimento, torch, CrewAI)
+    PREFORK_PRELOAD: List[str] = ["*"]
+
+    # Agrupamento de rajadas: mensagens da mesma conversa dentro da janela viram um único turno
+    CHAT_DEBOUNCE_SECONDS: float = 1.5
+    # Espera máxima desde a primeira mensagem da rajada, para uma rajada longa não adiar o turno indefinidamente
+    CHAT_COALESCE_MAX_WAIT_SECONDS: float = 10.0
+
+    # Lease da conversa: expira se o worker morrer; o heartbeat renova enquanto o turno roda
+    LEASE_TTL_SECONDS: int = 120
+    LEASE_HEARTBEAT_SECONDS: int = 30
+
+    # Desligamento: tempo para os turnos em execução terminarem antes de serem cancelados e gravados
+    # em pending_turns (manter abaixo do graceful_timeout do gunicorn)
+    DRAIN_TIMEOUT_SECONDS: float = 20
+    # Intervalo em que cada worker procura turnos gravados por workers desligados
+    DRAIN_RESUME_POLL_SECONDS: float = 5
+
+    # Janela em que uma reentrega (mesma Idempotency-Key ou mesmo conteúdo + timestamp) é ignorada
+    IDEMPOTENCY_TTL_SECONDS: int = 15*60
+    # Reserva de uma entrega que nunca gravou resposta (processo caiu no meio) deixa de bloquear as reentregas
+    IDEMPOTENCY_CLAIM_TTL_SECONDS: int = 60
+
+    # /chat/batch: itens por requisição e turnos simultâneos no modo wait
+    BATCH_MAX_ITEMS: int = 200
+    BATCH_MAX_CONCURRENCY: int = 8
+
+    # API de admin (/api/v1/admin): token esperado no header X-Admin-Token; vazio desativa as rotas
+    ADMIN_TOKEN: str = ""
+    # Tamanho padrão e máximo das páginas das listagens de admin
+    ADMIN_PAGE_SIZE: int = 100
+    ADMIN_MAX_PAGE_SIZE: int = 1000
+    # Exportação NDJSON (admin e export_conversas.py): linhas buscadas por vez no cursor do servidor
+    EXPORT_BATCH_SIZE: int = 1000
+    # Importação de conversas históricas (importar_conversas.py): conversas por COPY
+    IMPORT_BATCH_SIZE: int = 5000
+
+    # Limite por contato (token bucket por projeto + telefone); 0 desativa
+    RATE_LIMIT_PER_MINUTE: float = 30
+    RATE_LIMIT_BURST: int = 10
+    # Backpressure global: acima destes valores novas mensagens recebem 429 com Retry-After
+    BACKPRESSURE_MAX_QUEUE_DEPTH: int = 500
+    BACKPRESSURE_MAX_IN_FLIGHT: int = 64
+    # Com TURN_QUEUE=postgres o limite de fila vale para pending_turns, contada a cada tantos segundos
+    BACKPRESSURE_DEPTH_REFRESH_SECONDS: float = 2
+
     class Config:
         case_sensitive = True
 
@@ -0,0 +1,64 @@
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+
+from core.configs import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class ContractServiceError(Exception):
+    """O serviço de contratos não respondeu ou respondeu com erro."""
+
+
+class ContractService:
+    """
+    Cliente do serviço HTTP de contratos usado pelas ferramentas executadas no servidor
+    (YAMAHA_TOOLS_MODE=server). Um único AsyncClient por processo mantém as conexões abertas
+    entre as chamadas (pool limitado por CONTRACT_SERVICE_MAX_CONNECTIONS), e as ferramentas
+    de uma mesma tool call rodam em paralelo sobre ele.
+    Cada ferramenta vira um POST {CONTRACT_SERVICE_URL}/{ferramenta} com os argumentos em JSON;
+    o corpo da resposta é o resultado entregue ao modelo.
+    """
+
+    def __init__(self, base_url: str, token: str, timeout_seconds: float, max_connections: int):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.timeout_seconds = timeout_seconds
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            if not self.base_url:
+                raise ContractServiceError("CONTRACT_SERVICE_URL não configurada")
+            headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+            self._client = httpx.AsyncClient(base_url=self.base_url,
+                                             headers=headers,
+                                             timeout=self.timeout_seconds,
+                                             limits=httpx.Limits(max_connections=self.max_connections,
+                                                                 max_keepalive_connections=self.max_connections))
+        return self._client
+
+    async def call(self, tool: str, args: Dict[str, Any]) -> str:
+        try:
+            response = await self._get_client().post(f"/{tool}", json=args)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            raise ContractServiceError(f"{tool}: HTTP {e.response.status_code}") from e
+        except httpx.RequestError as e:
+            raise ContractServiceError(f"{tool}: {e.__class__.__name__}: {e}") from e
+        return response.text
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+contract_service: ContractService = ContractService(base_url=settings.CONTRACT_SERVICE_URL,
+                                                    token=settings.CONTRACT_SERVICE_TOKEN,
+                                                    timeout_seconds=settings.CONTRACT_SERVICE_TIMEOUT_SECONDS,
+                                                    max_connections=settings.CONTRACT_SERVICE_MAX_CONNECTIONS)
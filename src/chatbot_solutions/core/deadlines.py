@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from core.configs import settings
+from core.metrics import Counter
+
+
+logger = logging.getLogger(__name__)
+
+deadline_events = Counter("chatbot_turn_deadline_total", "Turnos que passaram do orçamento (soft) ou do prazo (hard)")
+
+
+class DeadlineExceededError(Exception):
+    """O turno passou do prazo máximo do projeto e foi cancelado."""
+
+
+@dataclass
+class TurnBudget:
+    """
+    Orçamento de latência de um turno.
+    soft: depois dele o usuário recebe uma mensagem de espera e o turno continua.
+    hard: depois dele o turno é cancelado e a conversa vai para o handoff.
+    """
+    project: str
+    soft_seconds: Optional[float] = None
+    hard_seconds: Optional[float] = None
+    interim_message: str = settings.TURN_INTERIM_MESSAGE
+    handoff_tool: Optional[str] = settings.TURN_HANDOFF_TOOL
+    fallback_message: str = settings.TURN_FALLBACK_MESSAGE
+    started_at: float = field(default_factory=time.monotonic)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def remaining(self) -> Optional[float]:
+        """Segundos até o prazo máximo (None se o projeto não tem prazo)."""
+        if not self.hard_seconds:
+            return None
+        return max(0.0, self.hard_seconds - self.elapsed())
+
+    def fallback_messages_for_deadline(self) -> List[BaseMessage]:
+        """
+        Resposta usada quando o prazo estoura: handoff via tool call ou, sem ferramenta configurada, uma mensagem.
+        A tool call de handoff vai com o ToolMessage que a encerra (ninguém a responde por /submit_tools),
+        então a próxima mensagem do usuário é um turno novo.
+        """
+        if self.handoff_tool:
+            call_id = "tool_" + uuid.uuid4().hex[:35]
+            return [AIMessage(content="", tool_calls=[{"name": self.handoff_tool,
+                                                       "args": {"motivo": "tempo_limite_excedido"},
+                                                       "id": call_id}]),
+                    ToolMessage(tool_call_id=call_id, name=self.handoff_tool, content=settings.TURN_HANDOFF_RESULT_MESSAGE)]
+        return [AIMessage(content=self.fallback_message)]
+
+
+_current_budget: ContextVar[Optional[TurnBudget]] = ContextVar("turn_budget", default=None)
+
+
+def turn_budget(project: str) -> TurnBudget:
+    """Orçamento configurado em TURN_BUDGETS para o projeto (sem limites se não houver)."""
+    options: Dict[str, Any] = settings.TURN_BUDGETS.get(project, {})
+    return TurnBudget(project=project,
+                      soft_seconds=options.get("soft"),
+                      hard_seconds=options.get("hard"),
+                      interim_message=options.get("interim", settings.TURN_INTERIM_MESSAGE),
+                      handoff_tool=options.get("handoff", settings.TURN_HANDOFF_TOOL),
+                      fallback_message=options.get("fallback", settings.TURN_FALLBACK_MESSAGE))
+
+
+def current_budget() -> Optional[TurnBudget]:
+    """Orçamento do turno em execução, para os nós do grafo escolherem caminhos mais baratos."""
+    return _current_budget.get()
+
+
+def remaining_budget() -> Optional[float]:
+    """Segundos restantes até o prazo do turno atual (None fora de um turno ou sem prazo)."""
+    budget = _current_budget.get()
+    return budget.remaining() if budget else None
+
+
+async def run_with_budget(budget: TurnBudget, coro: Awaitable[Any],
+                          on_soft: Optional[Callable[[TurnBudget], Awaitable[Any]]] = None) -> Any:
+    """
+    Executa coro com o orçamento visível via contextvar.
+    Ao passar do soft chama on_soft uma vez (sem interromper); ao passar do hard cancela
+    e levanta DeadlineExceededError. Chamadas síncronas que já estiverem em uma thread
+    (ex.: as crews) seguem até o fim em segundo plano, mas o resultado é descartado.
+    """
+    token = _current_budget.set(budget)
+    try:
+        # A task copia o contexto atual, então o grafo enxerga o orçamento
+        task = asyncio.ensure_future(coro)
+    finally:
+        _current_budget.reset(token)
+
+    soft_task: Optional[asyncio.Task] = None
+
+    def soft_exceeded() -> None:
+        nonlocal soft_task
+        if task.done():
+            return
+        deadline_events.inc(project=budget.project, kind="soft")
+        logger.info("Turno do projeto '%s' passou de %.1fs, enviando mensagem de espera", budget.project, budget.soft_seconds)
+        if on_soft is not None:
+            soft_task = asyncio.ensure_future(on_soft(budget))
+
+    loop = asyncio.get_running_loop()
+    soft_timer = loop.call_later(budget.soft_seconds, soft_exceeded) if budget.soft_seconds else None
+    try:
+        return await asyncio.wait_for(task, timeout=budget.hard_seconds or None)
+    except asyncio.TimeoutError:
+        deadline_events.inc(project=budget.project, kind="hard")
+        raise DeadlineExceededError(f"Turno do projeto '{budget.project}' excedeu {budget.hard_seconds}s")
+    finally:
+        if soft_timer is not None:
+            soft_timer.cancel()
+        if soft_task is not None:
+            # A resposta final não deve chegar antes da mensagem de espera
+            await asyncio.gather(soft_task, return_exceptions=True)
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import re
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+from core.configs import settings
+from core.moderation import is_flagged
+from schemas.usuario_schema import Contact
+from webhook_calls import trigger_webhook_message, trigger_webhook_tool_call
+
+
+logger = logging.getLogger(__name__)
+
+# Fim de parágrafo, ou fim de frase seguido de espaço (sem cortar itens numerados como "1. ")
+_BOUNDARY = re.compile(r'\n[ \t]*\n\s*|(?<!\d)[.!?…]+["\')\]*_]*\s+')
+
+
+def final_answer(messages: List[BaseMessage]) -> BaseMessage:
+    """Resposta do turno: a última AIMessage (o handoff do prazo termina com o ToolMessage que o encerra)."""
+    for message in reversed(messages):
+        if isinstance(message, AIMessage):
+            return message
+    return messages[-1]
+
+
+def chunked_delivery_nodes(project: str) -> Optional[List[str]]:
+    """
+    Nós cujos tokens são entregues em partes; None se o projeto não usa o modo.
+    Os nós precisam ser listados: tokens de outros nós (classificadores, guardrails) nunca vão ao contato.
+    """
+    return settings.CHUNKED_DELIVERY.get(project) or None
+
+
+class SentenceChunker:
+    """Acumula tokens e devolve trechos completos (frases ou parágrafos) com pelo menos min_chars."""
+
+    def __init__(self, min_chars: int):
+        self.min_chars = min_chars
+        self.buffer = ""
+        # Texto já transformado em trechos, para conferir com a resposta final
+        self.consumed = ""
+
+    def feed(self, text: str) -> List[str]:
+        self.buffer += text
+        chunks = []
+        while True:
+            cut = self._cut()
+            if cut is None:
+                return chunks
+            piece, self.buffer = self.buffer[:cut], self.buffer[cut:]
+            self.consumed += piece
+            if piece.strip():
+                chunks.append(piece.strip())
+
+    def flush(self) -> List[str]:
+        piece, self.buffer = self.buffer, ""
+        self.consumed += piece
+        return [piece.strip()] if piece.strip() else []
+
+    def _cut(self) -> Optional[int]:
+        for match in _BOUNDARY.finditer(self.buffer):
+            if len(self.buffer[:match.start()].strip()) >= self.min_chars:
+                return match.end()
+        return None
+
+
+class ChunkedDelivery:
+    """
+    Entrega a resposta ao webhook em partes, à medida que o LLM gera o texto.
+    Cada trecho passa pela moderação antes do envio; o envio roda em uma task separada
+    para não atrasar o grafo. O histórico gravado continua sendo o estado final do grafo.
+    O texto é acompanhado por chamada ao LLM (id da mensagem): no fim, só o que a resposta
+    final acrescenta ao texto já entregue é enviado; se ela não continuar o que o contato
+    já recebeu, vai uma correção explícita com a resposta inteira.
+    """
+
+    def __init__(self, contact: Contact, webhook_url: str, nodes: List[str],
+                 min_chars: int = settings.CHUNK_MIN_CHARS):
+        self.contact = contact
+        self.webhook_url = webhook_url
+        self.nodes = set(nodes)
+        self.min_chars = min_chars
+        self.chunker = SentenceChunker(min_chars)
+        # Chunker de cada chamada ao LLM já transmitida, pelo id da mensagem
+        self.calls: Dict[Optional[str], SentenceChunker] = {}
+        self.call_id: Optional[str] = None
+        self.sent = 0
+        self.flagged = False
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._sender: Optional[asyncio.Task] = None
+
+    @property
+    def started(self) -> bool:
+        return any(chunker.consumed for chunker in self.calls.values())
+
+    def feed(self, text: str, node: Optional[str], message_id: Optional[str] = None) -> None:
+        """Recebe um token do grafo (stream_mode='messages')."""
+        if node not in self.nodes:
+            return
+        if message_id != self.call_id or message_id not in self.calls:
+            # Nova chamada ao LLM: o trecho incompleto da anterior não é enviado
+            self.call_id = message_id
+            self.chunker = self.calls.setdefault(message_id, SentenceChunker(self.min_chars))
+        for chunk in self.chunker.feed(text):
+            self._put(chunk)
+
+    def _delivered_prefix(self, answer: BaseMessage, messages: List[BaseMessage]) -> Optional[str]:
+        """
+        Texto da resposta final que o contato já recebeu, ou None se ele recebeu algo que a
+        resposta final não continua (chamada descartada ou reescrita por um guardrail).
+        """
+        kept = {message.id for message in messages if isinstance(message, AIMessage) and message.id}
+        for call_id, chunker in self.calls.items():
+            if chunker.consumed and call_id != answer.id and call_id not in kept:
+                return None
+        streamed = self.calls[answer.id].consumed if answer.id in self.calls else ""
+        final = str(answer.content or "")
+        return streamed if final.startswith(streamed) else None
+
+    async def finish(self, final_state: Dict[str, Any]) -> None:
+        """Envia o que faltar da resposta final (ou a tool call) depois dos trechos já enfileirados."""
+        last_message = final_answer(final_state["messages"])
+        tool_calls = getattr(last_message, "tool_calls", None) or []
+
+        if not tool_calls:
+            final = str(last_message.content or "")
+            streamed = self._delivered_prefix(last_message, final_state["messages"])
+            if streamed is None:
+                logger.warning("Resposta final da conversa %s diverge do texto já entregue em partes, enviando correção", self.contact.protocol)
+                self._put(settings.CHUNK_CORRECTION_MESSAGE)
+                streamed = ""
+            rest = SentenceChunker(self.min_chars)
+            for chunk in rest.feed(final[len(streamed):]) + rest.flush():
+                self._put(chunk)
+
+        await self._drain()
+
+        if self.flagged:
+            tool_calls = [{"name": settings.TURN_HANDOFF_TOOL,
+                           "args": {"motivo": "moderation_flagged_output"},
+                           "id": "tool_" + uuid.uuid4().hex[:35]}]
+        if tool_calls:
+            await trigger_webhook_tool_call(contact=self.contact, tools=tool_calls, webhook_url=self.webhook_url)
+
+    async def aclose(self) -> None:
+        if self._sender is not None and not self._sender.done():
+            self._sender.cancel()
+            await asyncio.gather(self._sender, return_exceptions=True)
+
+    def _put(self, chunk: str) -> None:
+        if self._sender is None:
+            self._sender = asyncio.create_task(self._send_loop())
+        self._queue.put_nowait(chunk)
+
+    async def _drain(self) -> None:
+        if self._sender is None:
+            return
+        self._queue.put_nowait(None)
+        await self._sender
+
+    async def _send_loop(self) -> None:
+        while True:
+            chunk = await self._queue.get()
+            if chunk is None:
+                return
+            if self.flagged:
+                continue
+            if settings.CHUNK_MODERATION and await is_flagged(chunk):
+                logger.warning("Trecho da resposta da conversa %s sinalizado pela moderação, interrompendo a entrega", self.contact.protocol)
+                self.flagged = True
+                continue
+            await trigger_webhook_message(contact=self.contact, message=chunk, webhook_url=self.webhook_url)
+            self.sent += 1
@@ -1,10 +1,17 @@
+import secrets
 from typing import Generator, Optional
 
+from fastapi import Header, HTTPException, status
+
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from pydantic import BaseModel
 
+from core.configs import settings
 from core.database import Session
+from core.drain import graceful_drain
+from core.rate_limit import backpressure_retry_after, contact_retry_after
+from schemas.usuario_schema import Contact
 
 
 class TokenData(BaseModel):
@@ -18,3 +25,35 @@ async def get_session() -> Generator:
         yield session
     finally:
         await session.close()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Rotas de admin: exigem X-Admin-Token igual a ADMIN_TOKEN (desativadas se ele estiver vazio)."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(detail='API de admin desativada.', status_code=status.HTTP_403_FORBIDDEN)
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(detail='Token de admin inválido.', status_code=status.HTTP_401_UNAUTHORIZED)
+
+
+async def check_backpressure(project: str) -> None:
+    """
+    Recusa novos turnos com 429 quando a fila do projeto (pending_turns com TURN_QUEUE=postgres)
+    ou as execuções em andamento passam do limite, e com 503 quando o worker está sendo desligado.
+    """
+    if graceful_drain.draining:
+        raise HTTPException(detail='Serviço reiniciando, tente novamente em instantes.',
+                            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={"Retry-After": "5"})
+    retry_after = await backpressure_retry_after(project)
+    if retry_after:
+        raise HTTPException(detail='Serviço sobrecarregado, tente novamente em instantes.',
+                            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            headers={"Retry-After": str(retry_after)})
+
+
+def check_rate_limit(contact: Contact) -> None:
+    retry_after = contact_retry_after(contact.project, contact.channel.phone)
+    if retry_after:
+        raise HTTPException(detail='Muitas mensagens deste contato, tente novamente em instantes.',
+                            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            headers={"Retry-After": str(retry_after)})
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from core.configs import settings
+from core.inbox import ConversationInbox, inbox
+from core.metrics import Counter
+from core.turn_queue import DurableTurnQueue, durable_queue
+from core.turns import in_flight_runs
+
+
+logger = logging.getLogger(__name__)
+
+handoff_events = Counter("chatbot_pending_turns_total", "Turnos gravados no desligamento (saved) e retomados por outro worker (resumed)")
+
+
+class GracefulDrain:
+    """
+    Desligamento sem perder turnos (deploy, restart de worker).
+    drain(): para de aceitar e de despachar turnos, espera os que estão rodando até
+    DRAIN_TIMEOUT_SECONDS e grava na fila durável (pending_turns) tudo o que ficou sem resposta
+    (as mensagens já estão no histórico; falta só o webhook de destino).
+    Com TURN_QUEUE=memory cada nó consulta pending_turns periodicamente e retoma esses turnos
+    pela inbox; com TURN_QUEUE=postgres quem os executa são os workers (worker.py).
+    """
+
+    def __init__(self, conversations: ConversationInbox, queue: DurableTurnQueue, timeout_seconds: float, poll_seconds: float):
+        self.inbox = conversations
+        self.queue = queue
+        self.timeout_seconds = timeout_seconds
+        self.poll_seconds = poll_seconds
+        self.draining = False
+        self._resumer: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if settings.TURN_QUEUE == "postgres":
+            return
+        self._resumer = asyncio.create_task(self._resume_loop())
+
+    async def stop_resumer(self) -> None:
+        if self._resumer is not None and not self._resumer.done():
+            self._resumer.cancel()
+            await asyncio.gather(self._resumer, return_exceptions=True)
+
+    async def drain(self) -> None:
+        self.draining = True
+        await self.stop_resumer()
+        self.inbox.stop_dispatch()
+
+        started = time.monotonic()
+        while self.inbox.running_count() or in_flight_runs():
+            if time.monotonic() - started >= self.timeout_seconds:
+                break
+            await asyncio.sleep(0.2)
+
+        turns = self.inbox.unfinished()
+        if turns:
+            try:
+                await self.queue.enqueue(turns)
+                handoff_events.inc(len(turns), kind="saved")
+            except Exception as e:
+                logger.error("Falha ao gravar %s turnos pendentes no desligamento: %s", len(turns), str(e))
+        logger.info("Drain concluído em %.1fs: %s turnos gravados para retomada, %s ainda em execução serão cancelados",
+                    time.monotonic() - started, len(turns), self.inbox.running_count())
+
+    async def resume(self, limit: int = 100) -> int:
+        """Retoma turnos gravados por workers que foram desligados. Retorna quantos foram retomados."""
+        turns = await self.queue.claim(limit)
+        for turn in turns:
+            await self.queue.complete(turn)
+            self.inbox.notify(turn.contact, turn.webhook_url, immediate=True, priority=turn.priority)
+        if turns:
+            handoff_events.inc(len(turns), kind="resumed")
+            logger.info("%s turnos pendentes retomados", len(turns))
+        return len(turns)
+
+    async def _resume_loop(self) -> None:
+        while True:
+            try:
+                await self.resume()
+            except Exception as e:
+                logger.error("Erro ao retomar turnos pendentes: %s", str(e))
+            await asyncio.sleep(self.poll_seconds)
+
+
+graceful_drain: GracefulDrain = GracefulDrain(conversations=inbox,
+                                              queue=durable_queue,
+                                              timeout_seconds=settings.DRAIN_TIMEOUT_SECONDS,
+                                              poll_seconds=settings.DRAIN_RESUME_POLL_SECONDS)
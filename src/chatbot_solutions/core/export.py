@@ -0,0 +1,61 @@
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import Text, cast, column, func, true
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.future import select
+
+from core.configs import settings
+from core.database import Session
+from models.usuario_model import UsuarioModel
+
+
+logger = logging.getLogger(__name__)
+
+
+def export_query(project: Optional[str] = None, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """
+    Uma linha por mensagem: o Postgres desmonta o histórico (jsonb_array_elements) e já monta o
+    JSON de cada linha como texto, então nenhuma conversa inteira passa pela memória do Python.
+    O período filtra pela última atividade da conversa (updated_at: última mensagem recebida ou turno
+    gravado; leases não contam, e nas conversas migradas vem do timestamp da última mensagem).
+    """
+    message = (func.jsonb_array_elements(UsuarioModel.messages)
+               .table_valued(column("value", JSONB), with_ordinality="ordinality")
+               .render_derived(name="m")
+               .lateral())
+    line = func.jsonb_build_object('conversation_id', UsuarioModel.id,
+                                   'project', UsuarioModel.project,
+                                   'protocol', UsuarioModel.protocol,
+                                   'phone', UsuarioModel.phone,
+                                   'nome', UsuarioModel.nome,
+                                   'created_at', UsuarioModel.created_at,
+                                   'updated_at', UsuarioModel.updated_at,
+                                   'index', message.c.ordinality - 1,
+                                   'type', message.c.value['type'],
+                                   'message', message.c.value)
+    query = (select(cast(line, Text).label("line"))
+             .select_from(UsuarioModel)
+             .join(message, true())
+             .order_by(UsuarioModel.id, message.c.ordinality))
+    if project is not None:
+        query = query.where(UsuarioModel.project == project)
+    if since is not None:
+        query = query.where(UsuarioModel.updated_at >= since)
+    if until is not None:
+        query = query.where(UsuarioModel.updated_at < until)
+    return query
+
+
+async def stream_ndjson(project: Optional[str] = None, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                        batch_size: int = settings.EXPORT_BATCH_SIZE) -> AsyncIterator[str]:
+    """
+    Exporta as mensagens em NDJSON por um cursor no servidor (session.stream com yield_per):
+    o banco entrega batch_size linhas por vez, com memória constante qualquer que seja o tamanho da tabela.
+    """
+    query = export_query(project, since, until).execution_options(yield_per=batch_size)
+    async with Session() as session:
+        result = await session.stream(query)
+        async for line in result.scalars():
+            yield line + "\n"
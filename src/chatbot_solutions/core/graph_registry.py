@@ -0,0 +1,126 @@
+import asyncio
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+GraphFactory = Callable[[], Any]
+
+
+class UnknownProjectError(KeyError):
+    """Projeto sem grafo registrado."""
+
+
+def import_graph(module: str, attr: str) -> GraphFactory:
+    """Factory que importa o módulo do grafo apenas quando ele é usado pela primeira vez."""
+    def factory() -> Any:
+        return getattr(importlib.import_module(module), attr)
+    return factory
+
+
+class GraphRegistry:
+    """
+    Mapeia nome do projeto -> factory do grafo compilado.
+    Cada grafo é construído no primeiro uso (ou no startup, se estiver em GRAPH_PRELOAD),
+    assim um worker que só atende HelpDesk não carrega o modelo de sentimento dos leads.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, GraphFactory] = {}
+        self._warmups: Dict[str, GraphFactory] = {}
+        self._assets: Dict[str, GraphFactory] = {}
+        self._graphs: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(self, project: str, factory: GraphFactory, warmup: Optional[GraphFactory] = None,
+                 assets: Optional[GraphFactory] = None) -> None:
+        """
+        warmup: factory da função de aquecimento do projeto, usada no lugar do turno sintético
+        quando o grafo tem efeitos colaterais (arquivos, e-mails) ou um modelo local a aquecer.
+        assets: factory da função que carrega as dependências pesadas que o módulo do grafo só
+        importa no primeiro uso (modelos, crewai); chamada em preload, antes do fork.
+        """
+        self._factories[project] = factory
+        self._graphs.pop(project, None)
+        for hooks, hook in ((self._warmups, warmup), (self._assets, assets)):
+            if hook is not None:
+                hooks[project] = hook
+            else:
+                hooks.pop(project, None)
+
+    def has(self, project: str) -> bool:
+        return project in self._factories
+
+    def projects(self) -> List[str]:
+        return list(self._factories)
+
+    def loaded(self) -> List[str]:
+        return list(self._graphs)
+
+    def get(self, project: str) -> Any:
+        graph = self._graphs.get(project)
+        if graph is not None:
+            return graph
+        if project not in self._factories:
+            raise UnknownProjectError(project)
+
+        with self._lock:
+            graph = self._graphs.get(project)
+            if graph is None:
+                started = time.perf_counter()
+                graph = self._factories[project]()
+                self._graphs[project] = graph
+                logger.info("Grafo '%s' carregado em %.2fs", project, time.perf_counter() - started)
+        return graph
+
+    async def aget(self, project: str) -> Any:
+        graph = self._graphs.get(project)
+        if graph is not None:
+            return graph
+        # Import/compilação pesados rodam fora do event loop
+        return await asyncio.to_thread(self.get, project)
+
+    def warmup_hook(self, project: str) -> Optional[Callable[[], Awaitable[Any]]]:
+        factory = self._warmups.get(project)
+        if factory is None:
+            return None
+
+        async def run() -> Any:
+            hook = factory()
+            if asyncio.iscoroutinefunction(hook):
+                return await hook()
+            return await asyncio.to_thread(hook)
+        return run
+
+    def _expand(self, projects: Iterable[str]) -> List[str]:
+        projects = list(projects)
+        return self.projects() if "*" in projects else projects
+
+    def preload(self, projects: Iterable[str]) -> None:
+        """Carrega os grafos e suas dependências pesadas no processo atual (ex.: master do gunicorn, antes do fork)."""
+        for project in self._expand(projects):
+            self.get(project)
+            if project in self._assets:
+                started = time.perf_counter()
+                self._assets[project]()()
+                logger.info("Dependências do grafo '%s' carregadas em %.2fs", project, time.perf_counter() - started)
+
+    async def apreload(self, projects: Iterable[str]) -> None:
+        for project in self._expand(projects):
+            await self.aget(project)
+
+
+graph_registry: GraphRegistry = GraphRegistry()
+
+graph_registry.register("Yamaha Cobrança IA", import_graph("graphs.graph_yamaha", "langgraph_app"))
+graph_registry.register("HelpDesk IA", import_graph("graphs.help_desk_graph", "APP"),
+                        assets=import_graph("graphs.help_desk_graph", "load_assets"))
+graph_registry.register("Qualificador Leads IA", import_graph("graphs.agent_graph_leads", "agent_graph_leads"),
+                        warmup=import_graph("graphs.agent_graph_leads", "warmup"),
+                        assets=import_graph("graphs.agent_graph_leads", "load_assets"))
+graph_registry.register("Qualificador Leads IA2", import_graph("graphs.leads_ia_project.graph", "leads_ia_graph"),
+                        assets=import_graph("graphs.leads_ia_project.graph", "load_assets"))
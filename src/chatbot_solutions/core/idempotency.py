@@ -0,0 +1,99 @@
+import hashlib
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, delete, func, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from core.configs import settings
+from core.bulkheads import bulkheads
+from models.idempotency_model import IdempotencyKeyModel
+from schemas.usuario_schema import Contact
+
+
+_TTL = timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+_CLAIM_TTL = timedelta(seconds=settings.IDEMPOTENCY_CLAIM_TTL_SECONDS)
+# A cada N chaves novas, apaga as expiradas
+_PURGE_EVERY = 1000
+_claims = 0
+
+
+def request_key(endpoint: str, contact: Contact, explicit: Optional[str], *parts: Optional[str]) -> Optional[str]:
+    """
+    Chave de idempotência da entrega: a informada pelo cliente ou, se todas as partes
+    estiverem presentes, as próprias partes (ex.: mensagem + timestamp). A chave gravada é
+    sempre um hash junto com o endpoint e a conversa (projeto + telefone + protocolo), então a
+    mesma chave usada em outra conversa ou em outro endpoint não devolve a resposta de lá.
+    """
+    if explicit:
+        parts = ("key", explicit)
+    elif not parts or any(not part for part in parts):
+        return None
+    scope = (endpoint, contact.project, contact.channel.phone, contact.protocol)
+    return hashlib.sha256("|".join(scope + tuple(parts)).encode("utf-8")).hexdigest()
+
+
+async def claim_key(session: AsyncSession, key: str) -> bool:
+    """
+    Reserva a chave na transação corrente (o commit fica com quem chama).
+    Retorna False se a mesma entrega já foi recebida dentro do TTL.
+    """
+    global _claims
+    _claims += 1
+    if _claims % _PURGE_EVERY == 0:
+        await session.execute(delete(IdempotencyKeyModel).where(IdempotencyKeyModel.created_at < func.now() - _TTL))
+
+    # Reserva sem resposta há mais de IDEMPOTENCY_CLAIM_TTL_SECONDS: a primeira entrega caiu no meio
+    expired = or_(IdempotencyKeyModel.created_at < func.now() - _TTL,
+                  and_(IdempotencyKeyModel.response.is_(None), IdempotencyKeyModel.created_at < func.now() - _CLAIM_TTL))
+    query = (insert(IdempotencyKeyModel)
+             .values(key=key, response=None, created_at=func.now())
+             .on_conflict_do_update(index_elements=[IdempotencyKeyModel.key],
+                                    set_={"response": None, "created_at": func.now()},
+                                    where=expired)
+             .returning(IdempotencyKeyModel.key))
+    result = await session.execute(query)
+    return result.first() is not None
+
+
+async def drop_claim(session: AsyncSession, key: str) -> None:
+    """Apaga a reserva (ainda sem resposta) na transação corrente; o commit fica com quem chama."""
+    await session.execute(delete(IdempotencyKeyModel)
+                          .where(IdempotencyKeyModel.key == key, IdempotencyKeyModel.response.is_(None)))
+
+
+async def release_key(session: AsyncSession, key: str) -> None:
+    """Desfaz a reserva de uma entrega que falhou antes de ter resposta, para a reentrega ser aceita."""
+    await session.rollback()
+    await drop_claim(session, key)
+    await session.commit()
+
+
+async def stored_response(session: AsyncSession, key: str) -> Optional[Dict[str, Any]]:
+    """Resposta gravada para a chave, ou None se a primeira entrega ainda não terminou."""
+    result = await session.execute(select(IdempotencyKeyModel.response).where(IdempotencyKeyModel.key == key))
+    return result.scalar_one_or_none()
+
+
+async def replay_response(session: AsyncSession, key: str) -> Optional[Dict[str, Any]]:
+    """
+    Resposta da entrega original, com o status do job atualizado, para devolver a uma reentrega.
+    None se a entrega original ainda não terminou de ser registrada.
+    """
+    response = await stored_response(session, key)
+    if response is None:
+        return None
+
+    job = bulkheads.get(response.get("job_id") or "")
+    if job:
+        response = dict(response, status=job.status.value)
+    return response
+
+
+async def store_response(session: AsyncSession, key: str, response: Dict[str, Any]) -> None:
+    await session.execute(update(IdempotencyKeyModel)
+                          .where(IdempotencyKeyModel.key == key)
+                          .values(response=response))
+    await session.commit()
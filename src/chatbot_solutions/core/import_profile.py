@@ -0,0 +1,96 @@
+import logging
+import os
+import sys
+import threading
+import time
+from importlib.abc import MetaPathFinder
+from typing import Dict, List, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class ImportProfiler(MetaPathFinder):
+    """
+    Mede o tempo de import de cada módulo, como `python -X importtime`, mas dentro do processo:
+    o resumo sai no log do startup. Fica no início de sys.meta_path e envolve o exec_module do
+    loader encontrado pelos demais finders; não altera o que é importado.
+    Ativado com IMPORT_PROFILE=1 (lido do ambiente, antes de qualquer import pesado).
+    """
+
+    def __init__(self):
+        # módulo -> (tempo total incluindo submódulos, tempo próprio)
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        self._local = threading.local()
+        self._installed = False
+
+    def install(self) -> None:
+        if self._installed:
+            return
+        sys.meta_path.insert(0, self)
+        self._installed = True
+
+    def uninstall(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+        self._installed = False
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            loader = spec.loader
+            # Loaders de builtins/frozen são classes compartilhadas: ficam de fora (são instantâneos)
+            if loader is not None and not isinstance(loader, type) and hasattr(loader, "exec_module"):
+                try:
+                    loader.exec_module = self._timed(fullname, loader.exec_module)
+                except (AttributeError, TypeError):
+                    pass
+            return spec
+        return None
+
+    def _timed(self, fullname: str, exec_module):
+        def exec_and_measure(module):
+            stack: List[float] = self._local.__dict__.setdefault("children", [])
+            stack.append(0.0)
+            started = time.perf_counter()
+            try:
+                return exec_module(module)
+            finally:
+                total = time.perf_counter() - started
+                children = stack.pop()
+                self.timings[fullname] = (total, total - children)
+                if stack:
+                    stack[-1] += total
+        return exec_and_measure
+
+    def report(self, top: int = 20) -> str:
+        if not self.timings:
+            return "Perfil de imports vazio (IMPORT_PROFILE desativado?)"
+        packages: Dict[str, float] = {}
+        for name, (_, own) in self.timings.items():
+            root = name.split(".")[0]
+            packages[root] = packages.get(root, 0.0) + own
+
+        lines = [f"Perfil de imports: {len(self.timings)} módulos, {sum(packages.values()):.2f}s"]
+        lines.append("Por pacote (tempo próprio somado):")
+        for root, own in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+            lines.append(f"  {own * 1000:9.1f} ms  {root}")
+        lines.append("Módulos mais lentos (total | próprio):")
+        slowest = sorted(self.timings.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        for name, (total, own) in slowest:
+            lines.append(f"  {total * 1000:9.1f} ms | {own * 1000:9.1f} ms  {name}")
+        return "\n".join(lines)
+
+    def log_report(self, stage: str) -> None:
+        if self._installed:
+            logger.info("%s\n%s", stage, self.report())
+
+
+import_profiler: ImportProfiler = ImportProfiler()
+
+if os.getenv("IMPORT_PROFILE", "").lower() in ("1", "true", "yes"):
+    import_profiler.install()
@@ -0,0 +1,174 @@
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict
+from pydantic import ValidationError
+
+from core.database import engine
+from core.graph_registry import graph_registry
+from schemas.usuario_schema import ConversationImportSchema
+
+
+logger = logging.getLogger(__name__)
+
+# Timestamps sem fuso são do horário de Brasília, como os gravados por /chat
+br_tz = ZoneInfo("America/Sao_Paulo")
+
+_COLUMNS = ("protocol", "project", "nome", "document", "phone", "email", "messages", "created_at", "updated_at")
+
+# Tabela de staging por lote: o COPY vai para ela e um único INSERT ... SELECT passa para usuarios
+# só as conversas que ainda não existem. ON CONFLICT no índice único ix_usuarios_conversa: reimportar
+# o mesmo arquivo não duplica protocolos e uma conversa criada por /chat durante o lote não o aborta
+_STAGING_DDL = """
+CREATE TEMP TABLE usuarios_import (
+    protocol varchar(256), project varchar(256), nome varchar(256), document varchar(256),
+    phone varchar(256), email varchar(256), messages jsonb, created_at timestamptz, updated_at timestamptz
+) ON COMMIT DROP
+"""
+_INSERT_SQL = """
+INSERT INTO usuarios (protocol, project, nome, document, phone, email, messages, processing, created_at, updated_at)
+SELECT DISTINCT ON (i.project, i.phone, i.protocol)
+       i.protocol, i.project, i.nome, i.document, i.phone, i.email, i.messages, false,
+       coalesce(i.created_at, now()), coalesce(i.updated_at, now())
+FROM usuarios_import i
+ORDER BY i.project, i.phone, i.protocol
+ON CONFLICT (project, phone, protocol) DO NOTHING
+"""
+
+Record = Tuple[str, str, Optional[str], Optional[str], str, Optional[str], str, Optional[datetime], Optional[datetime]]
+
+
+@dataclass
+class ImportStats:
+    lines: int = 0
+    invalid: int = 0
+    conversations: int = 0
+    messages: int = 0
+    inserted: int = 0
+    # Conversas que já existiam no banco (ou repetidas no mesmo lote)
+    skipped: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def rate(self) -> float:
+        """Conversas copiadas por segundo (novas e já existentes)."""
+        elapsed = time.monotonic() - self.started_at
+        return (self.inserted + self.skipped) / elapsed if elapsed else 0.0
+
+    def message_rate(self) -> float:
+        """Mensagens lidas e convertidas por segundo."""
+        elapsed = time.monotonic() - self.started_at
+        return self.messages / elapsed if elapsed else 0.0
+
+
+def _parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=br_tz)
+
+
+def _key(conversation: ConversationImportSchema) -> Tuple[str, str, str]:
+    contact = conversation.contact
+    return contact.project, contact.channel.phone, contact.protocol
+
+
+def _check(conversation: ConversationImportSchema) -> None:
+    """As mesmas regras de /chat: projeto com grafo registrado e mensagens não vazias."""
+    if not graph_registry.has(conversation.contact.project):
+        raise ValueError(f"Projeto não encontrado: {conversation.contact.project}")
+    if not conversation.messages:
+        raise ValueError("Conversa sem mensagens")
+    for message in conversation.messages:
+        if not message.message:
+            raise ValueError("A mensagem não pode estar em branco")
+        if message.timestamp:
+            _parse_timestamp(message.timestamp)
+
+
+def read_conversations(paths: Iterable[str], stats: ImportStats) -> Iterator[ConversationImportSchema]:
+    """
+    Lê e valida os arquivos NDJSON (uma conversa por linha). Linhas inválidas são registradas e
+    puladas; linhas seguidas da mesma conversa (arquivos partidos por mensagem) viram uma só.
+    """
+    current: Optional[ConversationImportSchema] = None
+    for path in paths:
+        with open(path, encoding="utf-8") as file:
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                stats.lines += 1
+                try:
+                    conversation = ConversationImportSchema.model_validate_json(line)
+                    _check(conversation)
+                except (ValidationError, ValueError) as e:
+                    stats.invalid += 1
+                    logger.error("%s:%s ignorada: %s", path, number, str(e).replace("\n", " ")[:300])
+                    continue
+                if current is not None and _key(current) == _key(conversation):
+                    current.messages.extend(conversation.messages)
+                    continue
+                if current is not None:
+                    yield current
+                current = conversation
+    if current is not None:
+        yield current
+
+
+# Formato gravado pelos turnos (messages_to_dict), serializado uma vez por papel: montar um
+# HumanMessage/AIMessage por mensagem custava a maior parte do tempo da importação
+_TEMPLATES = {message.type: message_to_dict(message) for message in (HumanMessage(content=""), AIMessage(content=""))}
+
+
+def _stored_message(role: str, content: str, metadata: dict) -> dict:
+    template = _TEMPLATES[role]
+    return {**template, "data": {**template["data"], "content": content, "metadata": metadata}}
+
+
+def to_record(conversation: ConversationImportSchema) -> Record:
+    """Linha de usuarios no formato gravado pelos turnos (timestamp no metadata, como em /chat)."""
+    stored = []
+    timestamps: List[datetime] = []
+    for message in conversation.messages:
+        metadata = {"timestamp": message.timestamp} if message.timestamp else {}
+        if message.timestamp:
+            timestamps.append(_parse_timestamp(message.timestamp))
+        stored.append(_stored_message(message.role, message.message, metadata))
+
+    contact = conversation.contact
+    return (contact.protocol, contact.project, contact.name, contact.document, contact.channel.phone,
+            contact.channel.email, json.dumps(stored, ensure_ascii=False),
+            min(timestamps) if timestamps else None, max(timestamps) if timestamps else None)
+
+
+async def _copy_batch(driver, batch: List[Record], stats: ImportStats) -> None:
+    async with driver.transaction():
+        await driver.execute(_STAGING_DDL)
+        await driver.copy_records_to_table("usuarios_import", records=batch, columns=_COLUMNS)
+        status = await driver.execute(_INSERT_SQL)
+    # "INSERT 0 n": n é o número de conversas novas; as demais já existiam (DO NOTHING)
+    inserted = int(status.split()[-1])
+    stats.inserted += inserted
+    stats.skipped += len(batch) - inserted
+    logger.info("Lote de %s conversas: %s novas (total %s, %.0f conversas/s)", len(batch), inserted, stats.inserted + stats.skipped, stats.rate())
+
+
+async def import_conversations(paths: Iterable[str], batch_size: int) -> ImportStats:
+    """Valida, converte e carrega as conversas com COPY (asyncpg) em lotes de batch_size."""
+    stats = ImportStats()
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        driver = raw.driver_connection
+        batch: List[Record] = []
+        for conversation in read_conversations(paths, stats):
+            batch.append(to_record(conversation))
+            stats.conversations += 1
+            stats.messages += len(conversation.messages)
+            if len(batch) >= batch_size:
+                await _copy_batch(driver, batch, stats)
+                batch = []
+        if batch:
+            await _copy_batch(driver, batch, stats)
+    return stats
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.configs import settings
+from core.bulkheads import Bulkheads, bulkheads
+from core.jobs import Job, JobStatus, QueueFullError
+from core.tool_results import ToolResultsPendingError
+from core.turn_queue import JOB_PREFIX, durable_queue
+from core.turns import ConversationBusyError, run_pending_turn
+from schemas.usuario_schema import Contact
+
+
+logger = logging.getLogger(__name__)
+
+ConversationKey = Tuple[str, str, str]
+
+
+def conversation_key(contact: Contact) -> ConversationKey:
+    return (contact.project, contact.channel.phone, contact.protocol)
+
+
+def turn_priority(project: str, requested: Optional[int] = None, boost: int = 0) -> int:
+    """Prioridade informada no pedido (ou o padrão do projeto), limitada a 0..PRIORITY_MAX, mais o boost."""
+    base = settings.PRIORITY_DEFAULTS.get(project, 0) if requested is None else requested
+    return max(0, min(base, settings.PRIORITY_MAX)) + boost
+
+
+@dataclass
+class _Pending:
+    contact: Contact
+    webhook_url: str
+    job: Optional[Job] = None
+    first_at: float = field(default_factory=time.monotonic)
+    timer: Optional[asyncio.TimerHandle] = None
+    ready: bool = False
+
+
+class ConversationInbox:
+    """
+    Caixa de entrada por conversa.
+    As mensagens já estão gravadas no histórico; aqui só se decide quando rodar o grafo.
+    Mensagens que chegam durante a janela de debounce, ou enquanto um turno da mesma
+    conversa está em execução, são respondidas juntas no próximo turno (um único job).
+    Durante o drain (desligamento) nada novo é despachado: os turnos não iniciados ficam
+    em _pending para serem gravados e retomados por outro worker.
+    """
+
+    def __init__(self, pools: Bulkheads, debounce_seconds: float, max_wait_seconds: float,
+                 runner: Callable[[Contact, str], Awaitable[Any]] = run_pending_turn):
+        self.pools = pools
+        self.debounce_seconds = debounce_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.runner = runner
+        self._pending: Dict[ConversationKey, _Pending] = {}
+        self._running: Dict[ConversationKey, _Pending] = {}
+        self.draining = False
+
+    def notify(self, contact: Contact, webhook_url: str, immediate: bool = False, priority: Optional[int] = None) -> Job:
+        """
+        Registra que a conversa tem mensagem nova e devolve o job que vai respondê-la.
+        immediate=True dispensa a janela de debounce (ex.: resultados de ferramentas).
+        priority=None usa o padrão do projeto; mensagens agrupadas ficam com a maior prioridade.
+        """
+        if priority is None:
+            priority = turn_priority(contact.project)
+        key = conversation_key(contact)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = _Pending(contact=contact, webhook_url=webhook_url)
+            pending.job = self.pools.for_project(contact.project).create(lambda: self._flush(key, pending), priority=priority,
+                                            project=contact.project, protocol=contact.protocol)
+            self._pending[key] = pending
+        else:
+            pending.contact = contact
+            pending.webhook_url = webhook_url
+            if not pending.ready:
+                pending.job.priority = max(pending.job.priority, priority)
+
+        if not pending.ready and not self.draining:
+            self._schedule(key, pending, 0.0 if immediate else self._delay(pending))
+        return pending.job
+
+    def _delay(self, pending: _Pending) -> float:
+        remaining = pending.first_at + self.max_wait_seconds - time.monotonic()
+        return max(0.0, min(self.debounce_seconds, remaining))
+
+    def _schedule(self, key: ConversationKey, pending: _Pending, delay: float) -> None:
+        if pending.timer is not None:
+            pending.timer.cancel()
+        pending.timer = asyncio.get_running_loop().call_later(delay, self._dispatch, key, pending)
+
+    def _dispatch(self, key: ConversationKey, pending: _Pending) -> None:
+        pending.timer = None
+        pending.ready = True
+        if self._pending.get(key) is not pending or key in self._running or self.draining:
+            # O turno em execução despacha este ao terminar
+            return
+        try:
+            self.pools.for_project(key[0]).enqueue(pending.job)
+        except QueueFullError:
+            logger.warning("Fila cheia, reagendando turno da conversa %s", key[2])
+            pending.ready = False
+            self._schedule(key, pending, self.debounce_seconds)
+
+    async def _flush(self, key: ConversationKey, pending: _Pending) -> Any:
+        if self.draining:
+            # Job que já estava na fila: continua em _pending e é gravado pelo drain
+            return None
+        if self._pending.get(key) is pending:
+            del self._pending[key]
+        self._running[key] = pending
+        try:
+            return await self.runner(pending.contact, pending.webhook_url)
+        except ConversationBusyError:
+            # Turno em execução em outro processo: tenta de novo depois da janela
+            self._requeue(key, pending, self.debounce_seconds)
+            return None
+        except ToolResultsPendingError as e:
+            # Faltam resultados da tool call: o último a chegar antecipa o turno (immediate)
+            self._requeue(key, pending, e.retry_after)
+            return None
+        finally:
+            self._running.pop(key, None)
+            following = self._pending.get(key)
+            if following is not None and following.ready:
+                self._dispatch(key, following)
+
+    def _requeue(self, key: ConversationKey, pending: _Pending, delay: float) -> None:
+        following = self._pending.get(key)
+        if following is None:
+            retry = _Pending(contact=pending.contact, webhook_url=pending.webhook_url)
+            retry.job = self.pools.for_project(key[0]).create(lambda: self._flush(key, retry), priority=pending.job.priority,
+                                          project=pending.contact.project, protocol=pending.contact.protocol)
+            self._pending[key] = retry
+            if not self.draining:
+                self._schedule(key, retry, delay)
+            following = retry
+        pending.job.meta["requeued_as"] = following.job.id
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def running_count(self) -> int:
+        return len(self._running)
+
+    def stop_dispatch(self) -> None:
+        """Início do drain: cancela as janelas de debounce e deixa de despachar turnos."""
+        self.draining = True
+        for pending in self._pending.values():
+            if pending.timer is not None:
+                pending.timer.cancel()
+                pending.timer = None
+
+    def unfinished(self) -> List[Tuple[Contact, str, int]]:
+        """Turnos ainda sem resposta (não iniciados e em execução): (contato, webhook, prioridade)."""
+        turns: Dict[ConversationKey, Tuple[Contact, str, int]] = {}
+        for key, pending in list(self._running.items()) + list(self._pending.items()):
+            previous = turns.get(key)
+            priority = max(pending.job.priority, previous[2] if previous else 0)
+            turns[key] = (pending.contact, pending.webhook_url, priority)
+        return list(turns.values())
+
+
+inbox: ConversationInbox = ConversationInbox(pools=bulkheads,
+                                             debounce_seconds=settings.CHAT_DEBOUNCE_SECONDS,
+                                             max_wait_seconds=settings.CHAT_COALESCE_MAX_WAIT_SECONDS)
+
+
+async def submit_turn(contact: Contact, webhook_url: str, immediate: bool = False,
+                      priority: Optional[int] = None) -> Tuple[str, JobStatus]:
+    """
+    Agenda o turno da conversa conforme TURN_QUEUE e devolve (job_id, status).
+    memory: job na inbox deste nó. postgres: linha na fila durável, executada por worker.py.
+    """
+    if priority is None:
+        priority = turn_priority(contact.project)
+    if settings.TURN_QUEUE == "postgres":
+        delay = 0.0 if immediate else settings.CHAT_DEBOUNCE_SECONDS
+        turn_id, = await durable_queue.enqueue([(contact, webhook_url, priority)], delay=delay)
+        return f"{JOB_PREFIX}{turn_id}", JobStatus.QUEUED
+    job = inbox.notify(contact=contact, webhook_url=webhook_url, immediate=immediate, priority=priority)
+    return job.id, job.status
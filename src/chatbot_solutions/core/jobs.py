@@ -0,0 +1,170 @@
+import asyncio
+import itertools
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """A fila de execução de grafos atingiu o limite configurado."""
+
+
+@dataclass
+class Job:
+    func: Callable[[], Awaitable[Any]]
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: JobStatus = JobStatus.QUEUED
+    result: Any = None
+    error: Optional[str] = None
+    meta: Dict[str, Any] = field(default_factory=dict)
+    priority: int = 0
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+class JobQueue:
+    """
+    Fila limitada em memória servida por um pool fixo de workers.
+    O endpoint só registra o turno e enfileira; a execução do grafo acontece nos workers.
+
+    A fila é ordenada por prioridade com envelhecimento: cada nível de prioridade vale
+    aging_seconds de espera, então um job comum que já esperou o bastante passa à frente
+    de um prioritário recém-chegado e nenhum turno fica parado indefinidamente.
+    """
+
+    def __init__(self, maxsize: int, workers: int, result_ttl: int, name: str = "default", aging_seconds: float = 10.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.aging_seconds = aging_seconds
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=maxsize)
+        # Desempate FIFO entre jobs com a mesma chave
+        self._sequence = itertools.count()
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+        # Vagas de execução: usadas pelos workers e pelas execuções diretas (streaming, lote com wait)
+        self._slots = asyncio.Semaphore(workers)
+        self._running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        # Média móvel da duração dos jobs, usada para estimar o Retry-After
+        self.avg_run_seconds = 5.0
+
+    async def start(self) -> None:
+        self.start_workers()
+
+    def start_workers(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info("Fila de jobs '%s' iniciada com %s workers (maxsize=%s)", self.name, self.workers, self.maxsize)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def create(self, func: Callable[[], Awaitable[Any]], priority: int = 0, **meta: Any) -> Job:
+        """Registra o job (consultável pelo id) sem colocá-lo na fila ainda."""
+        self._prune()
+        job = Job(func=func, meta=meta, priority=priority)
+        self._jobs[job.id] = job
+        return job
+
+    def enqueue(self, job: Job) -> Job:
+        # Menor chave sai primeiro: o job "chega" priority * aging_seconds mais cedo
+        key = time.monotonic() - job.priority * self.aging_seconds
+        try:
+            self._queue.put_nowait((key, next(self._sequence), job))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"Fila de jobs '{self.name}' cheia ({self.maxsize})")
+        return job
+
+    def submit(self, func: Callable[[], Awaitable[Any]], priority: int = 0, **meta: Any) -> Job:
+        job = self.create(func, priority=priority, **meta)
+        try:
+            return self.enqueue(job)
+        except QueueFullError:
+            del self._jobs[job.id]
+            raise
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def saturation(self) -> float:
+        return self._running / max(self.workers, 1)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Ocupa uma vaga de execução deste pool enquanto o bloco roda."""
+        async with self._slots:
+            self._running += 1
+            try:
+                yield
+            finally:
+                self._running -= 1
+
+    def estimated_wait(self) -> float:
+        """Tempo estimado até um job entrando agora começar a rodar."""
+        return self.avg_run_seconds * (self.depth + 1) / max(self.workers, 1)
+
+    def _prune(self) -> None:
+        limit = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < limit]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                async with self.slot():
+                    job.status = JobStatus.RUNNING
+                    job.started_at = time.time()
+                    try:
+                        job.result = await job.func()
+                        job.status = JobStatus.DONE
+                        self.completed += 1
+                    except asyncio.CancelledError:
+                        job.status = JobStatus.FAILED
+                        job.error = 'cancelled'
+                        raise
+                    except Exception as e:
+                        job.status = JobStatus.FAILED
+                        job.error = str(e)
+                        self.failed += 1
+                        logger.exception("Job %s falhou no worker %s/%s: %s", job.id, self.name, index, str(e))
+                    finally:
+                        job.finished_at = time.time()
+                        self.avg_run_seconds = 0.9 * self.avg_run_seconds + 0.1 * (job.finished_at - job.started_at)
+            finally:
+                self._queue.task_done()
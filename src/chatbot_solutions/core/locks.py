@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import AsyncIterator
+
+from sqlalchemy import and_, func, or_, update
+
+from core.configs import settings
+from core.database import Session
+from models.usuario_model import UsuarioModel
+from schemas.usuario_schema import Contact
+
+
+logger = logging.getLogger(__name__)
+
+# Identifica o processo dono do lease (útil para depurar conversas presas)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _conversation_filter(contact: Contact):
+    return and_(UsuarioModel.phone == contact.channel.phone,
+                UsuarioModel.project == contact.project,
+                UsuarioModel.protocol == contact.protocol)
+
+
+class ConversationLease:
+    """
+    Lock de conversa com prazo de validade, adquirido com um único UPDATE condicional
+    (compare-and-set), seguro entre vários nós da API.
+    Enquanto o turno roda, um heartbeat renova o prazo; se o processo morrer,
+    o lease expira e o próximo turno assume a conversa sem limpeza manual no banco.
+    """
+
+    def __init__(self, contact: Contact,
+                 ttl_seconds: int = settings.LEASE_TTL_SECONDS,
+                 heartbeat_seconds: int = settings.LEASE_HEARTBEAT_SECONDS):
+        self.contact = contact
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.heartbeat_seconds = heartbeat_seconds
+        self.token = f"{WORKER_ID}:{uuid.uuid4().hex[:12]}"
+        self.held = False
+        self.lost = False
+
+    async def acquire(self) -> bool:
+        query = (update(UsuarioModel)
+                 .where(_conversation_filter(self.contact),
+                        or_(UsuarioModel.lease_owner.is_(None),
+                            UsuarioModel.lease_expires_at.is_(None),
+                            UsuarioModel.lease_expires_at < func.now()))
+                 .values(lease_owner=self.token,
+                         lease_expires_at=func.now() + self.ttl,
+                         processing=True,
+                         # Lease não é atividade da conversa: updated_at fica como estava
+                         updated_at=UsuarioModel.updated_at)
+                 .returning(UsuarioModel.id))
+        async with Session() as session:
+            result = await session.execute(query)
+            acquired = result.first() is not None
+            await session.commit()
+        self.held = acquired
+        return acquired
+
+    async def renew(self) -> bool:
+        query = (update(UsuarioModel)
+                 .where(_conversation_filter(self.contact), UsuarioModel.lease_owner == self.token)
+                 .values(lease_expires_at=func.now() + self.ttl, updated_at=UsuarioModel.updated_at)
+                 .returning(UsuarioModel.id))
+        async with Session() as session:
+            result = await session.execute(query)
+            renewed = result.first() is not None
+            await session.commit()
+        if not renewed:
+            self.lost = True
+            logger.warning("Lease da conversa %s perdido (expirou e foi assumido por outro worker)", self.contact.protocol)
+        return renewed
+
+    async def release(self) -> None:
+        if not self.held:
+            return
+        query = (update(UsuarioModel)
+                 .where(_conversation_filter(self.contact), UsuarioModel.lease_owner == self.token)
+                 .values(lease_owner=None, lease_expires_at=None, processing=False,
+                         updated_at=UsuarioModel.updated_at))
+        async with Session() as session:
+            await session.execute(query)
+            await session.commit()
+        self.held = False
+
+    @asynccontextmanager
+    async def keep_alive(self) -> AsyncIterator["ConversationLease"]:
+        """Renova o lease periodicamente enquanto o bloco executa."""
+        async def beat() -> None:
+            while True:
+                await asyncio.sleep(self.heartbeat_seconds)
+                try:
+                    if not await self.renew():
+                        return
+                except Exception as e:
+                    logger.error("Erro ao renovar lease da conversa %s: %s", self.contact.protocol, str(e))
+
+        task = asyncio.create_task(beat())
+        try:
+            yield self
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
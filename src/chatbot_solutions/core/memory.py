@@ -0,0 +1,41 @@
+import os
+import resource
+from typing import Dict, Iterable
+
+from core.metrics import Sample, register_collector
+
+
+def process_memory() -> Dict[str, int]:
+    """
+    Memória do processo atual em bytes.
+    rss conta as páginas compartilhadas com o master (copy-on-write) em cada worker;
+    pss divide essas páginas entre os processos que as usam e é a medida certa da economia
+    do preload. private é o que só este worker usa.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            values = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[2] == "kB":
+                    values[parts[0].rstrip(":")] = int(parts[1]) * 1024
+        return {"rss": values.get("Rss", 0),
+                "pss": values.get("Pss", 0),
+                "shared": values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0),
+                "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)}
+    except OSError:
+        # Fora do Linux só há o pico de RSS
+        return {"rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+def describe_memory() -> str:
+    return ", ".join(f"{kind}={value / (1024 * 1024):.0f}MB" for kind, value in process_memory().items())
+
+
+def collect() -> Iterable[Sample]:
+    labels = {"pid": str(os.getpid())}
+    for kind, value in process_memory().items():
+        yield f"chatbot_process_memory_{kind}_bytes", "gauge", f"Memória {kind} do worker", labels, value
+
+
+register_collector(collect)
@@ -0,0 +1,57 @@
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+
+# (nome, tipo, descrição, labels, valor)
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+_collectors: List[Callable[[], Iterable[Sample]]] = []
+
+
+class Counter:
+    """Contador monotônico com labels, exportado no formato texto do Prometheus."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+        register_collector(self.collect)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> Iterable[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, "counter", self.description, dict(key), value
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]) -> None:
+    """Registra uma função chamada a cada scrape (útil para gauges calculados na hora)."""
+    _collectors.append(collector)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = {k: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for k, v in labels.items()}
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(escaped.items())) + "}"
+
+
+def render() -> str:
+    # O formato exige as amostras de uma métrica agrupadas sob o mesmo HELP/TYPE
+    grouped: Dict[str, Tuple[str, str, List[str]]] = {}
+    for collector in _collectors:
+        for name, kind, description, labels, value in collector():
+            grouped.setdefault(name, (kind, description, []))[2].append(f"{name}{_format_labels(labels)} {value}")
+
+    lines: List[str] = []
+    for name, (kind, description, samples) in grouped.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,30 @@
+import logging
+import os
+from typing import Optional
+
+from openai import AsyncOpenAI
+
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[AsyncOpenAI] = None
+
+
+def _get_client() -> AsyncOpenAI:
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+
+async def is_flagged(text: str) -> bool:
+    """
+    True se o texto foi sinalizado pela moderação da OpenAI.
+    Em caso de erro segue sem bloquear, como a moderação dos grafos.
+    """
+    try:
+        response = await _get_client().moderations.create(model="omni-moderation-latest", input=text or "")
+        return bool(response.results[0].flagged)
+    except Exception as e:
+        logger.error("Erro na moderação, prosseguindo sem bloquear: %s", str(e))
+        return False
@@ -0,0 +1,73 @@
+import math
+import time
+from typing import Hashable
+
+from cachetools import TTLCache
+
+from core.configs import settings
+from core.bulkheads import bulkheads
+from core.turn_queue import durable_queue
+from core.turns import in_flight_runs
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float):
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, rate: float, capacity: float) -> float:
+        """Consome um token. Retorna 0 se havia token, senão os segundos até o próximo."""
+        now = time.monotonic()
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class RateLimiter:
+    """Token bucket por chave; buckets ociosos expiram para a memória não crescer com os contatos."""
+
+    def __init__(self, per_minute: float, burst: int, max_keys: int = 100_000):
+        self.rate = per_minute / 60.0
+        self.capacity = float(max(burst, 1))
+        idle_ttl = self.capacity / self.rate if self.rate > 0 else 60
+        self._buckets: TTLCache = TTLCache(maxsize=max_keys, ttl=idle_ttl)
+
+    def acquire(self, key: Hashable) -> float:
+        if self.rate <= 0:
+            return 0.0
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.capacity)
+        wait = bucket.take(self.rate, self.capacity)
+        # Reinsere para renovar o TTL do bucket
+        self._buckets[key] = bucket
+        return wait
+
+
+contact_limiter: RateLimiter = RateLimiter(per_minute=settings.RATE_LIMIT_PER_MINUTE, burst=settings.RATE_LIMIT_BURST)
+
+
+async def backpressure_retry_after(project: str) -> int:
+    """0 se há capacidade para o projeto; senão o Retry-After sugerido em segundos."""
+    queue = bulkheads.for_project(project)
+    max_depth = min(settings.BACKPRESSURE_MAX_QUEUE_DEPTH, queue.maxsize)
+    if settings.TURN_QUEUE == "postgres":
+        # Os turnos esperam em pending_turns e rodam nos workers (worker.py): a fila e as
+        # execuções deste nó da API ficam vazias, vale a profundidade da fila compartilhada
+        depth = await durable_queue.depth(project)
+        if depth < max_depth:
+            return 0
+        return min(60, max(1, math.ceil(queue.avg_run_seconds * (depth + 1) / max(queue.workers, 1))))
+    if queue.depth < max_depth and in_flight_runs() < settings.BACKPRESSURE_MAX_IN_FLIGHT:
+        return 0
+    return min(60, max(1, math.ceil(queue.estimated_wait())))
+
+
+def contact_retry_after(project: str, phone: str) -> int:
+    wait = contact_limiter.acquire((project, phone))
+    return math.ceil(wait) if wait else 0
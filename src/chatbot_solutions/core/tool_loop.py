@@ -0,0 +1,97 @@
+import json
+import logging
+from typing import Any, Dict, List, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.prebuilt import ToolNode
+
+from core.configs import settings
+from core.metrics import Counter
+
+
+logger = logging.getLogger(__name__)
+
+tool_loop_events = Counter("chatbot_tool_loop_total",
+                           "Ciclos de ferramentas: chamadas repetidas respondidas do cache (cached) e turnos encerrados "
+                           "pelo limite de rodadas (step_budget) ou de repetições (repeated)")
+
+
+def _call_key(call: Dict[str, Any]) -> Tuple[str, str]:
+    return call["name"], json.dumps(call.get("args") or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _turn_messages(messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """Mensagens do turno atual: as que vêm depois da última mensagem do usuário."""
+    for index in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[index], HumanMessage):
+            return list(messages[index + 1:])
+    return list(messages)
+
+
+def route_after_tools(state: Dict[str, Any]) -> str:
+    """Depois das ferramentas: "end" se o GuardedToolNode encerrou o turno, senão "agent"."""
+    last = state["messages"][-1]
+    if isinstance(last, AIMessage) and not last.tool_calls:
+        return "end"
+    return "agent"
+
+
+class GuardedToolNode:
+    """
+    ToolNode com orçamento por turno para os ciclos agent -> ferramentas -> agent.
+    O histórico do turno (depois da última mensagem do usuário) serve de cache: uma chamada
+    idêntica (mesma ferramenta e argumentos) a uma anterior recebe o resultado já obtido, sem
+    chamar a ferramenta de novo. Passando de max_steps rodadas de ferramentas ou de max_repeats
+    chamadas repetidas, as chamadas pendentes não são executadas e o turno termina com
+    fallback_message (o grafo deve ligar o nó ao agente com route_after_tools).
+    Como o estado vem do histórico, vale igual para jobs, streaming e retomadas de checkpoint.
+    """
+
+    def __init__(self, tools: Sequence[Any], project: str, max_steps: int = settings.TOOL_MAX_STEPS,
+                 max_repeats: int = settings.TOOL_MAX_REPEATS,
+                 fallback_message: str = settings.TOOL_LOOP_FALLBACK_MESSAGE):
+        self.tool_node = ToolNode(tools)
+        self.project = project
+        self.max_steps = max_steps
+        self.max_repeats = max_repeats
+        self.fallback_message = fallback_message
+
+    async def __call__(self, state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+        turn = _turn_messages(state["messages"])
+        request = turn[-1]
+        calls = list(request.tool_calls)
+
+        # Resultados anteriores do turno, por (ferramenta, argumentos)
+        keys = {call["id"]: _call_key(call) for m in turn[:-1] if isinstance(m, AIMessage) for call in m.tool_calls}
+        cache = {keys[m.tool_call_id]: m for m in turn if isinstance(m, ToolMessage) and m.tool_call_id in keys}
+        steps = sum(1 for m in turn if isinstance(m, AIMessage) and m.tool_calls)
+        repeats = sum(1 for m in turn if isinstance(m, ToolMessage) and m.additional_kwargs.get("cached"))
+
+        cached = [call for call in calls if _call_key(call) in cache]
+        repeats += len(cached)
+        if steps > self.max_steps or repeats > self.max_repeats:
+            kind = "repeated" if repeats > self.max_repeats else "step_budget"
+            tool_loop_events.inc(project=self.project, kind=kind)
+            logger.warning("Turno do projeto '%s' encerrado no ciclo de ferramentas (%s: %s rodadas, %s repetições)",
+                           self.project, kind, steps, repeats)
+            skipped = [ToolMessage(tool_call_id=call["id"], name=call["name"], status="error",
+                                   content=settings.TOOL_LOOP_SKIPPED_MESSAGE)
+                       for call in calls]
+            return {"messages": skipped + [AIMessage(content=self.fallback_message)]}
+
+        results: Dict[str, ToolMessage] = {}
+        for call in cached:
+            previous = cache[_call_key(call)]
+            results[call["id"]] = ToolMessage(tool_call_id=call["id"], name=call["name"], content=previous.content,
+                                              status=previous.status, additional_kwargs={"cached": True})
+        if cached:
+            tool_loop_events.inc(len(cached), project=self.project, kind="cached")
+
+        pending = [call for call in calls if call["id"] not in results]
+        if pending:
+            executed = await self.tool_node.ainvoke({"messages": [request.model_copy(update={"tool_calls": pending})]},
+                                                    config)
+            for message in executed["messages"]:
+                results[message.tool_call_id] = message
+        return {"messages": [results[call["id"]] for call in calls if call["id"] in results]}
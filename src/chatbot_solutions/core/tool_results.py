@@ -0,0 +1,99 @@
+import logging
+from datetime import datetime, timezone
+from typing import Collection, FrozenSet, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from core.configs import settings
+from core.metrics import Counter
+
+
+logger = logging.getLogger(__name__)
+
+tool_result_events = Counter("chatbot_tool_results_total",
+                             "Retomadas de tool call: aguardando resultados (waiting), completas (complete), com resultados faltando após o prazo (timeout) "
+                             "ou com tool calls internas encerradas sem resultado (closed)")
+
+
+class ToolResultsPendingError(Exception):
+    """A última tool call ainda tem resultados pendentes: o turno deve esperar retry_after segundos."""
+
+    def __init__(self, missing: List[str], retry_after: float):
+        super().__init__(f"Aguardando {len(missing)} resultados de ferramentas")
+        self.missing = missing
+        self.retry_after = retry_after
+
+
+def external_tools(project: str) -> FrozenSet[str]:
+    """Ferramentas do projeto cujos resultados chegam por /submit_tools (EXTERNAL_TOOLS)."""
+    return frozenset(settings.EXTERNAL_TOOLS.get(project, ()))
+
+
+def _timestamp(message: BaseMessage) -> Optional[datetime]:
+    value = (getattr(message, "metadata", None) or {}).get("timestamp")
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _last_tool_call_index(messages: List[BaseMessage]) -> Optional[int]:
+    for index in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[index], AIMessage):
+            return index if messages[index].tool_calls else None
+    return None
+
+
+def gather_tool_results(messages: List[BaseMessage], external: Collection[str] = frozenset(),
+                        timeout_seconds: float = settings.TOOL_RESULTS_TIMEOUT_SECONDS) -> List[BaseMessage]:
+    """
+    Prepara o histórico para retomar o grafo depois de uma tool call com várias ferramentas.
+    Só as ferramentas externas (respondidas por /submit_tools) seguram o turno: enquanto faltar
+    algum resultado delas na última AIMessage, levanta ToolResultsPendingError com o tempo restante;
+    o prazo conta da primeira mensagem recebida depois da tool call. Com todos os resultados
+    (ou com o prazo vencido, completando os que faltam com TOOL_RESULTS_TIMEOUT_MESSAGE), devolve o
+    histórico com os ToolMessages logo depois da AIMessage, na ordem das tool calls, como a API do
+    modelo exige. Tool calls que ninguém responde (handoff, finalizar_conversa) são encerradas na
+    hora com TOOL_CALL_CLOSED_MESSAGE: a mensagem seguinte do usuário é um turno novo.
+    """
+    index = _last_tool_call_index(messages)
+    if index is None:
+        return messages
+
+    tool_calls = messages[index].tool_calls
+    after = messages[index + 1:]
+    results = {m.tool_call_id: m for m in after if isinstance(m, ToolMessage)}
+    missing = [call for call in tool_calls if call["id"] not in results]
+    waiting = [call["id"] for call in missing if call["name"] in external]
+
+    if waiting:
+        arrivals = [ts for ts in (_timestamp(m) for m in after) if ts is not None]
+        if arrivals:
+            waited = (datetime.now(timezone.utc) - min(arrivals)).total_seconds()
+            if waited < timeout_seconds:
+                tool_result_events.inc(kind="waiting")
+                raise ToolResultsPendingError(waiting, timeout_seconds - waited)
+        logger.warning("Resultados de ferramentas não recebidos no prazo: %s", waiting)
+        tool_result_events.inc(kind="timeout")
+    elif missing:
+        tool_result_events.inc(kind="closed")
+    else:
+        tool_result_events.inc(kind="complete")
+
+    for call in missing:
+        if call["name"] in external:
+            results[call["id"]] = ToolMessage(tool_call_id=call["id"], name=call["name"],
+                                              content=settings.TOOL_RESULTS_TIMEOUT_MESSAGE, status="error")
+        else:
+            results[call["id"]] = ToolMessage(tool_call_id=call["id"], name=call["name"],
+                                              content=settings.TOOL_CALL_CLOSED_MESSAGE)
+
+    ordered = [results[call["id"]] for call in tool_calls]
+    # Resultados de tool calls antigas (reentregas atrasadas) não têm AIMessage correspondente
+    others = [m for m in after if not isinstance(m, ToolMessage)]
+    if ordered + others == list(after):
+        return messages
+    return list(messages[:index + 1]) + ordered + others
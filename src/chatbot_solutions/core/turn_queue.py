@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, or_, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.future import select
+
+from core.affinity import contact_shard
+from core.configs import settings
+from core.database import Session, engine
+from core.jobs import JobStatus
+from core.locks import WORKER_ID
+from core.turns import contact_from_db
+from models.finished_turn_model import FinishedTurnModel
+from models.pending_turn_model import PendingTurnModel
+from models.usuario_model import UsuarioModel
+from schemas.usuario_schema import Contact
+
+
+logger = logging.getLogger(__name__)
+
+# Canal do LISTEN/NOTIFY que acorda os workers ociosos
+CHANNEL = "chatbot_turns"
+# Prefixo dos ids de job da fila durável (os da fila em memória são uuid hex)
+JOB_PREFIX = "turn-"
+
+PendingTurn = Tuple[Contact, str, int]
+
+# A cada N turnos concluídos por este processo, apaga as marcas de conclusão expiradas
+_PURGE_EVERY = 1000
+
+
+@dataclass
+class ClaimedTurn:
+    id: int
+    version: int
+    contact: Contact
+    webhook_url: str
+    priority: int
+
+
+class DurableTurnQueue:
+    """
+    Fila de turnos no Postgres, compartilhada por todos os nós.
+    Uma linha por conversa: mensagens novas só atualizam a linha (debounce, prioridade, versão).
+    Os workers reservam linhas com FOR UPDATE SKIP LOCKED e um prazo (claimed_until), renovado
+    enquanto o turno roda; se o worker morrer, o turno volta para a fila quando o prazo passar.
+    Cada enqueue faz NOTIFY no canal CHANNEL para acordar workers parados no LISTEN.
+    """
+
+    def __init__(self, claim_ttl_seconds: int, debounce_seconds: float, max_wait_seconds: float, aging_seconds: float,
+                 depth_refresh_seconds: float, result_ttl_seconds: int):
+        self.claim_ttl = timedelta(seconds=claim_ttl_seconds)
+        # Por quanto tempo um turno concluído ainda aparece como done em status()
+        self.result_ttl = timedelta(seconds=result_ttl_seconds)
+        self._completed = 0
+        self.debounce_seconds = debounce_seconds
+        self.max_wait = timedelta(seconds=max_wait_seconds)
+        self.aging_seconds = aging_seconds
+        # Turnos esperando por projeto, em cache para o backpressure da API
+        self.depth_refresh_seconds = depth_refresh_seconds
+        self._depths: Dict[str, int] = {}
+        self._depths_expire_at = 0.0
+        self._depths_lock = asyncio.Lock()
+
+    async def enqueue(self, turns: List[PendingTurn], delay: float = 0.0) -> List[int]:
+        """
+        Registra os turnos (ou atualiza os já pendentes da mesma conversa) e devolve os ids das linhas.
+        delay=0 torna o turno disponível na hora; com delay a rajada é agrupada, até max_wait desde a primeira mensagem.
+        """
+        if not turns:
+            return []
+        table = PendingTurnModel
+        available_at = func.now() + timedelta(seconds=delay)
+        query = insert(table).values([{"project": contact.project,
+                                       "phone": contact.channel.phone,
+                                       "protocol": contact.protocol,
+                                       "shard": contact_shard(contact),
+                                       "webhook_url": webhook_url,
+                                       "priority": priority,
+                                       "first_at": func.now(),
+                                       "available_at": available_at} for contact, webhook_url, priority in turns])
+        if delay:
+            new_available_at = func.least(func.greatest(table.available_at, query.excluded.available_at),
+                                          table.first_at + self.max_wait)
+        else:
+            new_available_at = func.least(table.available_at, query.excluded.available_at)
+        query = (query.on_conflict_do_update(constraint='uq_pending_turns_conversa',
+                                             set_={"webhook_url": query.excluded.webhook_url,
+                                                   "priority": func.greatest(table.priority, query.excluded.priority),
+                                                   "available_at": new_available_at,
+                                                   "version": table.version + 1})
+                 .returning(table.id))
+        async with Session() as session:
+            ids = [row.id for row in await session.execute(query)]
+            # Entregue no commit
+            await session.execute(text("SELECT pg_notify(:channel, '')"), {"channel": CHANNEL})
+            await session.commit()
+        return ids
+
+    async def claim(self, limit: int, exclude_projects: Iterable[str] = (),
+                    shards: Optional[Collection[int]] = None, grace_seconds: float = 0.0) -> List[ClaimedTurn]:
+        """
+        Reserva até limit turnos disponíveis, os de maior prioridade (com envelhecimento) primeiro.
+        Com shards, só os das conversas desses shards, mais os de qualquer shard que estejam
+        disponíveis há mais de grace_seconds (o dono pode estar lotado ou fora do ar).
+        """
+        table = PendingTurnModel
+        # Cada nível de prioridade vale aging_seconds de espera, como na fila em memória
+        order = table.available_at - func.make_interval(0, 0, 0, 0, 0, 0, table.priority * self.aging_seconds)
+        candidates = (select(table.id)
+                      .where(table.available_at <= func.now(),
+                             or_(table.claimed_until.is_(None), table.claimed_until < func.now()))
+                      .order_by(order)
+                      .limit(limit)
+                      .with_for_update(skip_locked=True))
+        excluded = list(exclude_projects)
+        if excluded:
+            candidates = candidates.where(table.project.not_in(excluded))
+        if shards is not None:
+            overdue = table.available_at < func.now() - timedelta(seconds=grace_seconds)
+            candidates = candidates.where(or_(table.shard.in_(list(shards)), overdue) if shards else overdue)
+        query = (update(table)
+                 .where(table.id.in_(candidates.scalar_subquery()))
+                 .values(claimed_by=WORKER_ID, claimed_until=func.now() + self.claim_ttl)
+                 .returning(table.id, table.version, table.project, table.phone, table.protocol,
+                            table.webhook_url, table.priority))
+        async with Session() as session:
+            rows = (await session.execute(query)).all()
+            contacts = await self._contacts(session, [(row.project, row.phone, row.protocol) for row in rows])
+            await session.commit()
+
+        claimed = []
+        for row in rows:
+            contact = contacts.get((row.project, row.phone, row.protocol))
+            if contact is None:
+                # Conversa apagada (ou inválida): não há o que responder
+                await self.complete(ClaimedTurn(row.id, row.version, None, row.webhook_url, row.priority))
+                continue
+            claimed.append(ClaimedTurn(row.id, row.version, contact, row.webhook_url, row.priority))
+        return claimed
+
+    async def _contacts(self, session, keys: List[Tuple[str, str, str]]):
+        if not keys:
+            return {}
+        result = await session.execute(
+            select(UsuarioModel.nome, UsuarioModel.document, UsuarioModel.project, UsuarioModel.protocol,
+                   UsuarioModel.phone, UsuarioModel.email)
+            .where(tuple_(UsuarioModel.project, UsuarioModel.phone, UsuarioModel.protocol).in_(keys)))
+        contacts = {}
+        for row in result:
+            try:
+                contacts[(row.project, row.phone, row.protocol)] = contact_from_db(row)
+            except ValueError as e:
+                logger.error("Conversa %s sem dados de contato válidos, turno descartado: %s", row.protocol, str(e))
+        return contacts
+
+    async def complete(self, turn: ClaimedTurn) -> None:
+        """
+        Turno respondido: troca a linha por uma marca em finished_turns, a menos que uma mensagem
+        nova tenha chegado durante a execução (versão mudou); nesse caso ela volta para a fila
+        para o próximo turno.
+        """
+        table = PendingTurnModel
+        self._completed += 1
+        async with Session() as session:
+            result = await session.execute(delete(table)
+                                           .where(table.id == turn.id, table.claimed_by == WORKER_ID,
+                                                  table.version == turn.version)
+                                           .returning(table.id))
+            if result.first() is None:
+                await session.execute(update(table)
+                                      .where(table.id == turn.id, table.claimed_by == WORKER_ID)
+                                      .values(claimed_by=None, claimed_until=None, first_at=func.now()))
+            else:
+                await session.execute(insert(FinishedTurnModel).values(id=turn.id).on_conflict_do_nothing())
+            if self._completed % _PURGE_EVERY == 0:
+                await session.execute(delete(FinishedTurnModel)
+                                      .where(FinishedTurnModel.finished_at < func.now() - self.result_ttl))
+            await session.commit()
+
+    async def release(self, turns: List[ClaimedTurn], delay: float = 0.0) -> None:
+        """
+        Devolve os turnos à fila sem respondê-los (conversa ocupada, resultados de ferramentas
+        pendentes ou worker desligando), disponíveis de novo em delay segundos. Se chegou
+        mensagem nova durante a reserva (versão mudou), vale o available_at que ela definiu.
+        """
+        if not turns:
+            return
+        table = PendingTurnModel
+        unchanged = tuple_(table.id, table.version).in_([(turn.id, turn.version) for turn in turns])
+        async with Session() as session:
+            await session.execute(update(table)
+                                  .where(table.id.in_([turn.id for turn in turns]), table.claimed_by == WORKER_ID)
+                                  .values(claimed_by=None, claimed_until=None,
+                                          available_at=case((unchanged, func.now() + timedelta(seconds=delay)),
+                                                            else_=table.available_at)))
+            await session.execute(text("SELECT pg_notify(:channel, '')"), {"channel": CHANNEL})
+            await session.commit()
+
+    async def renew(self, turns: List[ClaimedTurn]) -> None:
+        """Estende o prazo dos turnos em execução por este worker."""
+        if not turns:
+            return
+        table = PendingTurnModel
+        async with Session() as session:
+            await session.execute(update(table)
+                                  .where(table.id.in_([turn.id for turn in turns]), table.claimed_by == WORKER_ID)
+                                  .values(claimed_until=func.now() + self.claim_ttl))
+            await session.commit()
+
+    async def next_available_in(self, shards: Optional[Collection[int]] = None, grace_seconds: float = 0.0) -> Optional[float]:
+        """Segundos até o próximo turno livre ficar disponível para quem reserva com esses shards (None se não houver)."""
+        table = PendingTurnModel
+        available_at = table.available_at
+        if shards is not None:
+            overdue_at = table.available_at + timedelta(seconds=grace_seconds)
+            available_at = case((table.shard.in_(list(shards)), table.available_at), else_=overdue_at) if shards else overdue_at
+        async with Session() as session:
+            result = await session.execute(select(func.extract("epoch", func.min(available_at) - func.now()))
+                                           .where(table.claimed_by.is_(None)))
+            seconds = result.scalar_one_or_none()
+        return None if seconds is None else max(0.0, float(seconds))
+
+    async def waiting_counts(self) -> Dict[str, int]:
+        """Turnos na fila ainda não reservados por nenhum worker, por projeto."""
+        table = PendingTurnModel
+        async with Session() as session:
+            result = await session.execute(select(table.project, func.count())
+                                           .where(table.claimed_by.is_(None))
+                                           .group_by(table.project))
+        return {project: count for project, count in result}
+
+    async def depth(self, project: str) -> int:
+        """
+        Turnos do projeto esperando na fila compartilhada. A contagem de todos os projetos é
+        refeita no máximo a cada depth_refresh_seconds: o backpressure consulta a cada requisição.
+        Se o banco falhar, segue com a última contagem até a próxima tentativa.
+        """
+        if time.monotonic() >= self._depths_expire_at:
+            async with self._depths_lock:
+                if time.monotonic() >= self._depths_expire_at:
+                    try:
+                        self._depths = await self.waiting_counts()
+                    except Exception as e:
+                        logger.error("Falha ao contar os turnos pendentes: %s", str(e))
+                    self._depths_expire_at = time.monotonic() + self.depth_refresh_seconds
+        return self._depths.get(project, 0)
+
+    async def status(self, job_id: str) -> Optional[JobStatus]:
+        """
+        Status de um job da fila durável: queued/running enquanto a linha existe, done depois de
+        concluído (marca em finished_turns, até result_ttl) e None se o id não existe ou expirou.
+        """
+        try:
+            turn_id = int(job_id[len(JOB_PREFIX):])
+        except ValueError:
+            return None
+        async with Session() as session:
+            result = await session.execute(select(PendingTurnModel.claimed_until, func.now().label("now"))
+                                           .where(PendingTurnModel.id == turn_id))
+            row = result.first()
+            if row is None:
+                finished = await session.execute(select(FinishedTurnModel.id)
+                                                 .where(FinishedTurnModel.id == turn_id,
+                                                        FinishedTurnModel.finished_at >= func.now() - self.result_ttl))
+                return JobStatus.DONE if finished.first() is not None else None
+        return JobStatus.RUNNING if row.claimed_until is not None and row.claimed_until > row.now else JobStatus.QUEUED
+
+    async def listen(self, wake: asyncio.Event) -> None:
+        """
+        Mantém um LISTEN no canal e sinaliza wake a cada NOTIFY. Roda até ser cancelado;
+        se a conexão cair, reconecta (nesse intervalo os workers seguem pelo polling).
+        """
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    raw = await conn.get_raw_connection()
+                    driver = raw.driver_connection
+
+                    def notified(*args) -> None:
+                        wake.set()
+
+                    await driver.add_listener(CHANNEL, notified)
+                    try:
+                        while not driver.is_closed():
+                            await asyncio.sleep(5)
+                    finally:
+                        if not driver.is_closed():
+                            await driver.remove_listener(CHANNEL, notified)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("LISTEN %s interrompido: %s", CHANNEL, str(e))
+            await asyncio.sleep(1)
+
+
+durable_queue: DurableTurnQueue = DurableTurnQueue(claim_ttl_seconds=settings.LEASE_TTL_SECONDS,
+                                                   debounce_seconds=settings.CHAT_DEBOUNCE_SECONDS,
+                                                   max_wait_seconds=settings.CHAT_COALESCE_MAX_WAIT_SECONDS,
+                                                   aging_seconds=settings.PRIORITY_AGING_SECONDS,
+                                                   depth_refresh_seconds=settings.BACKPRESSURE_DEPTH_REFRESH_SECONDS,
+                                                   result_ttl_seconds=settings.JOB_RESULT_TTL_SECONDS)
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from core.affinity import AffinityRouter, affinity
+from core.bulkheads import Bulkheads, bulkheads
+from core.configs import settings
+from core.metrics import Counter
+from core.turn_queue import ClaimedTurn, DurableTurnQueue, durable_queue
+from core.tool_results import ToolResultsPendingError
+from core.turns import ConversationBusyError, run_pending_turn
+
+
+logger = logging.getLogger(__name__)
+
+worker_turns = Counter("chatbot_turn_worker_total", "Turnos da fila durável por resultado (done, failed, busy, waiting_tools, released)")
+
+
+class TurnWorker:
+    """
+    Consumidor da fila durável (TURN_QUEUE=postgres), executado por worker.py em qualquer nó.
+    Reserva turnos enquanto houver vaga (TURN_WORKER_CONCURRENCY no processo e a vaga do
+    bulkhead de cada projeto), dorme no LISTEN até um NOTIFY ou o polling, e renova o prazo
+    dos turnos em execução. Com afinidade, só pega os turnos dos shards que possui no anel
+    (e os atrasados de qualquer shard). No desligamento sai do anel, espera os turnos até
+    DRAIN_TIMEOUT_SECONDS e devolve à fila os que não terminaram.
+    """
+
+    def __init__(self, queue: DurableTurnQueue, pools: Bulkheads, concurrency: int, poll_seconds: float,
+                 drain_timeout_seconds: float, renew_seconds: float, router: Optional[AffinityRouter] = None,
+                 affinity_grace_seconds: float = 0.0):
+        self.queue = queue
+        self.pools = pools
+        self.router = router
+        self.affinity_grace_seconds = affinity_grace_seconds
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.drain_timeout_seconds = drain_timeout_seconds
+        self.renew_seconds = renew_seconds
+        self._running: Dict[int, ClaimedTurn] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._wake = asyncio.Event()
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+
+    async def run(self) -> None:
+        if self.router is not None:
+            await self.router.heartbeat()
+        listener = asyncio.create_task(self.queue.listen(self._wake))
+        renewer = asyncio.create_task(self._renew_loop())
+        members = asyncio.create_task(self._membership_loop())
+        logger.info("Worker de turnos iniciado (concorrência %s)", self.concurrency)
+        try:
+            while not self._stopping.is_set():
+                self._wake.clear()
+                try:
+                    claimed = await self._claim()
+                except Exception as e:
+                    logger.error("Erro ao reservar turnos: %s", str(e))
+                    await asyncio.sleep(self.poll_seconds)
+                    continue
+                if claimed:
+                    continue
+                await self._sleep()
+            members.cancel()
+            if self.router is not None:
+                await self.router.leave()
+            await self._drain()
+        finally:
+            for task in (listener, renewer, members):
+                task.cancel()
+            await asyncio.gather(listener, renewer, members, return_exceptions=True)
+
+    async def _claim(self) -> int:
+        free = self.concurrency - len(self._running)
+        if free <= 0:
+            return 0
+        # Projetos com o bulkhead lotado ficam para outro worker (ou para a próxima rodada)
+        per_project: Dict[str, int] = {}
+        for running in self._running.values():
+            per_project[running.contact.project] = per_project.get(running.contact.project, 0) + 1
+        saturated = [project for project, count in per_project.items() if count >= self.pools.for_project(project).workers]
+        if self.router is not None:
+            turns = await self.queue.claim(free, exclude_projects=saturated, shards=self.router.owned,
+                                           grace_seconds=self.affinity_grace_seconds)
+        else:
+            turns = await self.queue.claim(free, exclude_projects=saturated)
+        for turn in turns:
+            self._running[turn.id] = turn
+            self._tasks[turn.id] = asyncio.create_task(self._execute(turn))
+        return len(turns)
+
+    async def _sleep(self) -> None:
+        """Dorme até um NOTIFY, um turno terminar, o próximo debounce vencer ou o polling."""
+        timeout = self.poll_seconds
+        try:
+            if self.router is not None:
+                next_in = await self.queue.next_available_in(self.router.owned, self.affinity_grace_seconds)
+            else:
+                next_in = await self.queue.next_available_in()
+            if next_in is not None:
+                timeout = min(timeout, next_in)
+        except Exception as e:
+            logger.error("Erro ao consultar a fila durável: %s", str(e))
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=max(timeout, 0.05))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _execute(self, turn: ClaimedTurn) -> None:
+        try:
+            async with self.pools.for_project(turn.contact.project).slot():
+                await run_pending_turn(turn.contact, turn.webhook_url)
+            await self.queue.complete(turn)
+            worker_turns.inc(project=turn.contact.project, result="done")
+        except ConversationBusyError:
+            # Turno da conversa rodando fora da fila (streaming, lote com wait): tenta depois da janela
+            await self.queue.release([turn], delay=settings.CHAT_DEBOUNCE_SECONDS)
+            worker_turns.inc(project=turn.contact.project, result="busy")
+        except ToolResultsPendingError as e:
+            # Faltam resultados da tool call: volta no fim do prazo, ou antes se o último chegar
+            await self.queue.release([turn], delay=e.retry_after)
+            worker_turns.inc(project=turn.contact.project, result="waiting_tools")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Como na fila em memória, um turno com erro não é repetido
+            logger.exception("Turno da conversa %s falhou: %s", turn.contact.protocol, str(e))
+            await self.queue.complete(turn)
+            worker_turns.inc(project=turn.contact.project, result="failed")
+        finally:
+            self._running.pop(turn.id, None)
+            self._tasks.pop(turn.id, None)
+            self._wake.set()
+
+    async def _renew_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.renew_seconds)
+            try:
+                await self.queue.renew(list(self._running.values()))
+            except Exception as e:
+                logger.error("Erro ao renovar os turnos em execução: %s", str(e))
+
+    async def _membership_loop(self) -> None:
+        if self.router is None:
+            return
+        while True:
+            await asyncio.sleep(settings.AFFINITY_HEARTBEAT_SECONDS)
+            try:
+                owned = self.router.owned
+                await self.router.heartbeat()
+                if self.router.owned - owned:
+                    # Shards novos (outro worker saiu): pode haver turnos esperando por este
+                    self._wake.set()
+            except Exception as e:
+                logger.error("Erro no heartbeat do anel de afinidade: %s", str(e))
+
+    async def _drain(self) -> None:
+        started = time.monotonic()
+        if self._tasks:
+            logger.info("Desligando: aguardando %s turnos em execução", len(self._tasks))
+            await asyncio.wait(list(self._tasks.values()), timeout=self.drain_timeout_seconds)
+
+        unfinished: List[ClaimedTurn] = list(self._running.values())
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if unfinished:
+            # Volta para a fila na hora, para outro worker retomar sem esperar o prazo vencer
+            await self.queue.release(unfinished)
+            worker_turns.inc(len(unfinished), result="released")
+        logger.info("Worker de turnos parado em %.1fs: %s turnos devolvidos à fila", time.monotonic() - started, len(unfinished))
+
+
+def build_worker(concurrency: Optional[int] = None) -> TurnWorker:
+    return TurnWorker(queue=durable_queue,
+                      pools=bulkheads,
+                      concurrency=concurrency or settings.TURN_WORKER_CONCURRENCY,
+                      poll_seconds=settings.TURN_QUEUE_POLL_SECONDS,
+                      drain_timeout_seconds=settings.DRAIN_TIMEOUT_SECONDS,
+                      renew_seconds=settings.LEASE_HEARTBEAT_SECONDS,
+                      router=affinity if settings.AFFINITY_ENABLED else None,
+                      affinity_grace_seconds=settings.AFFINITY_GRACE_SECONDS)
@@ -0,0 +1,450 @@
+import logging
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import cast, func, literal, update
+from sqlalchemy.dialects.postgresql import JSONB, JSONPATH, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, messages_from_dict, messages_to_dict
+
+from core.checkpoints import TurnCheckpoint, checkpoints
+from core.database import Session
+from core.delivery import ChunkedDelivery, chunked_delivery_nodes, final_answer
+from core.deadlines import DeadlineExceededError, TurnBudget, run_with_budget, turn_budget
+from models.usuario_model import UsuarioModel
+from schemas.usuario_schema import Contact, Channel
+from core.graph_registry import graph_registry
+from core.locks import ConversationLease
+from core.tool_results import external_tools, gather_tool_results
+from webhook_calls import trigger_webhook_message, trigger_webhook_tool_call
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationBusyError(Exception):
+    """A conversa já tem um turno em execução."""
+
+
+@dataclass
+class TurnInput:
+    """
+    Entrada de um turno: o estado passado ao grafo e base_len, o tamanho do histórico que o turno
+    responde (mensagens gravadas em posições >= base_len chegaram durante o turno).
+    Com checkpoint, state traz só as mensagens que o checkpoint de partida ainda não tem.
+    """
+    state: Dict[str, Any]
+    base_len: int
+    checkpoint: Optional[TurnCheckpoint] = None
+
+
+# Execuções de grafo em andamento neste processo (jobs, streaming e lotes com wait)
+_in_flight = 0
+
+
+def in_flight_runs() -> int:
+    return _in_flight
+
+
+def conversation_query(contact: Contact):
+    """SELECT da conversa identificada por telefone + projeto + protocolo."""
+    return select(UsuarioModel).filter(UsuarioModel.phone == contact.channel.phone,
+                                       UsuarioModel.project == contact.project,
+                                       UsuarioModel.protocol == contact.protocol)
+
+
+async def append_messages(session: AsyncSession, contact: Contact, messages: List[BaseMessage]):
+    """
+    Acrescenta mensagens ao histórico com um único UPDATE (messages || novas), sem ler o JSONB.
+    Retorna a linha da conversa (sem o histórico) ou None se ela ainda não existir.
+    """
+    query = (update(UsuarioModel)
+             .where(UsuarioModel.phone == contact.channel.phone,
+                    UsuarioModel.project == contact.project,
+                    UsuarioModel.protocol == contact.protocol)
+             .values(messages=UsuarioModel.messages.op('||')(literal(messages_to_dict(messages), JSONB)))
+             .returning(UsuarioModel.id, UsuarioModel.nome, UsuarioModel.document, UsuarioModel.project,
+                        UsuarioModel.protocol, UsuarioModel.phone, UsuarioModel.email))
+    result = await session.execute(query)
+    return result.first()
+
+
+def _new_conversation(contact: Contact, messages: List[BaseMessage]) -> Dict[str, Any]:
+    return dict(protocol=contact.protocol,
+                project=contact.project,
+                nome=contact.name,
+                document=contact.document,
+                phone=contact.channel.phone,
+                email=contact.channel.email,
+                messages=messages_to_dict(messages),
+                processing=False)
+
+
+def _upsert_query(rows: List[Dict[str, Any]]):
+    """
+    INSERT ... ON CONFLICT (project, phone, protocol) DO UPDATE SET messages = messages || novas.
+    A conversa é criada ou recebe as mensagens no mesmo comando: duas mensagens de uma rajada em
+    conversa nova não criam duas linhas (ix_usuarios_conversa é único).
+    """
+    query = insert(UsuarioModel).values(rows)
+    return query.on_conflict_do_update(
+        index_elements=['project', 'phone', 'protocol'],
+        # onupdate não vale para o set_ do ON CONFLICT
+        set_={"messages": UsuarioModel.messages.op('||')(query.excluded.messages), "updated_at": func.now()})
+
+
+async def upsert_messages(session: AsyncSession, contact: Contact, messages: List[BaseMessage]):
+    """Grava as mensagens criando a conversa se preciso; retorna a linha da conversa (sem o histórico)."""
+    query = _upsert_query([_new_conversation(contact, messages)]).returning(
+        UsuarioModel.id, UsuarioModel.nome, UsuarioModel.document, UsuarioModel.project,
+        UsuarioModel.protocol, UsuarioModel.phone, UsuarioModel.email)
+    result = await session.execute(query)
+    return result.one()
+
+
+async def upsert_messages_bulk(session: AsyncSession, conversations: List[Tuple[Contact, List[BaseMessage]]]) -> None:
+    """upsert_messages de várias conversas (distintas) em um único INSERT com várias linhas."""
+    if not conversations:
+        return
+    await session.execute(_upsert_query([_new_conversation(contact, messages) for contact, messages in conversations]))
+
+
+def _history_slice(start: int, end: Optional[int] = None):
+    """Trecho [start, end) de usuarios.messages calculado no banco, sem trazer o JSONB inteiro."""
+    if end is None:
+        return func.jsonb_path_query_array(UsuarioModel.messages, cast('$[$start to last]', JSONPATH),
+                                           func.jsonb_build_object('start', start))
+    return func.jsonb_path_query_array(UsuarioModel.messages, cast('$[$start to $last]', JSONPATH),
+                                       func.jsonb_build_object('start', start, 'last', end - 1))
+
+
+def contact_from_db(usuario_db: UsuarioModel) -> Contact:
+    return Contact(name=usuario_db.nome,
+                   document=usuario_db.document,
+                   project=usuario_db.project,
+                   protocol=usuario_db.protocol,
+                   channel=Channel(phone=usuario_db.phone,
+                                   email=usuario_db.email))
+
+
+async def _graph_stream(project: str, state: Dict[str, Any], modes: List[str],
+                        checkpoint: Optional[TurnCheckpoint] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    astream do grafo do projeto com os modos pedidos. Com checkpoint, roda o grafo compilado com o
+    checkpointer a partir do checkpoint de partida e guarda em checkpoint.saved_id o último gravado.
+    """
+    if checkpoint is None:
+        graph = await graph_registry.aget(project)
+        async for mode, chunk in graph.astream(state, stream_mode=modes):
+            yield mode, chunk
+        return
+
+    graph = await checkpoints.graph(project)
+    async for mode, chunk in graph.astream(state, checkpoint.config(), stream_mode=modes + ["checkpoints"]):
+        if mode == "checkpoints":
+            checkpoint.saved_id = chunk["config"]["configurable"]["checkpoint_id"]
+        else:
+            yield mode, chunk
+
+
+async def run_graph(project: str, state: Dict[str, Any],
+                    on_token: Optional[Callable[[str, Optional[str], Optional[str]], None]] = None,
+                    checkpoint: Optional[TurnCheckpoint] = None) -> Dict[str, Any]:
+    """
+    Executa o grafo até o fim; on_token(texto, nó, id da mensagem) recebe os tokens do LLM conforme são gerados.
+    Com checkpoint, o estado final inclui as mensagens que já estavam no checkpoint.
+    """
+    final_state = None
+    modes = ["values"] if on_token is None else ["messages", "values"]
+    async for mode, chunk in _graph_stream(project, state, modes, checkpoint):
+        if mode == "messages":
+            message, metadata = chunk
+            if isinstance(message, AIMessageChunk) and isinstance(message.content, str) and message.content:
+                on_token(message.content, metadata.get("langgraph_node"), message.id)
+        else:
+            final_state = chunk
+    return final_state
+
+
+async def deliver(contact: Contact, webhook_url: str, final_state: Dict[str, Any]) -> None:
+    last_ai_message = messages_to_dict([final_answer(final_state["messages"])])[0]
+
+    tool_calls = last_ai_message.get("data", {}).get("tool_calls", [])
+    content = last_ai_message.get("data", {}).get("content")
+    if tool_calls:
+        await trigger_webhook_tool_call(contact=contact, tools=tool_calls, webhook_url=webhook_url)
+    else:
+        await trigger_webhook_message(contact=contact, message=content, webhook_url=webhook_url)
+
+
+async def save_turn(contact: Contact, final_state: Dict[str, Any], turn: TurnInput, lease: ConversationLease) -> None:
+    """
+    Grava o histórico final e libera o lease na mesma transação.
+    Mensagens gravadas depois do início do turno (posições >= base_len) são preservadas
+    no fim do histórico, para o próximo turno respondê-las.
+    """
+    if turn.checkpoint is not None:
+        await _save_checkpoint_turn(contact, final_state, turn, lease)
+        return
+
+    base_len = turn.base_len
+    async with Session() as session:
+        result = await session.execute(conversation_query(contact).with_for_update())
+        usuario_db: UsuarioModel = result.scalars().unique().one_or_none()
+
+        if not usuario_db:
+            return
+        if usuario_db.lease_owner != lease.token:
+            # Outro worker assumiu a conversa: não sobrescreve o histórico dele
+            logger.warning("Turno da conversa %s descartado: lease perdido", contact.protocol)
+            return
+
+        arrived = list(usuario_db.messages or [])[base_len:]
+        usuario_db.messages = messages_to_dict(final_state["messages"]) + arrived
+        usuario_db.processing = False
+        usuario_db.lease_owner = None
+        usuario_db.lease_expires_at = None
+        await session.commit()
+    lease.held = False
+
+
+async def _save_checkpoint_turn(contact: Contact, final_state: Dict[str, Any], turn: TurnInput,
+                                lease: ConversationLease) -> None:
+    """
+    Variante de save_turn com checkpoint: em um único UPDATE, insere só as mensagens produzidas
+    pelo turno na posição base_len (antes das que chegaram durante o turno) e registra o
+    checkpoint correspondente, sem ler nem reescrever o histórico no Python.
+    """
+    produced = list(final_state["messages"])[turn.base_len:]
+    query = (update(UsuarioModel)
+             .where(UsuarioModel.phone == contact.channel.phone,
+                    UsuarioModel.project == contact.project,
+                    UsuarioModel.protocol == contact.protocol,
+                    UsuarioModel.lease_owner == lease.token)
+             .values(messages=_history_slice(0, turn.base_len)
+                              .op('||')(literal(messages_to_dict(produced), JSONB))
+                              .op('||')(_history_slice(turn.base_len)),
+                     checkpoint_id=turn.checkpoint.saved_id,
+                     processing=False,
+                     lease_owner=None,
+                     lease_expires_at=None)
+             .returning(UsuarioModel.id))
+    async with Session() as session:
+        result = await session.execute(query)
+        saved = result.first() is not None
+        await session.commit()
+
+    if not saved:
+        # Conversa removida ou lease perdido para outro worker: não mexe no histórico dele
+        logger.warning("Turno da conversa %s descartado: lease perdido", contact.protocol)
+        return
+    lease.held = False
+
+
+async def run_graph_with_deadline(contact: Contact, webhook_url: str, turn: TurnInput,
+                                  delivery: Optional[ChunkedDelivery] = None) -> Dict[str, Any]:
+    """
+    Roda o grafo dentro do orçamento do projeto: mensagem de espera ao passar do soft
+    e handoff ao passar do hard (o histórico fica com a tool call de handoff, já encerrada, no lugar da resposta).
+    """
+    budget = turn_budget(contact.project)
+
+    async def send_interim(budget: TurnBudget) -> None:
+        if delivery is not None and delivery.started:
+            # O usuário já está recebendo a resposta em partes
+            return
+        await trigger_webhook_message(contact=contact, message=budget.interim_message, webhook_url=webhook_url)
+
+    state = turn.state
+    try:
+        on_token = delivery.feed if delivery is not None else None
+        return await run_with_budget(budget, run_graph(contact.project, state, on_token, turn.checkpoint),
+                                     on_soft=send_interim)
+    except DeadlineExceededError as e:
+        logger.warning("%s (conversa %s), enviando handoff", str(e), contact.protocol)
+        history = list(state["messages"])
+        if turn.checkpoint is not None:
+            # O handoff não passa pelo grafo: sem checkpoint confirmado, o próximo turno recomeça a thread
+            history = turn.checkpoint.messages + history
+            turn.checkpoint.saved_id = None
+        return {**state, "messages": history + budget.fallback_messages_for_deadline()}
+
+
+async def run_turn(contact: Contact, webhook_url: str, turn: TurnInput, lease: ConversationLease) -> str:
+    """Executa um turno completo: grafo do projeto, webhook de resposta e persistência."""
+    global _in_flight
+    nodes = chunked_delivery_nodes(contact.project)
+    delivery = ChunkedDelivery(contact, webhook_url, nodes) if nodes is not None else None
+    _in_flight += 1
+    try:
+        async with lease.keep_alive():
+            final_state = await run_graph_with_deadline(contact, webhook_url, turn, delivery)
+            if delivery is not None:
+                await delivery.finish(final_state)
+            else:
+                await deliver(contact, webhook_url, final_state)
+    finally:
+        _in_flight -= 1
+        if delivery is not None:
+            await delivery.aclose()
+    await save_turn(contact, final_state, turn, lease)
+
+    return final_answer(final_state["messages"]).content
+
+
+def coalesce_burst(messages: List[BaseMessage]) -> Tuple[List[BaseMessage], List[HumanMessage]]:
+    """
+    Junta as mensagens humanas ainda não respondidas (as últimas do histórico) em uma só,
+    para a rajada ser tratada pelo grafo como um único input.
+    Retorna (histórico ajustado, mensagens da rajada).
+    """
+    start = len(messages)
+    while start > 0 and isinstance(messages[start - 1], HumanMessage):
+        start -= 1
+    burst = list(messages[start:])
+    if len(burst) <= 1:
+        return list(messages), burst
+
+    merged = HumanMessage(content="\n".join(str(m.content) for m in burst),
+                          metadata=getattr(burst[-1], "metadata", None) or {},
+                          additional_kwargs={"coalesced": len(burst)})
+    return list(messages[:start]) + [merged], burst
+
+
+def _turn_state(messages: List[BaseMessage], burst: List[BaseMessage]) -> Dict[str, Any]:
+    return {"messages": messages,
+            "last_ai_message": None,
+            "last_human_message": [HumanMessage(content=m.content) for m in burst] or None
+           }
+
+
+async def prepare_pending_turn(contact: Contact) -> Optional[TurnInput]:
+    """
+    Monta o estado de entrada do grafo com tudo o que estiver pendente na conversa
+    (rajada de mensagens do usuário ou resultados de ferramentas). Deve ser chamado com o lease.
+    Retorna None se não houver nada a responder; levanta ToolResultsPendingError se a última
+    tool call ainda espera resultados de ferramentas externas (EXTERNAL_TOOLS).
+    """
+    if checkpoints.enabled(contact.project):
+        return await _prepare_from_checkpoint(contact)
+
+    async with Session() as session:
+        result = await session.execute(conversation_query(contact).with_for_update())
+        usuario_db: UsuarioModel = result.scalars().unique().one_or_none()
+
+        messages = messages_from_dict(usuario_db.messages or []) if usuario_db else []
+        if not messages or isinstance(messages[-1], AIMessage):
+            # Nada novo: a rajada já foi respondida em outro turno
+            return None
+
+        # Levanta ToolResultsPendingError enquanto faltar resultado da última tool call
+        gathered = gather_tool_results(messages, external_tools(contact.project))
+        reordered = gathered is not messages
+        messages, burst = coalesce_burst(gathered)
+        if len(burst) > 1 or reordered:
+            usuario_db.messages = messages_to_dict(messages)
+            await session.commit()
+
+    return TurnInput(state=_turn_state(messages, burst), base_len=len(messages))
+
+
+async def _prepare_from_checkpoint(contact: Contact) -> Optional[TurnInput]:
+    """
+    Variante de prepare_pending_turn com checkpoint: carrega o estado do grafo do checkpoint
+    gravado com o histórico e lê de usuarios.messages só o trecho que ele ainda não tem.
+    Sem checkpoint (conversa nova ou anterior ao checkpointer) o trecho é o histórico inteiro.
+    """
+    async with Session() as session:
+        query = (select(UsuarioModel.id, UsuarioModel.checkpoint_id,
+                        func.jsonb_array_length(UsuarioModel.messages).label("total"))
+                 .where(UsuarioModel.phone == contact.channel.phone,
+                        UsuarioModel.project == contact.project,
+                        UsuarioModel.protocol == contact.protocol)
+                 .with_for_update())
+        row = (await session.execute(query)).first()
+        if row is None:
+            return None
+
+        checkpoint = await checkpoints.position(contact, row.checkpoint_id)
+        known = len(checkpoint.messages)
+        if known > row.total:
+            # Histórico encurtado fora dos turnos: o checkpoint não corresponde mais a ele
+            logger.warning("Checkpoint da conversa %s à frente do histórico, recomeçando a thread", contact.protocol)
+            checkpoint = await checkpoints.position(contact, None)
+            known = 0
+
+        result = await session.execute(select(_history_slice(known)).where(UsuarioModel.id == row.id))
+        pending = messages_from_dict(result.scalar() or [])
+        if not pending or isinstance(pending[-1], AIMessage):
+            # Nada novo: a rajada já foi respondida em outro turno
+            return None
+
+        # A tool call respondida fica no fim do checkpoint; o gate e o agrupamento olham o contexto todo
+        context = checkpoint.messages + pending
+        gathered = gather_tool_results(context, external_tools(contact.project))
+        reordered = gathered is not context
+        messages, burst = coalesce_burst(gathered)
+        pending = messages[known:]
+        if len(burst) > 1 or reordered:
+            await session.execute(update(UsuarioModel)
+                                  .where(UsuarioModel.id == row.id)
+                                  .values(messages=_history_slice(0, known)
+                                                   .op('||')(literal(messages_to_dict(pending), JSONB)),
+                                          # Só reordena mensagens já gravadas: não é atividade nova
+                                          updated_at=UsuarioModel.updated_at))
+        await session.commit()
+
+    return TurnInput(state=_turn_state(pending, burst), base_len=len(messages), checkpoint=checkpoint)
+
+
+async def run_pending_turn(contact: Contact, webhook_url: str) -> Optional[str]:
+    """
+    Processa em um único turno tudo o que estiver pendente na conversa.
+    Levanta ConversationBusyError se outro worker tiver o lease da conversa.
+    """
+    lease = ConversationLease(contact)
+    if not await lease.acquire():
+        raise ConversationBusyError(contact.protocol)
+
+    try:
+        turn = await prepare_pending_turn(contact)
+        if turn is None:
+            return None
+        return await run_turn(contact=contact, webhook_url=webhook_url, turn=turn, lease=lease)
+    finally:
+        await lease.release()
+
+
+async def stream_turn(contact: Contact, turn: TurnInput, lease: ConversationLease) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Executa o turno emitindo eventos (tipo, dados) conforme o grafo avança:
+    'token' para cada trecho gerado pelo LLM, 'node' a cada nó concluído e 'done' com a resposta final.
+    Os tokens são uma prévia: guardrails de saída podem trocar a resposta, o evento 'done' é o que vale.
+    O histórico final é persistido como em run_turn.
+    """
+    global _in_flight
+    final_state = None
+    _in_flight += 1
+    try:
+        async with lease.keep_alive():
+            async for mode, chunk in _graph_stream(contact.project, turn.state, ["messages", "updates", "values"],
+                                                   turn.checkpoint):
+                if mode == "messages":
+                    message, metadata = chunk
+                    if isinstance(message, AIMessageChunk) and isinstance(message.content, str) and message.content:
+                        yield "token", {"content": message.content, "node": metadata.get("langgraph_node")}
+                elif mode == "updates":
+                    for node in chunk:
+                        yield "node", {"node": node}
+                else:
+                    final_state = chunk
+    finally:
+        _in_flight -= 1
+
+    await save_turn(contact, final_state, turn, lease)
+
+    last_message = final_answer(final_state["messages"])
+    yield "done", {"data": last_message.content,
+                   "tool_calls": getattr(last_message, "tool_calls", None) or []}
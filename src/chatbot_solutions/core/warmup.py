@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from openai.resources.moderations import AsyncModerations, Moderations
+from openai.types import Moderation, ModerationCreateResponse
+from sqlalchemy import text
+
+from core.configs import settings
+from core.database import engine
+from core.graph_registry import graph_registry
+from core.import_profile import import_profiler
+
+
+logger = logging.getLogger(__name__)
+
+# Só a task do warmup enxerga o stub; turnos reais no mesmo processo seguem chamando o LLM
+_stub_llm: ContextVar[bool] = ContextVar("warmup_stub_llm", default=False)
+_patched = False
+
+
+def _stub_result(messages) -> LLMResult:
+    return LLMResult(generations=[[ChatGeneration(message=AIMessage(content="ok"))] for _ in messages])
+
+
+def _stub_moderation(model: str) -> ModerationCreateResponse:
+    return ModerationCreateResponse.model_construct(id="warmup", model=model, results=[Moderation.model_construct(flagged=False)])
+
+
+def _install_moderation_stub() -> None:
+    """
+    Mesmo stub para a moderação da OpenAI: os grafos (ex.: HelpDesk) chamam o cliente openai
+    direto, fora do BaseChatModel, e o turno sintético faria chamadas pagas a cada start.
+    """
+    original_create = Moderations.create
+    original_acreate = AsyncModerations.create
+
+    def create(self, *args, **kwargs):
+        if _stub_llm.get():
+            return _stub_moderation(kwargs.get("model", ""))
+        return original_create(self, *args, **kwargs)
+
+    async def acreate(self, *args, **kwargs):
+        if _stub_llm.get():
+            return _stub_moderation(kwargs.get("model", ""))
+        return await original_acreate(self, *args, **kwargs)
+
+    Moderations.create = create
+    AsyncModerations.create = acreate
+
+
+def _install_llm_stub() -> None:
+    """Troca generate/agenerate dos chat models (e a moderação) por uma resposta fixa enquanto _stub_llm estiver ativo."""
+    global _patched
+    if _patched:
+        return
+    _install_moderation_stub()
+    original_generate = BaseChatModel.generate
+    original_agenerate = BaseChatModel.agenerate
+
+    def generate(self, messages, *args, **kwargs):
+        if _stub_llm.get():
+            return _stub_result(messages)
+        return original_generate(self, messages, *args, **kwargs)
+
+    async def agenerate(self, messages, *args, **kwargs):
+        if _stub_llm.get():
+            return _stub_result(messages)
+        return await original_agenerate(self, messages, *args, **kwargs)
+
+    BaseChatModel.generate = generate
+    BaseChatModel.agenerate = agenerate
+    _patched = True
+
+
+class Warmup:
+    """
+    Aquece o worker antes de ele receber tráfego: conexões do pool do banco, carga dos grafos,
+    um turno sintético por grafo (LLMs e moderação substituídos por stub, sem webhook nem gravação) e os
+    hooks de warmup dos projetos (ex.: uma inferência do modelo de sentimento).
+    O /health/ready só responde 200 depois que as etapas obrigatórias terminam bem.
+    """
+
+    def __init__(self):
+        self.checks: Dict[str, str] = {}
+        self.finished = False
+        self.started_at: Optional[float] = None
+        self.duration: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        # Etapas cuja falha deixa o worker fora do balanceador
+        self._required = {"database"}
+
+    @property
+    def ready(self) -> bool:
+        return self.finished and all(self.checks.get(name) == "ok" for name in self._required)
+
+    def start(self) -> None:
+        if not settings.WARMUP_ENABLED:
+            self._required = set()
+            self.finished = True
+            return
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def run(self) -> None:
+        self.started_at = time.perf_counter()
+        await self._step("database", self._warm_database())
+        await self._step("openai", self._warm_openai())
+        projects = graph_registry.projects() if "*" in settings.WARMUP_PROJECTS else settings.WARMUP_PROJECTS
+        for project in projects:
+            # Carregar o grafo é obrigatório; o turno sintético só adianta inicializações
+            self._required.add(f"graph:{project}")
+            await self._step(f"graph:{project}", graph_registry.aget(project))
+            if self.checks[f"graph:{project}"] == "ok":
+                await self._step(f"turn:{project}", self._warm_turn(project))
+        self.finished = True
+        self.duration = time.perf_counter() - self.started_at
+        logger.info("Warmup concluído em %.1fs: %s", self.duration, self.checks)
+        import_profiler.log_report("Imports até o fim do warmup (inclui os grafos)")
+
+    async def _step(self, name: str, coro) -> None:
+        self.checks[name] = "running"
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(coro, timeout=settings.WARMUP_STEP_TIMEOUT_SECONDS)
+            self.checks[name] = "ok"
+            logger.info("Warmup '%s' em %.2fs", name, time.perf_counter() - started)
+        except Exception as e:
+            self.checks[name] = f"erro: {e.__class__.__name__}: {e}"
+            logger.error("Falha no warmup '%s': %s", name, str(e))
+
+    async def _warm_database(self) -> None:
+        """Abre WARMUP_DB_CONNECTIONS conexões ao mesmo tempo para elas ficarem no pool."""
+        async def ping() -> None:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        await asyncio.gather(*(ping() for _ in range(settings.WARMUP_DB_CONNECTIONS)))
+
+    async def _warm_openai(self) -> None:
+        """
+        Abre a conexão TLS com a OpenAI no cliente httpx que o langchain-openai compartilha
+        entre os ChatOpenAI com a configuração padrão. Não obrigatória: sem ela o primeiro turno só fica mais lento.
+        """
+        from langchain_openai import ChatOpenAI
+
+        await ChatOpenAI(model="gpt-4.1-mini").root_async_client.models.list()
+
+    async def _warm_turn(self, project: str) -> None:
+        hook = graph_registry.warmup_hook(project)
+        if hook is not None:
+            await hook()
+            return
+
+        graph = await graph_registry.aget(project)
+        _install_llm_stub()
+        token = _stub_llm.set(True)
+        try:
+            state = {"messages": [HumanMessage(content="Olá")], "last_ai_message": None, "last_human_message": None}
+            async for _ in graph.astream(state, stream_mode="values"):
+                pass
+        finally:
+            _stub_llm.reset(token)
+
+
+warmup: Warmup = Warmup()
@@ -1,6 +1,7 @@
 from core.configs import settings
 from core.database import engine
 
+# Apaga e recria todas as tabelas: só para banco novo. Banco em uso: migrar_tabelas.py
 async def create_tables() -> None:
     import models.__all_models
     print('Criando as tabelas no banco de dados')
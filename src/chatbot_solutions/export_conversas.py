@@ -0,0 +1,58 @@
+"""
+Exporta as conversas em NDJSON (uma linha por mensagem) para o BI:
+
+    cd src/chatbot_solutions
+    python export_conversas.py [--project P] [--since 2025-01-01] [--until 2025-02-01] [--output arquivo.ndjson]
+
+Lê por um cursor no servidor (core/export.py), então a memória fica constante qualquer que seja
+o tamanho da tabela. O período filtra pela última atividade da conversa (updated_at: mensagem
+nova ou turno gravado); sem --output escreve na saída padrão.
+O mesmo formato sai de GET /api/v1/admin/conversations/export.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from datetime import datetime
+
+from core.configs import settings
+from core.database import engine
+from core.export import stream_ndjson
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    stream=sys.stderr
+)
+logger = logging.getLogger("export_conversas")
+
+
+async def export(args: argparse.Namespace) -> None:
+    started = time.monotonic()
+    lines = 0
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        async for line in stream_ndjson(args.project, args.since, args.until, args.batch_size):
+            output.write(line)
+            lines += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        await engine.dispose()
+    elapsed = time.monotonic() - started
+    logger.info("%s mensagens exportadas em %.1fs (%.0f linhas/s)", lines, elapsed, lines / elapsed if elapsed else 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exporta as mensagens das conversas em NDJSON.')
+    parser.add_argument('--project', help='Só as conversas deste projeto')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='Última atividade a partir de (ISO 8601, inclusive)')
+    parser.add_argument('--until', type=datetime.fromisoformat, help='Última atividade antes de (ISO 8601, exclusive)')
+    parser.add_argument('--output', help='Arquivo de saída (padrão: saída padrão)')
+    parser.add_argument('--batch-size', type=int, default=settings.EXPORT_BATCH_SIZE,
+                        help='Linhas buscadas por vez no cursor do servidor')
+    args = parser.parse_args()
+
+    asyncio.run(export(args))
@@ -2,7 +2,7 @@ import os
 import operator
 from typing import Annotated, TypedDict, List, Dict, Any, Optional, Tuple
 import json
-from transformers import pipeline
+from functools import lru_cache
 from datetime import datetime
 import re
 from dotenv import load_dotenv
@@ -11,12 +11,9 @@ from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMe
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
 from schemas.usuario_schema import AgentState
-from crewai import Agent, Task, Crew, Process
-from crewai.tools import BaseTool
+from core.tool_loop import GuardedToolNode, route_after_tools
 import requests
-from bs4 import BeautifulSoup
 from requests.exceptions import HTTPError, Timeout, RequestException
 
 # ETAPA 1: CONFIGURAÇÕES E CONHECIMENTO BASE
@@ -36,12 +33,17 @@ llm = ChatOpenAI(
     temperature=0.8
 )
 
-# Carrega pipeline de análise de sentimento (CardiffNLP)
-sentiment_pipeline = pipeline(
-    "sentiment-analysis",
-    model="cardiffnlp/xlm-roberta-base-tweet-sentiment-pt",
-    tokenizer="cardiffnlp/xlm-roberta-base-tweet-sentiment-pt"
-)
+# Pipeline de análise de sentimento (CardiffNLP), carregado no primeiro uso:
+# transformers + torch + o modelo levam dezenas de segundos e centenas de MB
+@lru_cache(maxsize=None)
+def get_sentiment_pipeline():
+    from transformers import pipeline
+
+    return pipeline(
+        "sentiment-analysis",
+        model="cardiffnlp/xlm-roberta-base-tweet-sentiment-pt",
+        tokenizer="cardiffnlp/xlm-roberta-base-tweet-sentiment-pt"
+    )
 
 # Este é o conhecimento base "embutido" no agente.
 ROBBU_KNOWLEDGE_BASE = """
@@ -141,58 +143,69 @@ def _domain_like(s: Optional[str]) -> bool:
 
 # ETAPA 2: FERRAMENTAS - CREW COMO FERRAMENTA
 
-class ContextSearchTool(BaseTool):
-    name: str = "Busca na Documentação Interna"
-    description: str = "Busca a URL da documentação mais relevante para uma pergunta técnica."
-
-    def _find_best_match(self, query: str, docs_context: List[Dict]) -> Tuple[Dict, int]:
-        query_lower = query.lower()
-        best_match_doc = None
-        best_score = 0
-        query_tokens = set(re.findall(r"\w+", query_lower))
-        for doc in docs_context:
-            score = 0
-            doc_name_lower = doc["name"].lower()
-            doc_keywords = {k.lower() for k in doc.get("keywords", [])}
-            if any(tok in doc_name_lower for tok in query_tokens):
-                score += 5
-            score += len(query_tokens.intersection(doc_keywords)) * 3
-            if score > best_score:
-                best_score = score
-                best_match_doc = doc
-        return best_match_doc, best_score
-
-    def _run(self, query: str) -> str:
-        try:
-            robbu_match, robbu_score = self._find_best_match(query, ROBBU_DOCS_CONTEXT)
-            if robbu_match:
-                return robbu_match.get("url", "")
-            return "Nenhuma URL encontrada na base local."
-        except Exception as e:
-            return f"[ERRO_BUSCA_DOCS:{str(e)}]"
-
-class EnhancedWebScrapeTool(BaseTool):
-    name: str = "Extração Avançada de Conteúdo Web"
-    description: str = "Extrai conteúdo de páginas web com tratamento de erros e formatação."
-
-    def _run(self, url: str) -> str:
-        try:
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            for element in soup(["script", "style", "nav", "header", "footer", "aside"]):
-                element.decompose()
-            main_content = (soup.find('main') or soup.find('article') or soup.find('body'))
-            text = main_content.get_text("\n", strip=True) if main_content else ""
-            return '\n'.join([line.strip() for line in text.split('\n') if line.strip()])[:4000]
-        except Exception as e:
-            return f"[ERRO_EXTRACAO:{str(e)}]"
+@lru_cache(maxsize=None)
+def _crew_tools():
+    """Ferramentas da CrewAI, definidas no primeiro uso: importar crewai (e bs4) custa segundos no startup."""
+    from crewai.tools import BaseTool
+    from bs4 import BeautifulSoup
+
+    class ContextSearchTool(BaseTool):
+        name: str = "Busca na Documentação Interna"
+        description: str = "Busca a URL da documentação mais relevante para uma pergunta técnica."
+
+        def _find_best_match(self, query: str, docs_context: List[Dict]) -> Tuple[Dict, int]:
+            query_lower = query.lower()
+            best_match_doc = None
+            best_score = 0
+            query_tokens = set(re.findall(r"\w+", query_lower))
+            for doc in docs_context:
+                score = 0
+                doc_name_lower = doc["name"].lower()
+                doc_keywords = {k.lower() for k in doc.get("keywords", [])}
+                if any(tok in doc_name_lower for tok in query_tokens):
+                    score += 5
+                score += len(query_tokens.intersection(doc_keywords)) * 3
+                if score > best_score:
+                    best_score = score
+                    best_match_doc = doc
+            return best_match_doc, best_score
+
+        def _run(self, query: str) -> str:
+            try:
+                robbu_match, robbu_score = self._find_best_match(query, ROBBU_DOCS_CONTEXT)
+                if robbu_match:
+                    return robbu_match.get("url", "")
+                return "Nenhuma URL encontrada na base local."
+            except Exception as e:
+                return f"[ERRO_BUSCA_DOCS:{str(e)}]"
+
+    class EnhancedWebScrapeTool(BaseTool):
+        name: str = "Extração Avançada de Conteúdo Web"
+        description: str = "Extrai conteúdo de páginas web com tratamento de erros e formatação."
+
+        def _run(self, url: str) -> str:
+            try:
+                headers = {'User-Agent': 'Mozilla/5.0'}
+                response = requests.get(url, headers=headers, timeout=10)
+                response.raise_for_status()
+                soup = BeautifulSoup(response.text, 'html.parser')
+                for element in soup(["script", "style", "nav", "header", "footer", "aside"]):
+                    element.decompose()
+                main_content = (soup.find('main') or soup.find('article') or soup.find('body'))
+                text = main_content.get_text("\n", strip=True) if main_content else ""
+                return '\n'.join([line.strip() for line in text.split('\n') if line.strip()])[:4000]
+            except Exception as e:
+                return f"[ERRO_EXTRACAO:{str(e)}]"
+
+    return ContextSearchTool, EnhancedWebScrapeTool
 
 # - A LÓGICA DA CREW ENCAPSULADA EM UMA CLASSE -
 class TechnicalCrewExecutor:
     def run(self, query: str) -> str:
         """Executa a Crew de agentes para encontrar uma resposta técnica."""
+        from crewai import Agent, Task, Crew, Process
+
+        ContextSearchTool, EnhancedWebScrapeTool = _crew_tools()
         pesquisador = Agent(
             role="Especialista em Pesquisa de Documentação",
             goal="Localizar a URL mais relevante na base de conhecimento para responder a uma pergunta técnica.",
@@ -665,7 +678,7 @@ def montar_requisicao(project: str,
     """
     try:
         # 1) roda o sentimento sobre a mensagem informada
-        sent = sentiment_pipeline(message)
+        sent = get_sentiment_pipeline()(message)
         main = sent[0] if isinstance(sent, list) and sent else {"label": "N/A", "score": 0.0}
         label = main.get("label", "N/A")
         score = float(main.get("score", 0.0))
@@ -714,7 +727,7 @@ tools = [
     Get_finalizaCliente,
     montar_requisicao,
 ]
-tool_executor = ToolNode(tools)
+tool_executor = GuardedToolNode(tools, project="Qualificador Leads IA")
 model = llm.bind_tools(tools)
 
 # PROMPT PRINCIPAL
@@ -965,7 +978,7 @@ def sentiment_analysis_node(state):
         user_message = messages[-1]
     text = getattr(user_message, "content", None) or str(user_message)
     try:
-        result = sentiment_pipeline(text)
+        result = get_sentiment_pipeline()(text)
     except Exception as e:
         result = [{"label": "ERROR", "score": 0.0, "error": str(e)}]
 
@@ -1009,7 +1022,22 @@ workflow.add_conditional_edges(
     should_continue,
     {"continue": "action", "openrouter": "openrouter", "end": "sentiment_analysis"},
 )
-workflow.add_edge("action", "agent")
+# Com o limite de ferramentas do turno atingido, a resposta segura segue para o fim como as demais
+workflow.add_conditional_edges("action", route_after_tools, {"agent": "agent", "end": "sentiment_analysis"})
 workflow.add_edge("openrouter", END)
 workflow.add_edge("sentiment_analysis", END)
 agent_graph_leads = workflow.compile()
+
+
+def load_assets() -> None:
+    """Carrega o que este módulo só importa no primeiro uso (chamado no preload do gunicorn)."""
+    get_sentiment_pipeline()
+    _crew_tools()
+
+
+def warmup() -> None:
+    """
+    Aquecimento do worker (core/warmup.py). O nó de sentimento grava o arquivo do lead,
+    então em vez de um turno sintético roda só uma inferência, que inicializa o modelo e o tokenizer.
+    """
+    get_sentiment_pipeline()("Olá, tudo bem?")
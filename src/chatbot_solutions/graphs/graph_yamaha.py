@@ -1,6 +1,7 @@
+import logging
+
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
 from langchain_openai import ChatOpenAI
 from schemas.usuario_schema import AgentState
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, messages_from_dict, messages_to_dict
@@ -8,30 +9,35 @@ from webhook_calls import trigger_webhook_tool_call, trigger_webhook_message
 from langchain_core.tools import tool
 from dotenv import load_dotenv
 
+from core.configs import settings
+from core.contract_service import ContractServiceError, contract_service
+from core.tool_loop import GuardedToolNode, route_after_tools
+
 load_dotenv()
 
-# Tool de exemplo
-@tool
-def buscar_contrato_1(cpf: str) -> str:
-    """Busca a primeira parte das informações do(s) contrato(s) do cliente."""
-    return "Wait for external data..."
+logger = logging.getLogger(__name__)
 
 
-# Tool de exemplo
-@tool
-def buscar_contrato_2(cpf: str) -> str:
-    """Busca a segunda parte das informações do(s) contrato(s) do cliente."""
-    return "Wait for external data..."
+async def _consultar_servico(ferramenta: str, cpf: str) -> str:
+    try:
+        return await contract_service.call(ferramenta, {"cpf": cpf})
+    except ContractServiceError as e:
+        logger.error("Erro ao consultar o serviço de contratos: %s", str(e))
+        return "Não foi possível consultar o contrato agora. Tente novamente em instantes."
 
-tools = [buscar_contrato_1, buscar_contrato_2]
-model = ChatOpenAI(model="gpt-4o").bind_tools(tools)
+
+# Com YAMAHA_TOOLS_MODE=webhook as tools não rodam aqui: a tool call vai para o webhook do cliente
+# e os resultados voltam por /submit_tools. Com "server" elas consultam o serviço de contratos.
+@tool
+async def buscar_contrato_1(cpf: str) -> str:
+    """Busca a primeira parte das informações do(s) contrato(s) do cliente."""
+    return await _consultar_servico("buscar_contrato_1", cpf)
 
 
-# Tool de exemplo
 @tool
-def buscar_contrato_2(cpf: str) -> str:
+async def buscar_contrato_2(cpf: str) -> str:
     """Busca a segunda parte das informações do(s) contrato(s) do cliente."""
-    return "Wait for external data..."
+    return await _consultar_servico("buscar_contrato_2", cpf)
 
 tools = [buscar_contrato_1, buscar_contrato_2]
 model = ChatOpenAI(model="gpt-4o").bind_tools(tools)
@@ -47,19 +53,19 @@ async def our_agent(state: AgentState) -> AgentState:
     """)
 
     all_messages = [system_prompt] + list(state["messages"])
-    response = model.invoke(all_messages)
+    response = await model.ainvoke(all_messages)
     state = {"messages": list(state["messages"]) + [response],
             "last_ai_message": [response],
             "last_human_message": state["last_human_message"]}
 
     return state
 
-# # Condição de parada
-# def is_tool(state: AgentState) -> str:
-#     last_ai_message = state["last_ai_message"][-1]
-#     if hasattr(last_ai_message, "tool_calls") and last_ai_message.tool_calls:
-#         return "continue"
-#     return "end"
+# Condição de parada (modo server): com tool calls, executa as ferramentas e volta ao agente
+def is_tool(state: AgentState) -> str:
+    last_ai_message = state["last_ai_message"][-1]
+    if hasattr(last_ai_message, "tool_calls") and last_ai_message.tool_calls:
+        return "continue"
+    return "end"
 
 # Criação do grafo LangGraph
 graph = StateGraph(AgentState)
@@ -67,5 +73,11 @@ graph.add_node("agent", our_agent)
 
 graph.set_entry_point("agent")
 
-graph.add_edge("agent", END)
+if settings.YAMAHA_TOOLS_MODE == "server":
+    # O ToolNode roda as tool calls da mesma AIMessage em paralelo (com o limite de rodadas do turno)
+    graph.add_node("tools", GuardedToolNode(tools, project="Yamaha Cobrança IA"))
+    graph.add_conditional_edges("agent", is_tool, {"continue": "tools", "end": END})
+    graph.add_conditional_edges("tools", route_after_tools, {"agent": "agent", "end": END})
+else:
+    graph.add_edge("agent", END)
 langgraph_app = graph.compile()
@@ -1,4 +1,5 @@
 import os
+import logging
 import operator
 import time
 from typing import Annotated, TypedDict, List
@@ -7,6 +8,7 @@ import uuid
 import hashlib
 import unicodedata
 import requests
+from functools import lru_cache
 
 # --- Dependências Essenciais ---
 from dotenv import load_dotenv
@@ -15,16 +17,19 @@ from openai import OpenAI
 from langchain_core.messages import BaseMessage, ToolMessage, AIMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
-from crewai.tasks.hallucination_guardrail import HallucinationGuardrail
 from typing import Tuple
 
 # --- Dependências da CrewAI ---
-from crewai import Agent, Task, Crew, Process
-from crewai.tools import BaseTool
-from bs4 import BeautifulSoup
+# crewai e bs4 são importados no primeiro uso da pesquisa técnica (ver _crew_tools)
+
+from core.configs import settings
+from core.deadlines import remaining_budget
+from core.tool_loop import GuardedToolNode, route_after_tools
+
+
+logger = logging.getLogger(__name__)
 
 
 def _gen_tool_call_id() -> str:
@@ -237,22 +242,30 @@ ANSWER_LLM = ChatOpenAI(model="gpt-4.1", api_key=API_KEY)
 CREW_AI_LLM = ChatOpenAI(model="gpt-4.1-mini", api_key=API_KEY, temperature=0.7)
 
 # ETAPA 3: FERRAMENTAS
-class EnhancedWebScrapeTool(BaseTool):
-    name: str = "Extração Avançada de Conteúdo Web"
-    description: str = "Extrai conteúdo de páginas web com tratamento de erros e formatação."
-    def _run(self, url: str) -> str:
-        try:
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            response = requests.get(url, headers=headers, timeout=int(os.getenv("SCRAPE_TIMEOUT_SECONDS", "10")))
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            for element in soup(["script", "style", "nav", "header", "footer", "aside"]):
-                element.decompose()
-            main_content = (soup.find('main') or soup.find('article') or soup.find('body'))
-            text = main_content.get_text("\n", strip=True) if main_content else ""
-            return '\n'.join([line.strip() for line in text.split('\n') if line.strip()])[:int(os.getenv("SCRAPE_MAX_CHARS", "5500"))]
-        except Exception as e:
-            return f"[ERRO_EXTRACAO:{str(e)}]"
+@lru_cache(maxsize=None)
+def _crew_tools():
+    """Ferramentas da CrewAI, definidas no primeiro uso: importar crewai (e bs4) custa segundos no startup."""
+    from crewai.tools import BaseTool
+    from bs4 import BeautifulSoup
+
+    class EnhancedWebScrapeTool(BaseTool):
+        name: str = "Extração Avançada de Conteúdo Web"
+        description: str = "Extrai conteúdo de páginas web com tratamento de erros e formatação."
+        def _run(self, url: str) -> str:
+            try:
+                headers = {'User-Agent': 'Mozilla/5.0'}
+                response = requests.get(url, headers=headers, timeout=int(os.getenv("SCRAPE_TIMEOUT_SECONDS", "10")))
+                response.raise_for_status()
+                soup = BeautifulSoup(response.text, 'html.parser')
+                for element in soup(["script", "style", "nav", "header", "footer", "aside"]):
+                    element.decompose()
+                main_content = (soup.find('main') or soup.find('article') or soup.find('body'))
+                text = main_content.get_text("\n", strip=True) if main_content else ""
+                return '\n'.join([line.strip() for line in text.split('\n') if line.strip()])[:int(os.getenv("SCRAPE_MAX_CHARS", "5500"))]
+            except Exception as e:
+                return f"[ERRO_EXTRACAO:{str(e)}]"
+
+    return EnhancedWebScrapeTool
 
 #  Utilitário simples para hash (evitar logar PII)
 def _hash_text(text: str) -> str:
@@ -338,6 +351,10 @@ def format_history_for_llm(messages: List[BaseMessage], max_messages: int = 12,
 
 class TechnicalCrewExecutor:
     def run(self, query: str) -> str:
+        from crewai import Agent, Task, Crew, Process
+
+        EnhancedWebScrapeTool = _crew_tools()
+
         analisador = Agent(
             role="Analisador de Documentos",
             goal="Analisar a pergunta e encontrar a URL mais relevante.",
@@ -431,6 +448,12 @@ class TechnicalCrewExecutor:
 @tool
 def pesquisa_tecnica_avancada_robbu(query: str) -> str:
     """Use para responder a perguntas técnicas sobre a plataforma Robbu, funcionalidades, ou a API do WhatsApp."""
+    # As quatro crews levam dezenas de segundos: sem tempo para elas, segue sem a documentação
+    remaining = remaining_budget()
+    if remaining is not None and remaining < settings.CREW_MIN_BUDGET_SECONDS:
+        logger.warning("Pesquisa técnica sem as crews: %.0fs restantes no turno (mínimo %ss)",
+                       remaining, settings.CREW_MIN_BUDGET_SECONDS)
+        return "N/A"
     return TechnicalCrewExecutor().run(query)
 
 @tool
@@ -520,7 +543,7 @@ async def input_topic_guardrail(user_query: str, history: List[BaseMessage]) ->
     O tópico está 'DENTRO DO ESCOPO' ou 'FORA DO ESCOPO'?
     """
     try:
-        result = validator_llm.invoke(prompt)
+        result = await validator_llm.ainvoke(prompt)
         return result.decision == "FORA DO ESCOPO"
     except Exception as e:
         return False
@@ -589,7 +612,7 @@ async def factual_guardrail(message_to_validate: AIMessage, user_query: str, his
     """
 
     try:
-        judge_result = validator_llm_with_tool.invoke(validator_prompt)
+        judge_result = await validator_llm_with_tool.ainvoke(validator_prompt)
 
         if judge_result.decision == "REPROVADO":
             tool_call_id = _gen_tool_call_id()
@@ -634,7 +657,7 @@ async def agent_node(state: AgentState) -> dict:
                 last_human_query = msg.content
                 break
 
-        final_response = CHAIN_NO_TOOLS.invoke({"messages": messages})
+        final_response = await CHAIN_NO_TOOLS.ainvoke({"messages": messages})
 
         # Guardrail de saída COM histórico
         validated_response = await factual_guardrail(final_response, last_human_query, messages)
@@ -714,7 +737,7 @@ async def agent_node(state: AgentState) -> dict:
             return {"messages": [AIMessage(content=msg)]}
 
         # Fluxo normal para perguntas dentro do escopo
-        response = CHAIN_WITH_TOOLS.invoke({"messages": messages})
+        response = await CHAIN_WITH_TOOLS.ainvoke({"messages": messages})
 
         # Se o modelo decidiu usar uma ferramenta, devolva para o ToolNode executar
         if response.tool_calls:
@@ -755,7 +778,7 @@ def build_graph():
     workflow = StateGraph(AgentState)
 
     TOOLS = [pesquisa_tecnica_avancada_robbu, falar_com_atendente_humano, finalizar_conversa]
-    TOOL_EXECUTOR = ToolNode(TOOLS)
+    TOOL_EXECUTOR = GuardedToolNode(TOOLS, project="HelpDesk IA")
 
     # CHAINs separados (com e sem ferramentas) — Opção A
     global PROMPT, CHAIN_WITH_TOOLS, CHAIN_NO_TOOLS
@@ -778,8 +801,13 @@ def build_graph():
             END: END
         },
     )
-    workflow.add_edge("action", "agent")
+    workflow.add_conditional_edges("action", route_after_tools, {"agent": "agent", "end": END})
 
     return workflow.compile()
 
 APP = build_graph()
+
+
+def load_assets() -> None:
+    """Carrega o que este módulo só importa no primeiro uso (chamado no preload do gunicorn)."""
+    _crew_tools()
@@ -1,67 +1,78 @@
-from crewai.tools import BaseTool
-from typing import TypedDict, List, Dict, Any, Optional, Tuple
+from typing import TypedDict, List, Dict, Any, Optional, Tuple, Annotated
 import re, requests
-from bs4 import BeautifulSoup
-from crewai import Agent, Task, Crew, Process
+from functools import lru_cache
 from ..rd_station.utils import ROBBU_DOCS_CONTEXT
 from ..llm.llm import llm
 from langchain_core.messages import BaseMessage
+from langgraph.graph.message import add_messages
 class AgentState(TypedDict):
-    messages: List[BaseMessage]
+    # add_messages: com checkpoint o turno recebe só as mensagens novas, que se somam às do checkpoint
+    messages: Annotated[List[BaseMessage], add_messages]
 
 # CREW COMO FERRAMENTAS ESPECIALIZADAS
-class ContextSearchTool(BaseTool):
-    name: str = "Busca na Documentação Interna"
-    description: str = "Busca a URL da documentação mais relevante para uma pergunta técnica."
-
-    def _find_best_match(self, query: str, docs_context: List[Dict]) -> Tuple[Dict, int]:
-        query_lower = query.lower()
-        best_match_doc = None
-        best_score = 0
-        query_tokens = set(re.findall(r"\w+", query_lower))
-        for doc in docs_context:
-            score = 0
-            doc_name_lower = doc["name"].lower()
-            doc_keywords = {k.lower() for k in doc.get("keywords", [])}
-            if any(tok in doc_name_lower for tok in query_tokens):
-                score += 5
-            score += len(query_tokens.intersection(doc_keywords)) * 3
-            if score > best_score:
-                best_score = score
-                best_match_doc = doc
-        return best_match_doc, best_score
-
-    def _run(self, query: str) -> str:
-        try:
-            robbu_match, robbu_score = self._find_best_match(query, ROBBU_DOCS_CONTEXT)
-            if robbu_match:
-                return robbu_match.get("url", "")
-            return "Nenhuma URL encontrada na base local."
-        except Exception as e:
-            return f"[ERRO_BUSCA_DOCS:{str(e)}]"
-
-class EnhancedWebScrapeTool(BaseTool):
-    name: str = "Extração Avançada de Conteúdo Web"
-    description: str = "Extrai conteúdo de páginas web com tratamento de erros e formatação."
-
-    def _run(self, url: str) -> str:
-        try:
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            for element in soup(["script", "style", "nav", "header", "footer", "aside"]):
-                element.decompose()
-            main_content = (soup.find('main') or soup.find('article') or soup.find('body'))
-            text = main_content.get_text("\n", strip=True) if main_content else ""
-            return '\n'.join([line.strip() for line in text.split('\n') if line.strip()])[:4000]
-        except Exception as e:
-            return f"[ERRO_EXTRACAO:{str(e)}]"
+@lru_cache(maxsize=None)
+def _crew_tools():
+    """Ferramentas da CrewAI, definidas no primeiro uso: importar crewai (e bs4) custa segundos no startup."""
+    from crewai.tools import BaseTool
+    from bs4 import BeautifulSoup
+
+    class ContextSearchTool(BaseTool):
+        name: str = "Busca na Documentação Interna"
+        description: str = "Busca a URL da documentação mais relevante para uma pergunta técnica."
+
+        def _find_best_match(self, query: str, docs_context: List[Dict]) -> Tuple[Dict, int]:
+            query_lower = query.lower()
+            best_match_doc = None
+            best_score = 0
+            query_tokens = set(re.findall(r"\w+", query_lower))
+            for doc in docs_context:
+                score = 0
+                doc_name_lower = doc["name"].lower()
+                doc_keywords = {k.lower() for k in doc.get("keywords", [])}
+                if any(tok in doc_name_lower for tok in query_tokens):
+                    score += 5
+                score += len(query_tokens.intersection(doc_keywords)) * 3
+                if score > best_score:
+                    best_score = score
+                    best_match_doc = doc
+            return best_match_doc, best_score
+
+        def _run(self, query: str) -> str:
+            try:
+                robbu_match, robbu_score = self._find_best_match(query, ROBBU_DOCS_CONTEXT)
+                if robbu_match:
+                    return robbu_match.get("url", "")
+                return "Nenhuma URL encontrada na base local."
+            except Exception as e:
+                return f"[ERRO_BUSCA_DOCS:{str(e)}]"
+
+    class EnhancedWebScrapeTool(BaseTool):
+        name: str = "Extração Avançada de Conteúdo Web"
+        description: str = "Extrai conteúdo de páginas web com tratamento de erros e formatação."
+
+        def _run(self, url: str) -> str:
+            try:
+                headers = {'User-Agent': 'Mozilla/5.0'}
+                response = requests.get(url, headers=headers, timeout=10)
+                response.raise_for_status()
+                soup = BeautifulSoup(response.text, 'html.parser')
+                for element in soup(["script", "style", "nav", "header", "footer", "aside"]):
+                    element.decompose()
+                main_content = (soup.find('main') or soup.find('article') or soup.find('body'))
+                text = main_content.get_text("\n", strip=True) if main_content else ""
+                return '\n'.join([line.strip() for line in text.split('\n') if line.strip()])[:4000]
+            except Exception as e:
+                return f"[ERRO_EXTRACAO:{str(e)}]"
+
+    return ContextSearchTool, EnhancedWebScrapeTool
 
 # - A LÓGICA DA CREW ENCAPSULADA EM UMA CLASSE -
 class TechnicalCrewExecutor:
     def run(self, query: str) -> str:
         """Executa a Crew de agentes para encontrar uma resposta técnica."""
+        from crewai import Agent, Task, Crew, Process
+
+        ContextSearchTool, EnhancedWebScrapeTool = _crew_tools()
         pesquisador = Agent(
             role="Especialista em Pesquisa de Documentação",
             goal="Localizar a URL mais relevante na base de conhecimento para responder a uma pergunta técnica.",
@@ -1,5 +1,5 @@
 from langgraph.graph import StateGraph, END
-from .crew_ai_agents.agents_schema import AgentState
+from .crew_ai_agents.agents_schema import AgentState, _crew_tools
 from .nodes.nodes import call_model, tool_executor
 from .edges.edges import should_continue
 
@@ -14,3 +14,8 @@ workflow.add_conditional_edges(
 )
 workflow.add_edge("action", "agent")
 leads_ia_graph = workflow.compile()
+
+
+def load_assets() -> None:
+    """Carrega o que este grafo só importa no primeiro uso (chamado no preload do gunicorn)."""
+    _crew_tools()
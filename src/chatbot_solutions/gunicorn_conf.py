@@ -0,0 +1,45 @@
+"""
+Entrada para produção com vários workers:
+
+    cd src/chatbot_solutions
+    gunicorn -c gunicorn_conf.py main:app
+
+O app é importado no master (preload_app) e os grafos de PREFORK_PRELOAD são construídos
+antes do fork. Os workers herdam modelo de sentimento, torch e CrewAI por copy-on-write
+em vez de carregar uma cópia cada. Em desenvolvimento, `python main.py` continua valendo.
+"""
+import gc
+import logging
+import os
+
+# Os tokenizers do Hugging Face desligam o paralelismo (com aviso) ao detectar fork depois de usá-lo
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Carregar os grafos pode levar mais que o timeout padrão de 30s
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# Precisa cobrir o DRAIN_TIMEOUT_SECONDS do app (turnos em andamento terminando no desligamento)
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+logger = logging.getLogger("gunicorn.error")
+
+
+def on_starting(server):
+    from core.configs import settings
+    from core.graph_registry import graph_registry
+    from core.memory import describe_memory
+
+    graph_registry.preload(settings.PREFORK_PRELOAD)
+    # Tira os objetos já carregados do rastreamento do GC: as coletas nos workers não
+    # escrevem mais nessas páginas, que continuam compartilhadas com o master
+    gc.freeze()
+    server.log.info("Grafos pré-carregados no master: %s (%s)", graph_registry.loaded(), describe_memory())
+
+
+def post_worker_init(worker):
+    from core.memory import describe_memory
+
+    worker.log.info("Worker %s iniciado (%s)", worker.pid, describe_memory())
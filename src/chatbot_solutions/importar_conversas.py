@@ -0,0 +1,53 @@
+"""
+Importa conversas históricas (ex.: WhatsApp de um cliente migrando para os grafos):
+
+    cd src/chatbot_solutions
+    python importar_conversas.py conversas.ndjson [outros.ndjson ...] [--batch-size N]
+
+Cada linha é uma conversa no formato de ConversationImportSchema:
+
+    {"contact": {...mesmo Contact de /chat...},
+     "messages": [{"message": "oi", "timestamp": "2024-05-01T10:00:00-03:00", "role": "human"},
+                  {"message": "Olá! Como posso ajudar?", "role": "ai"}]}
+
+As linhas são validadas como em /chat, convertidas para o formato gravado pelos turnos e
+carregadas com COPY em lotes (core/importer.py). Conversas que já existem (mesmo projeto,
+telefone e protocolo) são mantidas como estão. Rode criar_tabelas.py antes, só em banco novo.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+from core.configs import settings
+from core.database import engine
+from core.importer import import_conversations
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    stream=sys.stderr
+)
+logger = logging.getLogger("importar_conversas")
+
+
+async def main(paths, batch_size: int) -> int:
+    try:
+        stats = await import_conversations(paths, batch_size)
+    finally:
+        await engine.dispose()
+    logger.info("%s linhas lidas, %s inválidas; %s conversas (%s mensagens): %s importadas e %s já existentes, %.0f conversas/s (%.0f mensagens/s)",
+                stats.lines, stats.invalid, stats.conversations, stats.messages, stats.inserted, stats.skipped, stats.rate(),
+                stats.message_rate())
+    return 1 if stats.invalid else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Importa conversas históricas (NDJSON) com COPY.')
+    parser.add_argument('paths', nargs='+', help='Arquivos NDJSON, uma conversa por linha')
+    parser.add_argument('--batch-size', type=int, default=settings.IMPORT_BATCH_SIZE,
+                        help='Conversas por lote de COPY')
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args.paths, args.batch_size)))
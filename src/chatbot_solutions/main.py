@@ -1,7 +1,19 @@
+# Primeiro import: com IMPORT_PROFILE=1 mede o tempo de import de todo o resto
+from core.import_profile import import_profiler
+
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from core.configs import settings
+from core.bulkheads import bulkheads
+from core.checkpoints import checkpoints
+from core.contract_service import contract_service
+from core.drain import graceful_drain
+from core.graph_registry import graph_registry
+from core.warmup import warmup
 from api.v1.api import api_router
+from api import health
 import logging
 
 
@@ -10,8 +22,26 @@ logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 
-app = FastAPI(title='Chat API - IA')
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    import_profiler.log_report("Imports até o startup")
+    await graph_registry.apreload(settings.GRAPH_PRELOAD)
+    await checkpoints.start()
+    await bulkheads.start()
+    graceful_drain.start()
+    warmup.start()
+    yield
+    await warmup.stop()
+    # Espera os turnos em andamento e grava os que não terminarem para outro worker retomar
+    await graceful_drain.drain()
+    await bulkheads.stop()
+    await checkpoints.aclose()
+    await contract_service.aclose()
+
+
+app = FastAPI(title='Chat API - IA', lifespan=lifespan)
 app.include_router(api_router, prefix=settings.API_V1_STR)
+app.include_router(health.router, prefix='/health', tags=['health'])
 
 
 
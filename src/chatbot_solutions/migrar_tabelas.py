@@ -0,0 +1,122 @@
+"""
+Atualiza um banco já em uso para o esquema atual sem apagar as conversas (criar_tabelas.py
+recria todas as tabelas do zero, então só serve para banco novo):
+
+    cd src/chatbot_solutions
+    python migrar_tabelas.py
+
+Idempotente: pode rodar mais de uma vez. Cria as tabelas que faltam (idempotency_keys,
+pending_turns, finished_turns, turn_workers), as colunas novas de usuarios (lease, checkpoint, created_at/updated_at)
+e os índices; created_at/updated_at das conversas antigas vêm dos timestamps das mensagens.
+Conversas duplicadas (mesmo projeto, telefone e protocolo, de antes do índice único) são
+juntadas na mais antiga. Rodar com a API e os workers parados: tudo roda em uma
+transação e a criação dos índices bloqueia escritas em usuarios.
+"""
+from sqlalchemy import text
+
+from core.configs import settings
+from core.database import engine
+
+
+COLUMNS = [
+    "ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS lease_owner varchar(128)",
+    "ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS lease_expires_at timestamptz",
+    "ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS checkpoint_id varchar(64)",
+    "ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS created_at timestamptz NOT NULL DEFAULT now()",
+    "ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now()",
+]
+
+EXISTING_COLUMNS = "SELECT column_name FROM information_schema.columns WHERE table_name = 'usuarios'"
+
+# created_at/updated_at recém-criados valem a hora da migração: passam a ser o timestamp da
+# primeira e da última mensagem do histórico (metadata.timestamp, gravado por /chat e pela
+# importação). Timestamps sem fuso são do horário de Brasília, como na importação
+BACKFILL_ACTIVITY = """
+WITH atividade AS (
+    SELECT u.id, min(t.ts) AS primeira, max(t.ts) AS ultima
+    FROM usuarios u
+    CROSS JOIN LATERAL (
+        SELECT (m.value -> 'data' -> 'metadata' ->> 'timestamp')::timestamptz AS ts
+        FROM jsonb_array_elements(u.messages) AS m(value)
+        WHERE m.value -> 'data' -> 'metadata' ->> 'timestamp' ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}'
+    ) t
+    GROUP BY u.id
+)
+UPDATE usuarios u
+SET created_at = a.primeira, updated_at = a.ultima
+FROM atividade a
+WHERE u.id = a.id
+"""
+
+# Junta o histórico das duplicadas (em ordem de id) na conversa mais antiga, com o lease e o
+# checkpoint zerados: o próximo turno reconstrói o estado a partir do histórico juntado
+MERGE_DUPLICATES = """
+WITH duplicadas AS (
+    SELECT id, first_value(id) OVER w AS keep_id, count(*) OVER (PARTITION BY project, phone, protocol) AS total
+    FROM usuarios
+    WINDOW w AS (PARTITION BY project, phone, protocol ORDER BY id)
+),
+juntas AS (
+    SELECT d.keep_id, jsonb_agg(m.value ORDER BY d.id, m.ordinality) AS messages
+    FROM duplicadas d
+    JOIN usuarios u ON u.id = d.id
+    CROSS JOIN LATERAL jsonb_array_elements(u.messages) WITH ORDINALITY AS m(value, ordinality)
+    WHERE d.total > 1
+    GROUP BY d.keep_id
+)
+UPDATE usuarios u
+SET messages = j.messages, processing = false, lease_owner = NULL, lease_expires_at = NULL, checkpoint_id = NULL
+FROM juntas j
+WHERE u.id = j.keep_id
+"""
+DELETE_DUPLICATES = """
+DELETE FROM usuarios u
+USING usuarios k
+WHERE k.project = u.project AND k.phone = u.phone AND k.protocol = u.protocol AND k.id < u.id
+"""
+
+# ix_usuarios_conversa foi criado sem UNIQUE por versões anteriores de criar_tabelas.py
+CONVERSA_IS_UNIQUE = """
+SELECT i.indisunique FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+WHERE c.relname = 'ix_usuarios_conversa'
+"""
+
+INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_usuarios_conversa ON usuarios (project, phone, protocol)",
+    "CREATE INDEX IF NOT EXISTS ix_usuarios_project_id ON usuarios (project, id)",
+    "CREATE INDEX IF NOT EXISTS ix_usuarios_processing ON usuarios (project, id) WHERE processing",
+    "CREATE INDEX IF NOT EXISTS ix_usuarios_project_updated ON usuarios (project, updated_at)",
+]
+
+
+async def migrate_tables() -> None:
+    import models.__all_models
+    print('Migrando as tabelas do banco de dados')
+
+    async with engine.begin() as conn:
+        # Só cria as tabelas que não existem; usuarios (já existente) é tratada abaixo
+        await conn.run_sync(settings.DBBaseModel.metadata.create_all)
+        existing = set((await conn.execute(text(EXISTING_COLUMNS))).scalars())
+        for statement in COLUMNS:
+            await conn.execute(text(statement))
+
+        merged = await conn.execute(text(MERGE_DUPLICATES))
+        deleted = await conn.execute(text(DELETE_DUPLICATES))
+        if deleted.rowcount:
+            print(f'{merged.rowcount} conversas duplicadas juntadas ({deleted.rowcount} linhas removidas)')
+
+        if 'updated_at' not in existing:
+            await conn.execute(text("SET LOCAL TimeZone = 'America/Sao_Paulo'"))
+            backfilled = await conn.execute(text(BACKFILL_ACTIVITY))
+            print(f'Atividade de {backfilled.rowcount} conversas preenchida a partir das mensagens')
+
+        if (await conn.execute(text(CONVERSA_IS_UNIQUE))).scalar() is False:
+            await conn.execute(text("DROP INDEX ix_usuarios_conversa"))
+        for statement in INDEXES:
+            await conn.execute(text(statement))
+    print('Tabelas migradas com sucesso')
+
+if __name__ == '__main__':
+    import asyncio
+
+    asyncio.run(migrate_tables())
@@ -1 +1,5 @@
-from models.usuario_model import UsuarioModel
\ No newline at end of file
+from models.usuario_model import UsuarioModel
+from models.idempotency_model import IdempotencyKeyModel
+from models.pending_turn_model import PendingTurnModel
+from models.turn_worker_model import TurnWorkerModel
+from models.finished_turn_model import FinishedTurnModel
@@ -0,0 +1,16 @@
+from sqlalchemy import Integer, Column, DateTime, Index, func
+
+from core.configs import settings
+
+# Turnos da fila durável já respondidos (ver core/turn_queue.py): a linha de pending_turns é apagada
+# no fim do turno e esta marca deixa GET /jobs responder "done" até JOB_RESULT_TTL_SECONDS
+class FinishedTurnModel(settings.DBBaseModel):
+    __tablename__ = 'finished_turns'
+
+    # id da linha de pending_turns (o job "turn-<id>")
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    finished_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_finished_turns_finished_at', 'finished_at'),
+    )
@@ -0,0 +1,12 @@
+from sqlalchemy import String, Column, DateTime, func
+from sqlalchemy.dialects.postgresql import JSONB
+
+from core.configs import settings
+
+class IdempotencyKeyModel(settings.DBBaseModel):
+    __tablename__ = 'idempotency_keys'
+
+    key = Column(String(128), primary_key=True)
+    # Resposta devolvida na primeira entrega; NULL (do SQL, não o null do JSON) enquanto ela ainda está sendo processada
+    response = Column(JSONB(none_as_null=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
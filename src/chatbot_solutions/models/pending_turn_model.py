@@ -0,0 +1,33 @@
+from sqlalchemy import Integer, String, Column, DateTime, Index, UniqueConstraint, func
+
+from core.configs import settings
+
+# Fila durável de turnos (ver core/turn_queue.py): uma linha por conversa com mensagens ainda
+# sem resposta. Também recebe os turnos gravados no desligamento de um worker
+class PendingTurnModel(settings.DBBaseModel):
+    __tablename__ = 'pending_turns'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Conversa (mesma chave de usuarios)
+    project = Column(String(256), nullable=False)
+    phone = Column(String(256), nullable=False)
+    protocol = Column(String(256), nullable=False)
+    # Shard da conversa para o roteamento por afinidade (core/affinity.py)
+    shard = Column(Integer, nullable=False, default=0)
+    webhook_url = Column(String(2048), nullable=False)
+    priority = Column(Integer, nullable=False, default=0)
+    # Início da rajada atual e momento a partir do qual o turno pode rodar (debounce)
+    first_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    available_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # Worker executando o turno; se ele morrer, o turno volta para a fila quando claimed_until passar
+    claimed_by = Column(String(128), nullable=True)
+    claimed_until = Column(DateTime(timezone=True), nullable=True)
+    # Incrementada a cada mensagem nova: se mudou durante o turno, a linha continua na fila
+    version = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('project', 'phone', 'protocol', name='uq_pending_turns_conversa'),
+        Index('ix_pending_turns_available', 'available_at'),
+        Index('ix_pending_turns_shard', 'shard'),
+    )
@@ -0,0 +1,11 @@
+from sqlalchemy import String, Column, DateTime, func
+
+from core.configs import settings
+
+# Workers de worker.py ativos; o anel de afinidade (core/affinity.py) é montado a partir desta tabela
+class TurnWorkerModel(settings.DBBaseModel):
+    __tablename__ = 'turn_workers'
+
+    worker_id = Column(String(128), primary_key=True)
+    started_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    heartbeat_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, Column, Text, JSON, Boolean
+from sqlalchemy import Integer, String, Column, Text, JSON, Boolean, DateTime, Index, func, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import JSONB
 
@@ -16,3 +16,23 @@ class UsuarioModel(settings.DBBaseModel):
     email = Column(String(256), index=True, nullable=True)
     messages = Column(JSONB, nullable=False)
     processing = Column(Boolean, nullable=True)
+    # Lease do turno em execução (ver core/locks.py); processing acompanha o lease
+    lease_owner = Column(String(128), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    # Checkpoint do LangGraph que corresponde ao histórico gravado (projetos em CHECKPOINT_PROJECTS)
+    checkpoint_id = Column(String(64), nullable=True)
+    # updated_at é a última atividade da conversa (mensagem nova, turno gravado): as escritas de
+    # lease (core/locks.py, liberação pelo admin) repassam o valor atual para não contarem como atividade
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Uma linha por conversa: as mensagens entram com INSERT ... ON CONFLICT (ver core/turns.py)
+        Index('ix_usuarios_conversa', 'project', 'phone', 'protocol', unique=True),
+        # Paginação por keyset da API de admin (project, id > cursor), sem tocar no JSONB
+        Index('ix_usuarios_project_id', 'project', 'id'),
+        # Só as conversas em turno ou presas: listar e liberar leases não varre as ociosas
+        Index('ix_usuarios_processing', 'project', 'id', postgresql_where=text('processing')),
+        # Exportação por período de atividade
+        Index('ix_usuarios_project_updated', 'project', 'updated_at'),
+    )
@@ -1,6 +1,7 @@
+from datetime import datetime
 from typing import Optional
 from typing import List , Dict, Any
-from typing import Annotated, Sequence, TypedDict
+from typing import Annotated, Literal, Sequence, TypedDict
 
 from langchain_core.messages import BaseMessage, AIMessage, HumanMessage
 from langgraph.graph.message import add_messages
@@ -36,15 +37,87 @@ class ToolCallRequestSchema(BaseModel):
     tool_calls: List[ToolCallSchema]
     webhook_url: str
     contact: Contact
+    idempotency_key: Optional[str] = None
+    priority: Optional[int] = None
 
 class MessageResponseSchema(BaseModel):
-    data: str
+    data: Optional[str] = None
+    job_id: Optional[str] = None
+    status: Optional[str] = None
     contact: Contact
 
+class JobStatusSchema(BaseModel):
+    job_id: str
+    status: str
+    data: Optional[str] = None
+    error: Optional[str] = None
+
 class MessageRequestSchema(BaseModel):
     message: str
     webhook_url: str
     contact: Contact
+    # Opcionais: deduplicação de reentregas do webhook de origem
+    idempotency_key: Optional[str] = None
+    timestamp: Optional[str] = None
+    # Opcional: prioridade do turno na fila (0..PRIORITY_MAX); sem ela vale o padrão do projeto
+    priority: Optional[int] = None
+
+class BatchMessageRequestSchema(BaseModel):
+    items: List[MessageRequestSchema]
+    # True: executa os turnos na própria requisição e devolve as respostas; False: devolve os job ids
+    wait: bool = False
+
+class BatchItemResponseSchema(BaseModel):
+    index: int
+    data: Optional[str] = None
+    job_id: Optional[str] = None
+    status: Optional[str] = None
+    error: Optional[str] = None
+    contact: Optional[Contact] = None
+
+class BatchMessageResponseSchema(BaseModel):
+    results: List[BatchItemResponseSchema]
+
+class ConversationSummarySchema(BaseModel):
+    id: int
+    project: str
+    protocol: str
+    phone: str
+    nome: Optional[str] = None
+    # running, stuck ou idle (ver core/admin.py)
+    state: str
+    processing: Optional[bool] = None
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    # Só com include_messages=true
+    messages: Optional[List[Dict[str, Any]]] = None
+
+class ConversationPageSchema(BaseModel):
+    items: List[ConversationSummarySchema]
+    # Passar como "after" para a próxima página; None na última
+    next_cursor: Optional[int] = None
+
+class LeaseReleaseRequestSchema(BaseModel):
+    ids: Optional[List[int]] = None
+    project: Optional[str] = None
+    # True também libera leases vigentes (o turno em execução perde o direito de gravar o histórico)
+    force: bool = False
+
+class LeaseReleaseResponseSchema(BaseModel):
+    released: List[int]
+
+class ImportedMessageSchema(BaseModel):
+    # Mesmos campos de MessageRequestSchema, mais o autor: "human" (contato) ou "ai" (resposta do bot)
+    message: str
+    timestamp: Optional[str] = None
+    role: Literal["human", "ai"] = "human"
+
+# Uma conversa histórica: uma linha do NDJSON de importar_conversas.py
+class ConversationImportSchema(BaseModel):
+    contact: Contact
+    messages: List[ImportedMessageSchema]
 
 class UsuarioSchema(BaseModel):
     id: int
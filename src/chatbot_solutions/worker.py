@@ -0,0 +1,57 @@
+"""
+Worker da fila durável de turnos (TURN_QUEUE=postgres):
+
+    cd src/chatbot_solutions
+    python worker.py [--concurrency N]
+
+A API só grava as mensagens e enfileira o turno em pending_turns; os grafos rodam aqui.
+Pode haver quantos processos e nós forem necessários, todos usando o mesmo Postgres.
+SIGTERM/SIGINT param de reservar turnos e esperam os em execução (DRAIN_TIMEOUT_SECONDS).
+"""
+# Primeiro import: com IMPORT_PROFILE=1 mede o tempo de import de todo o resto
+from core.import_profile import import_profiler
+
+import argparse
+import asyncio
+import logging
+import signal
+
+from core.checkpoints import checkpoints
+from core.configs import settings
+from core.contract_service import contract_service
+from core.graph_registry import graph_registry
+from core.turn_worker import build_worker
+from core.warmup import warmup
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+
+
+async def main(concurrency: int) -> None:
+    import_profiler.log_report("Imports até o startup do worker")
+    await graph_registry.apreload(settings.GRAPH_PRELOAD)
+    await checkpoints.start()
+    if settings.WARMUP_ENABLED:
+        await warmup.run()
+
+    worker = build_worker(concurrency)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        await checkpoints.aclose()
+        await contract_service.aclose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Executa os turnos da fila durável (pending_turns).')
+    parser.add_argument('--concurrency', type=int, default=settings.TURN_WORKER_CONCURRENCY,
+                        help='Turnos simultâneos neste processo')
+    args = parser.parse_args()
+
+    asyncio.run(main(args.concurrency))